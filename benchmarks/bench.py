@@ -0,0 +1,545 @@
+"""Benchmarks of the asset build, the waterfall engine and the export paths
+
+Run from the repository root
+
+    python -m benchmarks.bench                      # full suite
+    python -m benchmarks.bench --quick              # fewer sizes and repeats
+    python -m benchmarks.bench --compare benchmarks/results/<commit>.json
+
+Every run times each stage and saves the timings with the commit they were
+measured on, so runs on different commits can be compared with --compare.
+The multi-process runs into shared memory are timed against workers that send
+their results back pickled, and the startup runs time fresh interpreters.
+
+Every run first checks the default deal of every available backend against
+the golden CSVs with the comparison of tests/test_golden.py, and fails before
+timing anything when they differ. Beyond that the benchmarks only measure,
+e.g. the parity of the waterfall backends is covered by tests/test_kernel.py.
+"""
+
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlow,
+    LiabilitiesCashFlowBatch,
+)
+from waterfall.liabilities.spec import SpecCashFlow, Step, Tranche, WaterfallSpec
+from waterfall.liabilities.kernel import available_backends
+from waterfall.chunked import ChunkedRunner, MetricsSink, scenario_bytes
+from waterfall.service import LocalClient, PricingService
+from waterfall.reforecast import Checkpoint
+from waterfall.portfolio import Deal, PortfolioRunner
+from waterfall.shared import BLOCKS, run_shared
+from tests import test_golden
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+
+MATURITIES = (60, 360, 720)
+SCENARIO_COUNTS = (1, 10, 100, 1_000, 10_000)
+TRANCHE_COUNTS = (2, 6)
+# chunk sizes of the memory bounded runs, as a number of scenarios
+CHUNK_SIZES = (100, 1_000)
+# number of deals of the portfolio runs
+PORTFOLIO_SIZES = (100, 1_000)
+# worker processes of the shared memory runs
+SHARED_WORKERS = 4
+# startup benchmark -> program run in a fresh interpreter
+STARTUP = {
+    "startup_interpreter": "pass",
+    "startup_import": "import waterfall.liabilities.liabilities, waterfall.analytics",
+    "startup_build": (
+        "from waterfall.input import PoolInfo\n"
+        "from waterfall.asset.asset import AssetCashFlow\n"
+        "from waterfall.liabilities.liabilities import LiabilitiesCashFlow\n"
+        "from waterfall.analytics import waterfall_analytics\n"
+        "acf = AssetCashFlow(PoolInfo())\n"
+        "acf.build_asset_side_cashflow()\n"
+        "lcf = LiabilitiesCashFlow(acf)\n"
+        "lcf.build_waterfall_engine()\n"
+        "waterfall_analytics(lcf)"
+    ),
+    "startup_build_df": (
+        "from waterfall.input import PoolInfo\n"
+        "from waterfall.asset.asset import AssetCashFlow\n"
+        "from waterfall.liabilities.liabilities import LiabilitiesCashFlow\n"
+        "acf = AssetCashFlow(PoolInfo())\n"
+        "acf.build_asset_side_cashflow()\n"
+        "lcf = LiabilitiesCashFlow(acf)\n"
+        "lcf.build_waterfall_engine()\n"
+        "lcf.build_waterfall_df()"
+    ),
+}
+
+
+def timed(function: Callable[[], object], repeat: int) -> dict[str, float]:
+    """median and best wall time of repeat calls of function, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"median": statistics.median(times), "best": min(times), "repeat": repeat}
+
+
+def build_default_deal(pool_info: PoolInfo | None = None, backend: str | None = None):
+    acf = AssetCashFlow(PoolInfo() if pool_info is None else pool_info)
+    acf.build_asset_side_cashflow()
+    lcf = LiabilitiesCashFlow(acf, backend=backend)
+    lcf.build_waterfall_engine()
+    lcf.build_waterfall_df()
+    return acf, lcf
+
+
+def bench_stages(maturity: int, repeat: int) -> list[dict]:
+    """time of every stage of one deal run over maturity periods"""
+    pool_info = replace(PoolInfo(), maturity=maturity)
+    acf, lcf = build_default_deal(pool_info)
+    stages = {
+        "build_asset_side_cashflow": lambda: AssetCashFlow(
+            pool_info
+        ).build_asset_side_cashflow(),
+        "build_waterfall_engine": lcf.build_waterfall_engine,
+        "build_waterfall_df": lcf.build_waterfall_df,
+    }
+    results = [
+        {"name": name, "maturity": maturity, **timed(stage, repeat)}
+        for name, stage in stages.items()
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+
+        def export():
+            _asset_export(acf).to_csv(directory / "asset.csv")
+            lcf.loan_info.round(3).to_csv(directory / "loan_info.csv")
+            lcf.waterfall.round(3).to_csv(directory / "pro-rata-liabilities.csv")
+
+        results.append(
+            {"name": "csv_export", "maturity": maturity, **timed(export, repeat)}
+        )
+    return results
+
+
+def bench_scenarios(n_scenarios: int, maturity: int, repeat: int) -> list[dict]:
+    """time of the batched asset build and waterfall engine over n_scenarios"""
+    rng = np.random.default_rng(0)
+    batch = PoolInfoBatch.from_table(
+        {
+            "wac": rng.uniform(0.08, 0.16, n_scenarios),
+            "cumulative_default_rate": rng.uniform(0.0, 0.2, n_scenarios),
+        },
+        replace(PoolInfo(), maturity=maturity),
+    )
+    acf = AssetCashFlowBatch(batch)
+    acf.build_asset_arrays()
+    results = [
+        {
+            "name": "batch_asset_arrays",
+            "maturity": maturity,
+            "n_scenarios": n_scenarios,
+            **timed(acf.build_asset_arrays, repeat),
+        }
+    ]
+    for backend in available_backends():
+        lcf = LiabilitiesCashFlowBatch(acf, backend=backend)
+        # the first call compiles the jit backend
+        lcf.build_waterfall_engine()
+        results.append(
+            {
+                "name": "batch_waterfall_engine",
+                "maturity": maturity,
+                "n_scenarios": n_scenarios,
+                "backend": backend,
+                **timed(lcf.build_waterfall_engine, repeat),
+            }
+        )
+    return results
+
+
+def bench_reforecast(maturity: int, repeat: int) -> list[dict]:
+    """time of projecting a deal from checkpoints against building it from t = 0"""
+    pool_info = replace(PoolInfo(), maturity=maturity)
+    periods = (maturity // 2, maturity - maturity // 6)
+    results = []
+    for backend in available_backends():
+        acf = AssetCashFlow(pool_info)
+        acf.build_asset_arrays()
+        lcf = LiabilitiesCashFlow(acf, backend=backend)
+        lcf.build_waterfall_engine()
+
+        def build():
+            acf = AssetCashFlow(pool_info)
+            acf.build_asset_arrays()
+            LiabilitiesCashFlow(acf, backend=backend).build_waterfall_engine()
+
+        results.append(
+            {
+                "name": "reforecast_full",
+                "maturity": maturity,
+                "backend": backend,
+                **timed(build, repeat),
+            }
+        )
+        for period in periods:
+            checkpoint = Checkpoint.from_run(lcf, period)
+            results.append(
+                {
+                    "name": f"reforecast_from_{period}",
+                    "maturity": maturity,
+                    "backend": backend,
+                    **timed(lambda: checkpoint.project(backend=backend), repeat),
+                }
+            )
+    return results
+
+
+def bench_portfolio(n_deals: int, repeat: int) -> list[dict]:
+    """time of a portfolio of ragged maturities against building its deals one by one"""
+    rng = np.random.default_rng(0)
+    maturities = rng.choice([24, 36, 48, 60, 72, 84, 120], n_deals)
+    deals = [
+        Deal(
+            f"deal-{i}",
+            replace(
+                PoolInfo(),
+                maturity=int(maturity),
+                wam=int(min(wam, maturity)),
+                wac=float(wac),
+                cumulative_default_rate=float(cdr),
+            ),
+            np.datetime64("2022-01") + int(offset),
+        )
+        for i, (maturity, wam, wac, cdr, offset) in enumerate(
+            zip(
+                maturities,
+                rng.integers(24, 84, n_deals),
+                rng.uniform(0.08, 0.16, n_deals),
+                rng.uniform(0.0, 0.2, n_deals),
+                rng.integers(0, 48, n_deals),
+            )
+        )
+    ]
+    results = []
+    for backend in available_backends():
+        runner = PortfolioRunner(backend=backend)
+
+        def serial():
+            for deal in deals:
+                acf = AssetCashFlow(deal.pool_info)
+                acf.build_asset_arrays()
+                LiabilitiesCashFlow(acf, backend=backend).build_waterfall_engine()
+
+        results += [
+            {
+                "name": "portfolio",
+                "n_scenarios": n_deals,
+                "backend": backend,
+                "buckets": len(runner.buckets(deals)),
+                **timed(lambda: runner.run(deals), repeat),
+            },
+            {
+                "name": "portfolio_serial",
+                "n_scenarios": n_deals,
+                "backend": backend,
+                **timed(serial, repeat),
+            },
+        ]
+    return results
+
+
+def bench_tranches(n_tranches: int, n_scenarios: int, repeat: int) -> list[dict]:
+    """time of the compiled spec engine on a sequential n_tranches deal"""
+    batch = PoolInfoBatch.from_table(
+        {"cumulative_default_rate": np.linspace(0.0, 0.2, n_scenarios)}
+    )
+    acf = AssetCashFlowBatch(batch)
+    acf.build_asset_arrays()
+    names = [f"Class {chr(ord('A') + k)}" for k in range(n_tranches)]
+    balance = 0.95 * PoolInfo().init_pool_balance / n_tranches
+    spec = WaterfallSpec(
+        tuple(Tranche(name, balance, 0.03 + 0.01 * k) for k, name in enumerate(names)),
+        (
+            Step("fee"),
+            *(Step("interest", (name,)) for name in names),
+            Step("sequential", tuple(names)),
+            Step("reserve"),
+        ),
+        reserve_target=0.005,
+    )
+    engine = SpecCashFlow(acf, spec.compile())
+    return [
+        {
+            "name": "spec_waterfall_engine",
+            "maturity": batch.maturity,
+            "n_scenarios": n_scenarios,
+            "n_tranches": n_tranches,
+            **timed(engine.build_waterfall_engine, repeat),
+        }
+    ]
+
+
+def bench_chunked(n_scenarios: int, chunk_size: int, repeat: int) -> list[dict]:
+    """time of a memory bounded run collecting the tranche metrics"""
+    table = {"cumulative_default_rate": np.linspace(0.0, 0.2, n_scenarios)}
+    maturity = PoolInfo().maturity
+    extra_rows = MetricsSink(n_scenarios).scenario_rows
+    runner = ChunkedRunner(
+        memory_budget=chunk_size * scenario_bytes(maturity, extra_rows)
+    )
+    return [
+        {
+            "name": f"chunked_{chunk_size}",
+            "maturity": maturity,
+            "n_scenarios": n_scenarios,
+            **timed(lambda: runner.run(table, [MetricsSink(n_scenarios)]), repeat),
+        }
+    ]
+
+
+def bench_shared(n_scenarios: int, repeat: int) -> list[dict]:
+    """time of a multi-process run into shared memory against pickled results
+
+    Both runs send the same chunks to SHARED_WORKERS processes, the pickled
+    one returns every chunk as (n, maturity + 1, n_columns) arrays of each block.
+    """
+    table = {
+        "cumulative_default_rate": np.linspace(0.0, 0.2, n_scenarios),
+        "wac": np.linspace(0.08, 0.16, n_scenarios),
+    }
+    maturity = 360
+    base = replace(PoolInfo(), maturity=maturity)
+    chunk_size = -(-n_scenarios // SHARED_WORKERS)
+
+    def shared():
+        run_shared(table, base, chunk_size, SHARED_WORKERS).close()
+
+    def pickled():
+        tasks = [
+            (
+                {
+                    name: column[start : start + chunk_size]
+                    for name, column in table.items()
+                },
+                base,
+            )
+            for start in range(0, n_scenarios, chunk_size)
+        ]
+        with ProcessPoolExecutor(SHARED_WORKERS) as executor:
+            return list(executor.map(_pickled_chunk, tasks))
+
+    return [
+        {
+            "name": name,
+            "maturity": maturity,
+            "n_scenarios": n_scenarios,
+            "workers": SHARED_WORKERS,
+            **timed(function, repeat),
+        }
+        for name, function in (("shared", shared), ("shared_pickled", pickled))
+    ]
+
+
+def bench_service(n_requests: int, n_deals: int) -> list[dict]:
+    """latency of the pricing service under n_requests concurrent requests
+
+    The requests cycle through n_deals distinct deals so repeats share a build.
+    median is the median request latency and elapsed the time of all requests.
+    """
+    rng = np.random.default_rng(0)
+    deals = [
+        {"wac": float(wac), "cumulative_default_rate": float(cdr)}
+        for wac, cdr in zip(
+            rng.uniform(0.08, 0.16, n_deals), rng.uniform(0.0, 0.2, n_deals)
+        )
+    ]
+    requests = [deals[i % n_deals] for i in range(n_requests)]
+
+    async def serve():
+        async with PricingService() as service:
+            client = LocalClient(service)
+            start = time.perf_counter()
+            quotes = await client.price_many(requests)
+            return quotes, time.perf_counter() - start, await client.stats()
+
+    _, elapsed, stats = asyncio.run(serve())
+    return [
+        {
+            "name": "pricing_service",
+            "maturity": PoolInfo().maturity,
+            "n_scenarios": n_requests,
+            "median": stats["latency_p50"],
+            "elapsed": elapsed,
+            **{k: v for k, v in stats.items() if k.startswith("latency")},
+            "batches": stats["batches"],
+            "cache_hits": stats["cache_hits"],
+        }
+    ]
+
+
+def bench_startup(repeat: int) -> list[dict]:
+    """wall time of every STARTUP program in a fresh interpreter"""
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+
+    def python(code: str) -> str:
+        return subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+    results = []
+    for name, code in STARTUP.items():
+        results.append(
+            {
+                "name": name,
+                "maturity": PoolInfo().maturity,
+                **timed(lambda: python(code), repeat),
+            }
+        )
+    return results
+
+
+def check_golden() -> list[str]:
+    """Checks every available backend against the golden CSVs
+
+    Returns
+    -------
+    list[str]
+        the backends checked, AssertionError is raised on the first mismatch
+    """
+    backends = available_backends()
+    for backend in backends:
+        deal = test_golden.build_default_deal(backend)
+        for name in test_golden.GOLDEN:
+            test_golden.assert_matches_golden(name, *deal)
+    return list(backends)
+
+
+def run(quick: bool = False) -> dict:
+    golden = check_golden()
+    repeat = 3 if quick else 10
+    maturities = MATURITIES[:2] if quick else MATURITIES
+    counts = SCENARIO_COUNTS[:4] if quick else SCENARIO_COUNTS
+    results = []
+    for maturity in maturities:
+        results += bench_stages(maturity, repeat)
+    for n_scenarios in counts:
+        results += bench_scenarios(n_scenarios, 60, repeat)
+    for n_tranches in TRANCHE_COUNTS:
+        for n_scenarios in (1, 1_000):
+            results += bench_tranches(n_tranches, n_scenarios, repeat)
+    for maturity in maturities:
+        results += bench_reforecast(maturity, repeat)
+    for n_deals in PORTFOLIO_SIZES[:1] if quick else PORTFOLIO_SIZES:
+        results += bench_portfolio(n_deals, repeat)
+    for chunk_size in CHUNK_SIZES:
+        results += bench_chunked(counts[-1], chunk_size, repeat)
+    results += bench_shared(counts[-1], repeat)
+    results += bench_service(counts[-1], counts[-1] // 4)
+    results += bench_startup(repeat)
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "golden": golden,
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> pd.DataFrame:
+    """median time of every benchmark in both runs and their ratio"""
+    keys = ("name", "maturity", "n_scenarios", "n_tranches", "backend")
+    frames = [
+        pd.DataFrame(run["results"]).reindex(columns=[*keys, "median"])
+        for run in (baseline, current)
+    ]
+    table = frames[0].merge(frames[1], on=list(keys), suffixes=(" Before", " After"))
+    table["Ratio"] = table["median After"] / table["median Before"]
+    table["Regression"] = table["Ratio"] > threshold
+    return table
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="fewer sizes and repeats")
+    parser.add_argument(
+        "--output", type=Path, help="results file, by commit by default"
+    )
+    parser.add_argument("--compare", type=Path, help="results file of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown ratio reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    current = run(args.quick)
+    output = args.output or RESULTS / f"{current['commit'][:12] or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(current, indent=2))
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(pd.DataFrame(current["results"]).to_string(index=False))
+        print(f"results written to {output}")
+        if args.compare is None:
+            return 0
+        table = compare(current, json.loads(args.compare.read_text()), args.threshold)
+        print(table.to_string(index=False))
+    return 1 if table["Regression"].any() else 0
+
+
+def _asset_export(acf: AssetCashFlow) -> pd.DataFrame:
+    asset = acf.asset.round(3)
+    asset.index.name = "t"
+    return asset
+
+
+def _pickled_chunk(task: tuple) -> dict[str, np.ndarray]:
+    """the blocks of one chunk, sent back to the parent pickled"""
+    table, base = task
+    acf = AssetCashFlowBatch(PoolInfoBatch.from_table(table, base))
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlowBatch(acf)
+    lcf.build_waterfall_engine()
+    return {
+        block: np.moveaxis(buffer[: len(BLOCKS[block])], 0, -1).copy()
+        for block, buffer in (("asset", acf.buffer), ("waterfall", lcf.buffer))
+    }
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+from waterfall.input import PoolInfo
+from waterfall.asset import cache
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.asset.cache import AssetCache
+from dataclasses import replace
+import numpy as np
+import pytest
+
+POOLS = [replace(PoolInfo(), wac=0.08 + 0.01 * i) for i in range(3)]
+
+
+def _built(pool_info: PoolInfo) -> np.ndarray:
+    acf = AssetCashFlow(pool_info)
+    acf.build_asset_arrays()
+    return acf.buffer
+
+
+def test_entries_are_evicted_least_recently_used_first():
+    assets = AssetCache(maxsize=2)
+    for pool_info in (POOLS[0], POOLS[1], POOLS[0], POOLS[2], POOLS[0], POOLS[1]):
+        np.testing.assert_array_equal(assets.get(pool_info).buffer, _built(pool_info))
+    # POOLS[1] was evicted by POOLS[2], POOLS[0] was kept as it was used since
+    assert assets.stats["size"] == 2
+    assert (assets.hits, assets.disk_hits, assets.misses) == (2, 0, 4)
+    assert assets.stats["hit_rate"] == 2 / 6
+    assets.clear()
+    assert assets.stats == {
+        "hits": 0,
+        "disk_hits": 0,
+        "misses": 0,
+        "size": 0,
+        "hit_rate": 0.0,
+    }
+
+
+def test_liability_fields_share_an_entry():
+    assets = AssetCache()
+    first = assets.get(POOLS[0])
+    second = assets.get(replace(POOLS[0], class_b_interest=0.1))
+    assert second.buffer is first.buffer
+    assert second.pool_info.class_b_interest == 0.1
+    assert assets.hits == 1 and assets.misses == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    AssetCache(directory=tmp_path).get(POOLS[0])
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+    restarted = AssetCache(directory=tmp_path)
+    acf = restarted.get(POOLS[0])
+    np.testing.assert_array_equal(acf.buffer, _built(POOLS[0]))
+    assert (restarted.hits, restarted.disk_hits, restarted.misses) == (0, 1, 0)
+    restarted.get(POOLS[0])
+    assert restarted.hits == 1
+
+
+def test_disk_entries_of_another_engine_version_are_not_read(tmp_path, monkeypatch):
+    AssetCache(directory=tmp_path).get(POOLS[0])
+    monkeypatch.setattr(cache, "engine_version", lambda: "another engine")
+    assets = AssetCache(directory=tmp_path)
+    assets.get(POOLS[0])
+    assert (assets.disk_hits, assets.misses) == (0, 1)
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+def test_cached_buffers_cannot_be_rebuilt():
+    acf = AssetCache().get(POOLS[0])
+    for rebuild in (acf.build_asset_side_cashflow, acf.reset):
+        with pytest.raises(ValueError, match="read only"):
+            rebuild()
+    with pytest.raises(ValueError, match="read only"):
+        acf.seed(1, acf.buffer[:, :2])
+    copy = AssetCashFlow(acf.pool_info, buffer=acf.buffer.copy())
+    copy.build_asset_side_cashflow()
@@ -0,0 +1,117 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.liabilities.spec import SpecCashFlow, Trigger, WaterfallSpec
+from waterfall.analytics import TrancheMetrics, analytics_frame, spec_analytics
+from waterfall.chunked import (
+    AggregatorSink,
+    ChunkedRunner,
+    MetricsSink,
+    scenario_bytes,
+    spec_rows,
+    write_chunked,
+)
+from waterfall.results import RESULT_TABLES, write_results
+from dataclasses import fields, replace
+import numpy as np
+import pandas as pd
+import pytest
+
+N_SCENARIOS = 250
+CHUNK_SIZE = 40
+MATURITY = 60
+
+
+@pytest.fixture(scope="module")
+def table() -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(0)
+    return {
+        "cumulative_default_rate": rng.uniform(0.0, 0.2, N_SCENARIOS),
+        "wac": rng.uniform(0.08, 0.16, N_SCENARIOS),
+    }
+
+
+def _batch(table: dict, base: PoolInfo) -> LiabilitiesCashFlowBatch:
+    acf = AssetCashFlowBatch(PoolInfoBatch.from_table(table, base))
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlowBatch(acf)
+    lcf.build_waterfall_engine()
+    return lcf
+
+
+def _metrics(lcf: LiabilitiesCashFlowBatch, spec: WaterfallSpec) -> dict:
+    cf = SpecCashFlow(lcf.asset_cf, spec.compile())
+    cf.build_waterfall_engine()
+    return spec_analytics(cf)
+
+
+def test_chunked_metrics_match_one_unchunked_batch(table):
+    base = replace(PoolInfo(), maturity=MATURITY)
+    sink = MetricsSink(N_SCENARIOS)
+    budget = CHUNK_SIZE * scenario_bytes(MATURITY, sink.scenario_rows)
+    runner = ChunkedRunner(base, budget)
+    assert len(list(runner.chunks(table, sink.scenario_rows))) == -(
+        -N_SCENARIOS // CHUNK_SIZE
+    )
+    assert runner.run(table, [sink]) == N_SCENARIOS
+    spec = WaterfallSpec.from_pool_info(base)
+    expected = analytics_frame(_metrics(_batch(table, base), spec))
+    pd.testing.assert_frame_equal(sink.frame(), expected)
+    # the class A notes amortize on the spec engine
+    assert (sink.metrics["Class A"].loss < 1e-6).all()
+
+
+def test_spec_sinks_count_against_the_memory_budget(table, monkeypatch):
+    spec = replace(
+        WaterfallSpec.from_pool_info(PoolInfo()),
+        triggers=(Trigger("cnl", "cumulative_loss", 0.1),),
+    )
+    sinks = [MetricsSink(N_SCENARIOS, spec=spec), AggregatorSink(np.linspace(0, 5, 61))]
+    assert sinks[0].scenario_rows == spec_rows(spec.compile()) == 8 + 5 * 2 + 1 + 2
+    assert sinks[1].scenario_rows == 0
+    runner = ChunkedRunner(memory_budget=CHUNK_SIZE * scenario_bytes(MATURITY))
+    sizes = []
+    monkeypatch.setattr(
+        MetricsSink, "__call__", lambda sink, lcf, rows: sizes.append(len(rows))
+    )
+    runner.run(table, sinks)
+    expected = runner.memory_budget // scenario_bytes(MATURITY, sinks[0].scenario_rows)
+    assert max(sizes) == expected < CHUNK_SIZE
+
+
+def test_metrics_sink_needs_a_spec_for_varying_notes(table):
+    varying = {**table, "class_b_interest": np.linspace(0.05, 0.07, N_SCENARIOS)}
+    with pytest.raises(ValueError, match="give MetricsSink a spec"):
+        ChunkedRunner().run(varying, [MetricsSink(N_SCENARIOS)])
+
+
+def test_mixed_maturities_land_in_their_table_rows(table):
+    maturities = np.where(np.arange(N_SCENARIOS) % 3, MATURITY, 2 * MATURITY)
+    sink = MetricsSink(N_SCENARIOS)
+    runner = ChunkedRunner(
+        memory_budget=CHUNK_SIZE * scenario_bytes(2 * MATURITY, sink.scenario_rows)
+    )
+    runner.run({**table, "maturity": maturities}, [sink])
+    for maturity in (MATURITY, 2 * MATURITY):
+        rows = np.flatnonzero(maturities == maturity)
+        lcf = _batch(
+            {name: column[rows] for name, column in table.items()},
+            replace(PoolInfo(), maturity=maturity),
+        )
+        spec = WaterfallSpec.from_pool_info(PoolInfo())
+        for name, metrics in _metrics(lcf, spec).items():
+            for f in fields(TrancheMetrics):
+                np.testing.assert_array_equal(
+                    getattr(sink.metrics[name], f.name)[rows], getattr(metrics, f.name)
+                )
+
+
+def test_write_chunked_matches_the_written_batch(table, tmp_path):
+    base = replace(PoolInfo(), maturity=MATURITY)
+    chunked = write_chunked(
+        table, tmp_path / "chunked", base, CHUNK_SIZE * scenario_bytes(MATURITY)
+    )
+    batch = write_results(tmp_path / "batch", _batch(table, base))
+    assert chunked.complete
+    for name in RESULT_TABLES:
+        pd.testing.assert_frame_equal(chunked.frame(name), batch.frame(name))
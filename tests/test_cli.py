@@ -0,0 +1,51 @@
+from waterfall.input import PoolInfo
+from waterfall.cli import iter_shards, main, run_batch
+from dataclasses import replace
+import numpy as np
+import pandas as pd
+import pytest
+
+BASE = replace(PoolInfo(), maturity=36)
+
+
+@pytest.fixture
+def scenarios() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "cumulative_default_rate": np.linspace(0.0, 0.2, 12),
+            "maturity": [36, 48] * 6,
+        }
+    )
+
+
+def test_rerun_skips_the_finished_shards(scenarios, tmp_path):
+    first = run_batch(scenarios, tmp_path, BASE, chunk_size=4, max_workers=1)
+    assert first["scenarios"] == len(scenarios) and first["skipped"] == 0
+    second = run_batch(scenarios, tmp_path, BASE, chunk_size=4, max_workers=1)
+    assert second["scenarios"] == 0 and second["skipped"] == len(scenarios)
+    rows = np.concatenate([rows for rows, _ in iter_shards(tmp_path)])
+    assert sorted(rows) == list(range(len(scenarios)))
+
+
+def test_resuming_with_changed_scenarios_is_refused(scenarios, tmp_path):
+    run_batch(scenarios, tmp_path, BASE, chunk_size=4, max_workers=1)
+    changed = scenarios.copy()
+    changed.loc[3, "cumulative_default_rate"] = 0.5
+    with pytest.raises(ValueError, match="other scenarios"):
+        run_batch(changed, tmp_path, BASE, chunk_size=4, max_workers=1)
+    with pytest.raises(ValueError, match="other scenarios"):
+        run_batch(scenarios[::-1], tmp_path, BASE, chunk_size=4, max_workers=1)
+    with pytest.raises(ValueError, match="other settings"):
+        run_batch(scenarios, tmp_path, BASE, chunk_size=6, max_workers=1)
+
+
+def test_command_line_resumes_from_the_same_file(scenarios, tmp_path, capsys):
+    path = tmp_path / "scenarios.csv"
+    scenarios.to_csv(path, index=False)
+    argv = [str(path), str(tmp_path / "results"), "--workers", "1"]
+    assert main(argv) == 0
+    assert main(argv) == 0
+    assert f"skipped {len(scenarios)} already finished" in capsys.readouterr().out
+    scenarios.assign(cumulative_default_rate=0.3).to_csv(path, index=False)
+    with pytest.raises(SystemExit):
+        main(argv)
@@ -0,0 +1,79 @@
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.liabilities.liabilities import LiabilitiesCashFlow
+from io import StringIO
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKENDS = ("numpy", "numba")
+TOLERANCE = 1e-3
+
+
+def _asset(acf, lcf) -> pd.DataFrame:
+    asset = acf.asset.round(3)
+    asset.index.name = "t"
+    return asset
+
+
+# golden file written by waterfall.liabilities.liabilities.main -> frame of
+# the default deal it holds
+GOLDEN = {
+    "asset.csv": _asset,
+    "loan_info.csv": lambda acf, lcf: lcf.loan_info.round(3),
+    "pro-rata-liabilities.csv": lambda acf, lcf: lcf.waterfall.round(3),
+}
+
+
+def build_default_deal(backend: str) -> tuple[AssetCashFlow, LiabilitiesCashFlow]:
+    """the default deal built on backend, as written to the golden CSVs"""
+    acf = AssetCashFlow(PoolInfo())
+    acf.build_asset_side_cashflow()
+    lcf = LiabilitiesCashFlow(acf, backend=backend)
+    lcf.build_waterfall_engine()
+    lcf.build_waterfall_df()
+    return acf, lcf
+
+
+def assert_matches_golden(
+    name: str, acf: AssetCashFlow, lcf: LiabilitiesCashFlow, tolerance=TOLERANCE
+):
+    """Raises AssertionError when the frame of name differs from its golden CSV
+
+    Labels and empty cells must match exactly, numbers within tolerance.
+    benchmarks.bench runs the same check before timing anything.
+    """
+    text = StringIO()
+    GOLDEN[name](acf, lcf).to_csv(text)
+    text.seek(0)
+    expected, actual = _cells(ROOT / name), _cells(text)
+    assert expected.shape == actual.shape, f"{name} has shape {actual.shape}"
+    a = expected.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    b = actual.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=name)
+    labels = np.isnan(a)
+    np.testing.assert_array_equal(
+        expected.to_numpy()[labels], actual.to_numpy()[labels], err_msg=name
+    )
+    difference = np.abs(a - b).max(initial=0.0, where=~labels)
+    assert (
+        difference <= tolerance
+    ), f"{name} differs from its golden CSV by {difference}"
+
+
+def _cells(text: Path | StringIO) -> pd.DataFrame:
+    return pd.read_csv(text, header=None, dtype=str, keep_default_na=False)
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def default_deal(request):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    return build_default_deal(request.param)
+
+
+@pytest.mark.parametrize("name", GOLDEN)
+def test_default_deal_matches_the_golden_csv(default_deal, name):
+    assert_matches_golden(name, *default_deal)
@@ -0,0 +1,50 @@
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.liabilities.liabilities import LiabilitiesCashFlow
+from waterfall.ingest import ingest_tape
+from waterfall.reforecast import Checkpoint
+from dataclasses import fields
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def tape(tmp_path) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = 1_000
+    frame = pd.DataFrame(
+        {
+            "balance": rng.uniform(1_000.0, 20_000.0, n),
+            "coupon": rng.uniform(0.05, 0.2, n),
+            "remaining_term": rng.integers(1, 72, n).astype(float),
+            "seasoning": rng.integers(0, 24, n).astype(float),
+        }
+    )
+    frame.loc[:9, "balance"] = 0.0
+    frame.to_csv(tmp_path / "tape.csv", index=False)
+    np.save(tmp_path / "tape.npy", frame.to_records(index=False))
+    return frame
+
+
+@pytest.mark.parametrize("suffix", (".csv", ".npy"))
+def test_ingested_pool_info_holds_python_scalars(tape, tmp_path, suffix):
+    pool_info = ingest_tape(tmp_path / f"tape{suffix}", chunk_size=300)
+    for f in fields(PoolInfo):
+        assert type(getattr(pool_info, f.name)) in (int, float), f.name
+    live = tape[tape["balance"] > 0]
+    assert pool_info.num_loans == len(live)
+    assert pool_info.wac == pytest.approx(
+        np.average(live["coupon"], weights=live["balance"])
+    )
+    assert pool_info.maturity == int(live["remaining_term"].max())
+
+
+def test_checkpoint_of_an_ingested_deal_saves(tape, tmp_path):
+    acf = AssetCashFlow(ingest_tape(tmp_path / "tape.csv"))
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlow(acf)
+    lcf.build_waterfall_engine()
+    checkpoint = Checkpoint.from_run(lcf, 12)
+    checkpoint.save(tmp_path / "deal.npz")
+    assert Checkpoint.load(tmp_path / "deal.npz").pool_info == checkpoint.pool_info
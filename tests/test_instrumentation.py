@@ -0,0 +1,36 @@
+from waterfall import instrumentation
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.instrumentation import MemorySink, instrument
+import tracemalloc
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def stopped():
+    yield
+    instrumentation.disable()
+    tracemalloc.stop()
+
+
+def test_disable_stops_the_tracing_enable_started():
+    instrumentation.enable(MemorySink(), memory=True)
+    assert tracemalloc.is_tracing()
+    instrumentation.disable()
+    assert not tracemalloc.is_tracing()
+
+
+def test_disable_leaves_tracing_started_elsewhere_running():
+    tracemalloc.start()
+    instrumentation.enable(MemorySink(), memory=True)
+    instrumentation.disable()
+    assert tracemalloc.is_tracing()
+
+
+def test_instrumented_stages_record_their_peak_memory():
+    acf = AssetCashFlow(PoolInfo())
+    with instrument(memory=True) as sink:
+        acf.build_asset_side_cashflow()
+    assert not tracemalloc.is_tracing()
+    assert sink.records and not instrumentation.enabled()
+    assert all(record.peak_memory is not None for record in sink.records)
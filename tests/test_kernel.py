@@ -0,0 +1,71 @@
+from waterfall.input import PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlow,
+    LiabilitiesCashFlowBatch,
+)
+import numpy as np
+import pytest
+
+BACKENDS = ("numpy", "numba")
+
+
+def _backend(name: str) -> str:
+    if name == "numba":
+        pytest.importorskip("numba")
+    return name
+
+
+@pytest.fixture(scope="module")
+def acf() -> AssetCashFlowBatch:
+    rng = np.random.default_rng(0)
+    n = 200
+    batch = PoolInfoBatch.from_table(
+        {
+            "wac": rng.uniform(0.05, 0.2, n),
+            "cumulative_default_rate": rng.uniform(0.0, 0.3, n),
+            "servicing_fee": rng.uniform(0.0, 0.03, n),
+            "class_b_interest": rng.uniform(0.0, 0.1, n),
+        }
+    )
+    acf = AssetCashFlowBatch(batch)
+    acf.build_asset_arrays()
+    return acf
+
+
+def _single(acf: AssetCashFlowBatch, i: int, backend: str) -> LiabilitiesCashFlow:
+    """the i-th scenario run alone on the same asset rows"""
+    single = AssetCashFlow(acf.pool_info.scenario(i))
+    single.buffer[...] = acf.buffer[:, i]
+    lcf = LiabilitiesCashFlow(single, backend=backend)
+    lcf.build_waterfall_engine()
+    return lcf
+
+
+def test_backends_agree_on_a_batch(acf):
+    _backend("numba")
+    buffers = []
+    for backend in BACKENDS:
+        lcf = LiabilitiesCashFlowBatch(acf, backend=backend)
+        lcf.build_waterfall_engine()
+        buffers.append(lcf.buffer)
+    np.testing.assert_array_equal(*buffers)
+
+
+def test_backends_agree_on_a_single_deal(acf):
+    _backend("numba")
+    numpy, numba = (_single(acf, 7, backend).buffer for backend in BACKENDS)
+    np.testing.assert_array_equal(numpy, numba)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_single_deal_matches_its_batch_row(acf, backend):
+    lcf = LiabilitiesCashFlowBatch(acf, backend=_backend(backend))
+    lcf.build_waterfall_engine()
+    for i in (0, 31, 199):
+        np.testing.assert_array_equal(_single(acf, i, backend).buffer, lcf.buffer[:, i])
+
+
+def test_unknown_backend(acf):
+    with pytest.raises(ValueError):
+        LiabilitiesCashFlowBatch(acf, backend="fortran")
@@ -0,0 +1,20 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.liabilities.kernel import available_backends
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_batch_engine_takes_one_class_a_balance_for_every_scenario(backend):
+    acf = AssetCashFlowBatch(
+        PoolInfoBatch.from_table({"wac": np.linspace(0.08, 0.16, 4)}, PoolInfo())
+    )
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlowBatch(acf, backend=backend)
+    lcf.build_waterfall_engine()
+    expected = lcf.buffer.copy()
+    lcf.class_a_beginning_principal_balance = PoolInfo().class_a_principal_balance
+    lcf.build_waterfall_engine()
+    np.testing.assert_array_equal(lcf.buffer, expected)
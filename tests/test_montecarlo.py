@@ -0,0 +1,43 @@
+from waterfall.chunked import AggregatorSink, ChunkedRunner
+from waterfall.liabilities.spec import WaterfallSpec
+from waterfall.input import PoolInfo
+from waterfall.montecarlo import MonteCarloSimulator
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_default_simulation_measures_credit():
+    result = MonteCarloSimulator(n_paths=1_000, chunk_size=250, max_workers=1).run()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        summary = result.summary()
+    assert result.n_paths == 1_000
+    assert (summary["Expected Loss"] < 0.5).all()
+    assert (summary["WAL Undefined Paths"] == 0).all()
+    assert summary.loc["Class B", "Max Loss"] > 0
+
+
+def test_results_do_not_depend_on_the_number_of_workers():
+    summaries = [
+        MonteCarloSimulator(n_paths=600, chunk_size=200, max_workers=workers)
+        .run()
+        .summary()
+        for workers in (1, 2)
+    ]
+    pd.testing.assert_frame_equal(*summaries)
+
+
+def test_legacy_waterfall_statistics_warn():
+    table = {"cumulative_default_rate": np.linspace(0.0, 0.1, 50)}
+    legacy = AggregatorSink(np.linspace(0, 5, 61))
+    spec = AggregatorSink(
+        np.linspace(0, 5, 61), spec=WaterfallSpec.from_pool_info(PoolInfo())
+    )
+    ChunkedRunner().run(table, [legacy, spec])
+    with pytest.warns(RuntimeWarning, match="Class A"):
+        legacy.result.summary()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        spec.result.summary()
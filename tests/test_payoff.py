@@ -0,0 +1,118 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch, ASSET_ARRAYS
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlow,
+    LiabilitiesCashFlowBatch,
+)
+from waterfall.liabilities.spec import SpecCashFlow, Step, Trigger, WaterfallSpec
+from dataclasses import replace
+import numpy as np
+import pytest
+
+BACKENDS = ("numpy", "numba")
+N_SCENARIOS = 60
+MATURITY = 60
+# every deal is padded with periods without collections up to PADDED, the way
+# PortfolioRunner pads the shorter deals of a bucket
+PADDED = 120
+
+
+def _padded(base: PoolInfo) -> AssetCashFlowBatch:
+    table = {
+        "cumulative_default_rate": np.linspace(0.0, 0.2, N_SCENARIOS),
+        "wac": np.linspace(0.08, 0.16, N_SCENARIOS),
+    }
+    acf = AssetCashFlowBatch(PoolInfoBatch.from_table(table, base))
+    acf.build_asset_arrays()
+    buffer = np.zeros((len(ASSET_ARRAYS), N_SCENARIOS, PADDED + 1))
+    buffer[..., : MATURITY + 1] = acf.buffer
+    return AssetCashFlowBatch(
+        PoolInfoBatch.from_table(table, replace(base, maturity=PADDED)), buffer
+    )
+
+
+def _single(acf: AssetCashFlowBatch, i: int) -> AssetCashFlow:
+    single = AssetCashFlow(acf.pool_info.scenario(i))
+    single.buffer[...] = acf.buffer[:, i]
+    return single
+
+
+def _spec(base: PoolInfo) -> WaterfallSpec:
+    """the prospectus spec with notes the pool pays off and an OC turbo"""
+    spec = WaterfallSpec.from_pool_info(base)
+    return replace(
+        spec,
+        tranches=tuple(replace(t, balance=0.6 * t.balance) for t in spec.tranches),
+        steps=(
+            *spec.steps[:-1],
+            Step("turbo", ("Class A", "Class B"), "oc", breached=True),
+        ),
+        triggers=(Trigger("oc", "overcollateralization", 1.2, above=False),),
+        reserve_target=0.0,
+    )
+
+
+def test_pool_pays_off_where_its_collections_end():
+    acf = _padded(PoolInfo())
+    np.testing.assert_array_equal(acf.payoff_period(), MATURITY + 1)
+    assert _single(acf, 0).payoff_period() == MATURITY + 1
+    unpadded = AssetCashFlow(PoolInfo())
+    unpadded.build_asset_arrays()
+    assert unpadded.payoff_period() == MATURITY + 1
+
+
+def test_spec_engine_stops_without_changing_the_cash_flows():
+    base = PoolInfo()
+    acf = _padded(base)
+    program = _spec(base).compile()
+    full = SpecCashFlow(acf, program, payoff_tolerance=None)
+    full.build_waterfall_engine()
+    cf = SpecCashFlow(acf, program)
+    cf.build_waterfall_engine()
+    # the notes are retired soon after the pool, before the padded maturity
+    assert (cf.payoff_period < PADDED).all()
+    np.testing.assert_array_equal(cf.deal, full.deal)
+    np.testing.assert_array_equal(cf.tranches, full.tranches)
+    np.testing.assert_array_equal(cf.triggers, full.triggers)
+    # a single deal stops at the same period as its row of the batch
+    for i in (0, N_SCENARIOS - 1):
+        single = SpecCashFlow(_single(acf, i), program)
+        single.build_waterfall_engine()
+        np.testing.assert_array_equal(single.tranches[:, :, 0], cf.tranches[:, :, i])
+        assert single.payoff_period[0] == cf.payoff_period[i]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_legacy_engines_stop_without_changing_the_cash_flows(backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    # without fees, notes or reserve the legacy waterfall retires with the pool
+    base = replace(
+        PoolInfo(),
+        servicing_fee=0.0,
+        class_a_principal_balance=0.0,
+        class_b_principal_balance=0.0,
+        target_reserve_percentage=0.0,
+    )
+    acf = _padded(base)
+    full = LiabilitiesCashFlowBatch(acf, backend=backend, payoff_tolerance=None)
+    full.build_waterfall_engine()
+    lcf = LiabilitiesCashFlowBatch(acf, backend=backend)
+    lcf.build_waterfall_engine()
+    assert (lcf.payoff_period < PADDED).all()
+    np.testing.assert_array_equal(lcf.buffer, full.buffer)
+    single = LiabilitiesCashFlow(_single(acf, 0), backend=backend)
+    single.build_waterfall_engine()
+    assert single.payoff_period < PADDED
+    np.testing.assert_array_equal(single.buffer, full.buffer[:, 0])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_default_deal_runs_to_maturity(backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    acf = AssetCashFlow(PoolInfo())
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlow(acf, backend=backend)
+    lcf.build_waterfall_engine()
+    assert lcf.payoff_period == MATURITY
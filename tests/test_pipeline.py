@@ -0,0 +1,81 @@
+from waterfall.input import PoolInfo
+from waterfall.pipeline import STAGES, Pipeline, downstream
+from dataclasses import replace
+import numpy as np
+import pytest
+
+
+def _assert_rebuilt(pipeline: Pipeline):
+    full = Pipeline(pipeline.pool_info)
+    full.run()
+    np.testing.assert_array_equal(pipeline.asset_cf.buffer, full.asset_cf.buffer)
+    np.testing.assert_array_equal(
+        pipeline.liabilities_cf.buffer, full.liabilities_cf.buffer
+    )
+
+
+def test_note_balance_edit_reaches_the_engine():
+    pipeline = Pipeline(PoolInfo())
+    pipeline.run()
+    pipeline.update(class_a_principal_balance=50e6, class_b_principal_balance=4e6)
+    assert pipeline.run() == ["waterfall_engine", "waterfall_df"]
+    assert pipeline.liabilities_cf.class_a_ending_principal_balance[0] == 50e6
+    assert pipeline.liabilities_cf.class_b_ending_principal_balance[0] == 4e6
+    _assert_rebuilt(pipeline)
+    assert pipeline.pool_info == replace(
+        PoolInfo(), class_a_principal_balance=50e6, class_b_principal_balance=4e6
+    )
+
+
+def test_downstream_follows_the_stage_graph():
+    assert downstream({"class_b_interest"}) == {"waterfall_engine", "waterfall_df"}
+    assert downstream({"lgd"}) == {
+        "balance_and_recoveries",
+        "scheduled_interest_and_principal",
+        "pool_balance",
+        "current_collections",
+        "loan_info",
+        "waterfall_engine",
+        "waterfall_df",
+    }
+    assert downstream(set()) == set()
+    assert downstream(set(), {"loan_info"}) == {
+        "loan_info",
+        "waterfall_engine",
+        "waterfall_df",
+    }
+    assert downstream({"maturity"}) == {stage.name for stage in STAGES}
+
+
+def test_stages_only_read_what_earlier_stages_write():
+    written = set()
+    for stage in STAGES:
+        assert written.issuperset(stage.reads), stage.name
+        written.update(stage.writes)
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"wac": 0.12},
+        {"cumulative_default_rate": 0.15, "lgd": 0.6},
+        {"class_b_interest": 0.07},
+        {"servicing_fee": 0.02, "target_reserve_percentage": 0.02},
+        {"maturity": 48, "wam": 48},
+    ],
+)
+def test_incremental_run_equals_a_full_rebuild(changes):
+    pipeline = Pipeline(PoolInfo())
+    pipeline.run()
+    stale = pipeline.update(**changes)
+    assert pipeline.run() == [stage.name for stage in STAGES if stage.name in stale]
+    _assert_rebuilt(pipeline)
+    assert pipeline.run() == []
+
+
+def test_unchanged_and_unknown_fields():
+    pipeline = Pipeline(PoolInfo())
+    pipeline.run()
+    assert pipeline.update(wac=PoolInfo().wac) == set()
+    with pytest.raises(ValueError, match="unknown PoolInfo fields"):
+        pipeline.update(coupon=0.1)
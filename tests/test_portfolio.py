@@ -0,0 +1,84 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch, ASSET_ARRAYS
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.portfolio import Deal, PortfolioRunner
+from dataclasses import replace
+import numpy as np
+import pytest
+
+BACKENDS = ("numpy", "numba")
+N_DEALS = 40
+
+
+@pytest.fixture(scope="module")
+def deals() -> list[Deal]:
+    rng = np.random.default_rng(0)
+    maturities = rng.choice([24, 36, 48, 60, 72, 84, 120], N_DEALS)
+    return [
+        Deal(
+            f"deal-{i}",
+            replace(
+                PoolInfo(),
+                maturity=int(maturity),
+                wam=int(min(wam, maturity)),
+                wac=float(wac),
+                cumulative_default_rate=float(cdr),
+            ),
+            np.datetime64("2022-01") + int(offset),
+        )
+        for i, (maturity, wam, wac, cdr, offset) in enumerate(
+            zip(
+                maturities,
+                rng.integers(24, 84, N_DEALS),
+                rng.uniform(0.08, 0.16, N_DEALS),
+                rng.uniform(0.0, 0.2, N_DEALS),
+                rng.integers(0, 48, N_DEALS),
+            )
+        )
+    ]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_every_deal_matches_building_it_alone(deals, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    result = PortfolioRunner(backend=backend).run(deals)
+    for deal in deals:
+        acf = AssetCashFlowBatch(PoolInfoBatch.from_pool_infos([deal.pool_info]))
+        acf.build_asset_arrays()
+        lcf = LiabilitiesCashFlowBatch(acf, backend=backend)
+        lcf.build_waterfall_engine()
+        first = int((deal.first_month - result.months[0]).astype(int))
+        last = first + deal.pool_info.maturity + 1
+        values = result.deal(deal.name)
+        for k, attribute in enumerate(result.columns.values()):
+            owner = acf if attribute in ASSET_ARRAYS else lcf
+            np.testing.assert_array_equal(
+                values[k, first:last], getattr(owner, attribute)[0], attribute
+            )
+        # nothing outside the life of the deal
+        assert not values[:, :first].any() and not values[:, last:].any()
+    np.testing.assert_array_equal(result.portfolio(), result.values.sum(axis=0))
+
+
+@pytest.mark.parametrize("bucket_width", (0, 12, 48))
+def test_buckets_hold_every_deal_once_within_the_width(deals, bucket_width):
+    buckets = PortfolioRunner(bucket_width).buckets(deals)
+    positions = np.concatenate(buckets)
+    assert sorted(positions) == list(range(N_DEALS))
+    for bucket in buckets:
+        maturities = [deals[i].pool_info.maturity for i in bucket]
+        assert maturities == sorted(maturities)
+        assert maturities[-1] - maturities[0] <= bucket_width
+
+
+def test_invalid_portfolios_raise(deals):
+    runner = PortfolioRunner()
+    with pytest.raises(ValueError):
+        runner.run([])
+    with pytest.raises(ValueError):
+        runner.run([deals[0], deals[0]])
+    with pytest.raises(ValueError):
+        PortfolioRunner(columns={"Cash": "not_an_attribute"})
+    with pytest.raises(ValueError):
+        PortfolioRunner(bucket_width=-1)
@@ -0,0 +1,99 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlow, ASSET_ARRAYS
+from waterfall.liabilities.liabilities import LiabilitiesCashFlow, LIABILITY_ARRAYS
+from waterfall.reforecast import Checkpoint, Remittance
+from dataclasses import replace
+import numpy as np
+import pytest
+
+BACKENDS = ("numpy", "numba")
+POOL_INFO = replace(PoolInfo(), maturity=120)
+PERIODS = (1, 60, 100)
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def run(request) -> LiabilitiesCashFlow:
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    acf = AssetCashFlow(POOL_INFO)
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlow(acf, backend=request.param)
+    lcf.build_waterfall_engine()
+    return lcf
+
+
+def _actuals(lcf: LiabilitiesCashFlow, period: int) -> Remittance:
+    """remittance reporting every asset row of the run at period"""
+    return Remittance(
+        period,
+        {name: lcf.asset_cf.buffer[i, period] for i, name in enumerate(ASSET_ARRAYS)},
+    )
+
+
+def _assert_same_run(projection: LiabilitiesCashFlow, lcf: LiabilitiesCashFlow):
+    np.testing.assert_array_equal(projection.asset_cf.buffer, lcf.asset_cf.buffer)
+    np.testing.assert_array_equal(projection.buffer, lcf.buffer)
+
+
+@pytest.mark.parametrize("period", (0, *PERIODS))
+def test_projection_from_a_checkpoint_reproduces_the_run(run, period):
+    projection = Checkpoint.from_run(run, period).project(backend=run.backend)
+    _assert_same_run(projection, run)
+
+
+@pytest.mark.parametrize("period", PERIODS)
+def test_rolling_with_the_actuals_of_the_run_reproduces_it(run, period):
+    checkpoint = Checkpoint.from_run(run, period - 1)
+    rolled = checkpoint.roll(_actuals(run, period))
+    assert rolled.period == period
+    _assert_same_run(rolled.project(backend=run.backend), run)
+
+
+def test_saved_checkpoint_loads_back_and_projects_the_same(run, tmp_path):
+    checkpoint = Checkpoint.from_run(run, PERIODS[1])
+    checkpoint.save(tmp_path / "deal.npz")
+    loaded = Checkpoint.load(tmp_path / "deal.npz")
+    assert loaded.pool_info == checkpoint.pool_info
+    assert loaded.period == checkpoint.period
+    np.testing.assert_array_equal(loaded.asset, checkpoint.asset)
+    np.testing.assert_array_equal(loaded.liabilities, checkpoint.liabilities)
+    _assert_same_run(loaded.project(backend=run.backend), run)
+
+
+def test_roll_writes_the_reported_rows_over_the_projection(run):
+    period = PERIODS[1]
+    reported = {"recoveries": 1_234.5}
+    waterfall = {"class_a_principal_paid": 6_789.0}
+    rolled = Checkpoint.from_run(run, period - 1).roll(
+        Remittance(period, reported, waterfall)
+    )
+    assert rolled.asset[ASSET_ARRAYS.index("recoveries"), -1] == 1_234.5
+    row = LIABILITY_ARRAYS.index("class_a_principal_paid")
+    assert rolled.liabilities[row, -1] == 6_789.0
+    # earlier periods keep the run
+    np.testing.assert_array_equal(rolled.liabilities[:, :-1], run.buffer[:, :period])
+
+
+def test_stressed_batch_starts_from_the_checkpoint(run):
+    period = PERIODS[1]
+    checkpoint = Checkpoint.from_run(run, period)
+    batch = PoolInfoBatch.from_table(
+        {"cumulative_default_rate": np.array([0.1, 0.3])}, POOL_INFO
+    )
+    projection = checkpoint.project(batch, backend=run.backend)
+    for i in range(2):
+        np.testing.assert_array_equal(
+            projection.asset_cf.buffer[:, i, : period + 1], checkpoint.asset
+        )
+
+
+def test_invalid_checkpoints_and_remittances_raise(run):
+    checkpoint = Checkpoint.from_run(run, PERIODS[0])
+    with pytest.raises(ValueError):
+        checkpoint.roll(Remittance(PERIODS[0] + 2))
+    with pytest.raises(ValueError):
+        Remittance(PERIODS[0] + 1, {"not_a_row": 1.0})
+    with pytest.raises(ValueError):
+        Checkpoint.from_run(run, POOL_INFO.maturity)
+    with pytest.raises(ValueError):
+        checkpoint.project(replace(POOL_INFO, maturity=60))
@@ -0,0 +1,52 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.results import ResultStore, ResultWriter
+import numpy as np
+import pytest
+
+N_SCENARIOS = 10
+
+
+@pytest.fixture(scope="module")
+def chunk() -> LiabilitiesCashFlowBatch:
+    table = {"wac": np.linspace(0.08, 0.12, 3)}
+    acf = AssetCashFlowBatch(PoolInfoBatch.from_table(table, PoolInfo()))
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlowBatch(acf)
+    lcf.build_waterfall_engine()
+    return lcf
+
+
+def test_rows_left_unwritten_keep_the_results_incomplete(chunk, tmp_path):
+    maturity = PoolInfo().maturity
+    with ResultWriter(tmp_path, N_SCENARIOS, maturity) as writer:
+        # the last chunk arrives first, rows 3 to 6 are never written
+        assert writer.write(chunk, 7) == N_SCENARIOS
+        writer.write(chunk, 0)
+    store = ResultStore(tmp_path)
+    assert not store.complete
+    assert store.written == [(0, 3), (7, 10)]
+
+
+def test_results_are_complete_once_every_row_is_written(chunk, tmp_path):
+    maturity = PoolInfo().maturity
+    with ResultWriter(tmp_path, N_SCENARIOS, maturity) as writer:
+        for start in (7, 3, 0, 4, 1):
+            writer.write(chunk, start)
+        assert writer.written == [(0, 10)]
+    store = ResultStore(tmp_path)
+    assert store.complete
+    np.testing.assert_array_equal(
+        store.column("pool_balance")[1:4], chunk.asset_cf.pool_balance
+    )
+
+
+def test_writes_continue_after_the_last_one(chunk, tmp_path):
+    maturity = PoolInfo().maturity
+    with ResultWriter(tmp_path, 6, maturity) as writer:
+        writer.write(chunk)
+        assert writer.written == [(0, 3)] and not writer.complete
+        writer.write(chunk)
+        assert writer.complete
+    assert ResultStore(tmp_path).complete
@@ -0,0 +1,31 @@
+from waterfall.input import ASSET_FIELDS, LIABILITY_FIELDS
+from waterfall.sensitivity import DEFAULT_BUMPS, SensitivityRunner
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def report():
+    return SensitivityRunner(max_workers=1).run()
+
+
+def test_default_bumps_cover_the_numeric_drivers():
+    assert set(DEFAULT_BUMPS) <= set(ASSET_FIELDS) | set(LIABILITY_FIELDS)
+    for name in (
+        "loss_curve_timing",
+        "loss_curve_steepness",
+        "init_balance_per_loan",
+        "class_a_principal_balance",
+        "class_b_principal_balance",
+    ):
+        assert name in DEFAULT_BUMPS
+
+
+def test_report_moves_with_the_bumps(report):
+    assert not report[["Base", "Up", "Down"]].isna().any().any()
+    yields = report.xs("Yield", level="metric")["Delta"]
+    assert yields["class_a_interest", "Class A"] == pytest.approx(1.0)
+    assert yields["class_b_interest", "Class B"] == pytest.approx(1.0)
+    wal = report.xs("WAL", level="metric")["Delta"]
+    for name in ("wac", "cumulative_default_rate", "class_a_principal_balance"):
+        assert np.abs(wal[name]).max() > 0
@@ -0,0 +1,104 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall import service
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.spec import SpecCashFlow, WaterfallSpec
+from waterfall.analytics import spec_analytics
+from waterfall.service import LocalClient, PricingService, price_batch
+import asyncio
+import json
+import pytest
+
+DEALS = [{"wac": 0.08 + 0.01 * i} for i in range(6)]
+
+
+def _same(quote: dict, deal: dict) -> bool:
+    return quote["metrics"] == price_batch([PoolInfo(**deal)])[0]
+
+
+def test_deals_are_priced_on_the_spec_engine():
+    deals = [PoolInfo(**deal) for deal in DEALS] + [
+        PoolInfo(class_a_principal_balance=50e6)
+    ]
+    metrics = price_batch(deals)
+    for pool_info, quote in zip(deals, metrics):
+        acf = AssetCashFlowBatch(PoolInfoBatch.from_pool_infos([pool_info]))
+        acf.build_asset_arrays()
+        cf = SpecCashFlow(acf, WaterfallSpec.from_pool_info(pool_info).compile())
+        cf.build_waterfall_engine()
+        for tranche, values in spec_analytics(cf).items():
+            assert quote[tranche]["Principal Paid"] == values.principal_paid[0]
+            assert quote[tranche]["Yield"] == values.yield_[0]
+    # the class A notes amortize, unlike on the legacy engine
+    assert metrics[0]["Class A"]["Loss"] < 1e-9
+    json.dumps(metrics, allow_nan=False)
+
+
+def test_undefined_metrics_are_none():
+    metrics = price_batch([PoolInfo(class_b_principal_balance=0.0)])[0]
+    assert None in metrics["Class B"].values()
+    json.dumps(metrics, allow_nan=False)
+    stats = PricingService().stats()
+    assert stats["latency_p50"] is None
+    json.dumps(stats, allow_nan=False)
+
+
+def test_concurrent_requests_are_coalesced_into_one_build():
+    async def run():
+        async with PricingService(window=0.05) as priced:
+            quotes = await LocalClient(priced).price_many(DEALS)
+            return quotes, priced.stats()
+
+    quotes, stats = asyncio.run(run())
+    assert stats["batches"] == 1
+    assert [quote["batch_size"] for quote in quotes] == [len(DEALS)] * len(DEALS)
+    assert all(_same(quote, deal) for quote, deal in zip(quotes, DEALS))
+
+
+def test_repeated_deals_are_answered_from_the_cache():
+    async def run():
+        async with PricingService(window=0.0) as priced:
+            client = LocalClient(priced)
+            first = await client.price(**DEALS[0])
+            second = await client.price(**DEALS[0])
+            return first, second, await client.stats()
+
+    first, second, stats = asyncio.run(run())
+    assert not first["cached"] and second["cached"]
+    assert second["batch_size"] == 0
+    assert second["metrics"] == first["metrics"]
+    assert stats["cache_hits"] == 1 and stats["batches"] == 1
+
+
+def test_stop_prices_the_queued_requests():
+    async def run():
+        priced = PricingService(window=0.01, max_batch=2)
+        await priced.start()
+        client = LocalClient(priced)
+        tasks = [asyncio.create_task(client.price(**deal)) for deal in DEALS]
+        await asyncio.sleep(0)
+        await priced.stop()
+        assert all(task.done() for task in tasks)
+        return [task.result() for task in tasks], priced.stats()
+
+    quotes, stats = asyncio.run(run())
+    assert stats["queue_depth"] == 0 and stats["in_flight"] == 0
+    assert all(_same(quote, deal) for quote, deal in zip(quotes, DEALS))
+
+
+def test_a_failed_build_is_reported_to_its_callers(monkeypatch):
+    def failing(pool_infos, backend=None):
+        if any(pool_info.wac < 0 for pool_info in pool_infos):
+            raise ValueError("negative wac")
+        return price_batch(pool_infos, backend)
+
+    monkeypatch.setattr(service, "price_batch", failing)
+
+    async def run():
+        async with PricingService(window=0.0) as priced:
+            client = LocalClient(priced)
+            with pytest.raises(ValueError, match="negative wac"):
+                await client.price(wac=-0.1)
+            # the service keeps serving after a failed build
+            return await client.price(**DEALS[0])
+
+    assert _same(asyncio.run(run()), DEALS[0])
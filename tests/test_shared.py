@@ -0,0 +1,62 @@
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.results import RESULT_TABLES, ResultStore, write_results
+from waterfall.shared import SharedResultStore, run_shared
+from dataclasses import replace
+import numpy as np
+import pandas as pd
+import pytest
+
+N_SCENARIOS = 90
+BASE = replace(PoolInfo(), maturity=60)
+TABLE = {
+    "cumulative_default_rate": np.linspace(0.0, 0.2, N_SCENARIOS),
+    "wac": np.linspace(0.08, 0.16, N_SCENARIOS),
+}
+
+
+@pytest.fixture(scope="module")
+def written(tmp_path_factory) -> ResultStore:
+    acf = AssetCashFlowBatch(PoolInfoBatch.from_table(TABLE, BASE))
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlowBatch(acf)
+    lcf.build_waterfall_engine()
+    return write_results(tmp_path_factory.mktemp("results"), lcf)
+
+
+@pytest.mark.parametrize("max_workers", (1, 3))
+def test_shared_store_matches_the_written_results(written, max_workers):
+    with run_shared(TABLE, BASE, 25, max_workers) as store:
+        assert store.complete and len(store) == len(written)
+        for table in RESULT_TABLES:
+            pd.testing.assert_frame_equal(store.frame(table), written.frame(table))
+        np.testing.assert_array_equal(
+            store.column(("Class A Principal", "Principal Paid")),
+            written.column(("Class A Principal", "Principal Paid")),
+        )
+        np.testing.assert_array_equal(
+            store.column("available_funds", table="loan_info"),
+            written.column("available_funds", table="loan_info"),
+        )
+
+
+def test_closing_the_owner_unlinks_the_blocks():
+    store = SharedResultStore(2, BASE.maturity)
+    spec = store.spec
+    attached = SharedResultStore.attach(spec)
+    attached.close()
+    store.close()
+    with pytest.raises(FileNotFoundError):
+        SharedResultStore.attach(spec)
+
+
+def test_invalid_shared_runs_raise():
+    with pytest.raises(ValueError):
+        SharedResultStore(0, BASE.maturity)
+    with pytest.raises(ValueError):
+        run_shared({**TABLE, "maturity": np.arange(N_SCENARIOS) % 2 + 60}, BASE)
+    with pytest.raises(ValueError):
+        run_shared({"not_a_field": np.zeros(N_SCENARIOS)}, BASE)
+    with pytest.raises(ValueError):
+        run_shared(TABLE, BASE, chunk_size=0)
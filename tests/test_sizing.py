@@ -0,0 +1,39 @@
+from waterfall.input import PoolInfo
+from waterfall.sizing import TrancheSizer, max_tranche_loss, size_tranche
+from dataclasses import replace
+import pytest
+
+
+def test_size_tranche_on_a_batch_of_scenarios():
+    # the sizer sets one balance for the whole batch
+    scenarios = [
+        replace(PoolInfo(), cumulative_default_rate=cdr) for cdr in (0.01, 0.05, 0.1)
+    ]
+    result = size_tranche(scenarios, max_tranche_loss("class_a"))
+    assert 0 <= result.balance <= scenarios[0].init_pool_balance
+    assert result.evaluations > 0
+
+
+def test_sized_balance_is_the_largest_feasible_one():
+    pool_info = PoolInfo()
+    constraint = max_tranche_loss("class_b")
+    result = size_tranche(pool_info, constraint, "class_b")
+    assert 0 < result.balance < pool_info.init_pool_balance
+    sizer = TrancheSizer([pool_info], constraint, "class_b")
+    assert sizer.feasible(result.balance)
+    assert not sizer.feasible(result.balance + sizer.tolerance)
+
+
+def test_stress_lowers_the_sized_balance():
+    base = size_tranche(PoolInfo(), max_tranche_loss("class_b"), "class_b")
+    stressed = size_tranche(
+        replace(PoolInfo(), cumulative_default_rate=0.1),
+        max_tranche_loss("class_b"),
+        "class_b",
+    )
+    assert stressed.balance < base.balance
+
+
+def test_unknown_tranche():
+    with pytest.raises(ValueError):
+        TrancheSizer([PoolInfo()], max_tranche_loss("class_a"), "class_c")
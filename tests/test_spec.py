@@ -0,0 +1,189 @@
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.liabilities.spec import (
+    SpecCashFlow,
+    Step,
+    Tranche,
+    Trigger,
+    WaterfallSpec,
+)
+from dataclasses import replace
+import numpy as np
+import pytest
+
+A, B, C = (Tranche("A", 60.0, 0.0), Tranche("B", 40.0, 0.0), Tranche("C", 0.0, 0.0))
+
+
+def _asset(pool_balance, collections, principal_due, defaults=None) -> AssetCashFlow:
+    """an asset build with the given rows, collections start at t = 1"""
+    acf = AssetCashFlow(replace(PoolInfo(), maturity=len(pool_balance) - 1))
+    acf.pool_balance[:] = pool_balance
+    acf.available_funds[:] = collections
+    acf.principal_due[:] = principal_due
+    if defaults is not None:
+        acf.defaulted_balances[:] = defaults
+    return acf
+
+
+def _run(acf: AssetCashFlow, *steps: Step, **spec) -> SpecCashFlow:
+    spec = {"tranches": (A, B), "servicing_fee": 0.0, **spec}
+    cf = SpecCashFlow(acf, WaterfallSpec(steps=steps, **spec).compile())
+    cf.build_waterfall_engine()
+    return cf
+
+
+def _paid(cf: SpecCashFlow, name: str) -> np.ndarray:
+    return cf.tranche_array(name, "principal_paid")[0]
+
+
+@pytest.mark.parametrize(
+    "spec, message",
+    [
+        (WaterfallSpec((A, A), (Step("sequential", ("A",)),)), "tranche names"),
+        (
+            WaterfallSpec(
+                (A,),
+                (Step("fee"),),
+                (Trigger("t", "pool_factor", 0.5),) * 2,
+            ),
+            "trigger names",
+        ),
+        (WaterfallSpec((A,), (Step("bonus", ("A",)),)), "step kind"),
+        (WaterfallSpec((A,), (Step("sequential", ("Z",)),)), "unknown tranches"),
+        (WaterfallSpec((A,), (Step("fee", ("A",)),)), "fee step with tranches"),
+        (WaterfallSpec((A,), (Step("interest"),)), "interest step with tranches"),
+        (WaterfallSpec((A, B), (Step("pro_rata", ("A", "A")),)), "tranche twice"),
+        (WaterfallSpec((A,), (Step("turbo", ("A",), "t"),)), "unknown trigger"),
+        (
+            WaterfallSpec((A,), (Step("fee"),), (Trigger("t", "yield", 0.5),)),
+            "trigger metric",
+        ),
+    ],
+)
+def test_compile_rejects_invalid_specs(spec, message):
+    with pytest.raises(ValueError, match=message):
+        spec.compile()
+
+
+def test_compile_lowers_the_steps_in_order():
+    spec = WaterfallSpec(
+        (A, B, C),
+        (
+            Step("fee"),
+            Step("interest", ("A", "C")),
+            Step("turbo", ("B",), "oc", breached=False),
+        ),
+        (Trigger("oc", "overcollateralization", 1.1, above=False, sticky=False),),
+    )
+    program = spec.compile()
+    assert program.tranche_names == ("A", "B", "C")
+    np.testing.assert_array_equal(
+        program.ops, [[0, 0, 0, -1, 1], [1, 0, 2, -1, 1], [4, 2, 3, 0, 0]]
+    )
+    np.testing.assert_array_equal(program.members, [0, 2, 1])
+    np.testing.assert_array_equal(program.trigger_ops, [[1, 0, 0]])
+    np.testing.assert_array_equal(program.balances, [60.0, 40.0, 0.0])
+
+
+def test_sequential_and_pro_rata_principal():
+    acf = _asset([100, 50, 0], [0, 50, 60], [0, 50, 50])
+    sequential = _run(acf, Step("sequential", ("A", "B")))
+    np.testing.assert_allclose(_paid(sequential, "A"), [0, 50, 10])
+    np.testing.assert_allclose(_paid(sequential, "B"), [0, 0, 40])
+    np.testing.assert_allclose(sequential.deal_array("residual")[0], [0, 0, 10])
+    pro_rata = _run(acf, Step("pro_rata", ("A", "B")))
+    np.testing.assert_allclose(_paid(pro_rata, "A"), [0, 30, 30])
+    np.testing.assert_allclose(_paid(pro_rata, "B"), [0, 20, 20])
+    np.testing.assert_allclose(pro_rata.deal_array("residual")[0], [0, 0, 10])
+
+
+def test_turbo_pays_every_remaining_dollar_as_principal():
+    acf = _asset([100, 90, 80], [0, 30, 40], [0, 10, 10])
+    cf = _run(
+        acf,
+        Step("interest", ("A", "B")),
+        Step("sequential", ("A", "B")),
+        Step("turbo", ("A", "B")),
+        tranches=(replace(A, coupon=0.12), replace(B, coupon=0.12)),
+    )
+    # t = 1: interest 0.6 + 0.4, 10 due then 19 turbo to A
+    # t = 2: interest 0.31 + 0.4, A pays off its 31 and B gets the other 8.29
+    np.testing.assert_allclose(
+        cf.tranche_array("A", "interest_paid")[0], [0, 0.6, 0.31]
+    )
+    np.testing.assert_allclose(_paid(cf, "A"), [0, 29, 31])
+    np.testing.assert_allclose(_paid(cf, "B"), [0, 0, 8.29])
+    np.testing.assert_allclose(cf.deal_array("residual")[0], 0, atol=1e-12)
+
+
+def test_reserve_is_drawn_and_topped_up_every_period():
+    acf = _asset([100, 90, 90], [0, 30, 0], [0, 10, 0])
+    cf = _run(
+        acf,
+        Step("sequential", ("A", "B")),
+        Step("reserve"),
+        reserve_target=0.05,
+        reserve_rate=0.12,
+    )
+    # the target is 5% of the initial pool, at t = 2 the grown reserve is the
+    # only source of funds
+    np.testing.assert_allclose(cf.deal_array("reserve_balance")[0], [0, 5, 5])
+    np.testing.assert_allclose(cf.deal_array("available_funds")[0], [0, 30, 5.05])
+    np.testing.assert_allclose(cf.deal_array("residual")[0], [0, 15, 0.05])
+
+
+@pytest.mark.parametrize("sticky", [True, False])
+@pytest.mark.parametrize("breached", [True, False])
+def test_steps_follow_their_trigger(sticky, breached):
+    # the pool factor of the previous period is 1, 0.4, 0.8 and 0.3
+    acf = _asset([100, 40, 80, 30, 20], [0, 10, 10, 10, 10], [0, 2, 2, 2, 2])
+    cf = _run(
+        acf,
+        Step("sequential", ("A",)),
+        Step("turbo", ("A",), "pf", breached=breached),
+        tranches=(replace(A, balance=100.0),),
+        triggers=(Trigger("pf", "pool_factor", 0.5, above=False, sticky=sticky),),
+    )
+    state = [False, False, True, sticky, True]
+    np.testing.assert_array_equal(cf.triggers[0, 0], state)
+    turbo = np.array(state) == breached
+    np.testing.assert_allclose(_paid(cf, "A")[1:], np.where(turbo, 10, 2)[1:])
+    np.testing.assert_allclose(
+        cf.deal_array("residual")[0, 1:], np.where(turbo, 0, 8)[1:]
+    )
+
+
+def test_three_tranche_deal_matches_hand_computed_cash_flows():
+    acf = _asset([100, 60, 20, 0], [0, 45, 45, 25], [0, 40, 40, 20])
+    cf = _run(
+        acf,
+        Step("fee"),
+        Step("interest", ("A",)),
+        Step("interest", ("B", "C")),
+        Step("sequential", ("A", "B", "C")),
+        Step("reserve"),
+        tranches=(
+            Tranche("A", 50.0, 0.12),
+            Tranche("B", 30.0, 0.24),
+            Tranche("C", 20.0, 0.0),
+        ),
+        servicing_fee=0.12,
+        reserve_target=0.02,
+    )
+    # t = 1: 45 collected, fee 1, interest 0.5 and 0.6, 40 to A, reserve 2
+    # t = 2: 45 plus the reserve, fee 0.6, interest 0.1 and 0.6, A 10 then B 30
+    # t = 3: 25 plus the reserve, fee 0.2, C 20
+    np.testing.assert_allclose(cf.deal_array("fee_paid")[0], [0, 1, 0.6, 0.2])
+    np.testing.assert_allclose(cf.deal_array("available_funds")[0], [0, 45, 47, 27])
+    np.testing.assert_allclose(cf.deal_array("reserve_balance")[0], [0, 2, 2, 2])
+    np.testing.assert_allclose(cf.deal_array("residual")[0], [0, 0.9, 3.7, 4.8])
+    expected = {
+        "A": ([0, 0.5, 0.1, 0], [0, 40, 10, 0], [50, 10, 0, 0]),
+        "B": ([0, 0.6, 0.6, 0], [0, 0, 30, 0], [30, 30, 0, 0]),
+        "C": ([0, 0, 0, 0], [0, 0, 0, 20], [20, 20, 20, 0]),
+    }
+    for name, (interest, principal, ending) in expected.items():
+        np.testing.assert_allclose(cf.tranche_array(name, "interest_paid")[0], interest)
+        np.testing.assert_allclose(_paid(cf, name), principal)
+        np.testing.assert_allclose(cf.tranche_array(name, "ending_balance")[0], ending)
+    np.testing.assert_allclose(cf.deal_array("principal_short_fall")[0], 0, atol=1e-12)
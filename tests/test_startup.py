@@ -0,0 +1,69 @@
+from pathlib import Path
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# modules that must import without pandas, which only the frame exports load
+CORE = (
+    "waterfall.input",
+    "waterfall.asset.asset",
+    "waterfall.asset.cache",
+    "waterfall.asset.tape",
+    "waterfall.ingest",
+    "waterfall.liabilities.kernel",
+    "waterfall.liabilities.liabilities",
+    "waterfall.liabilities.spec",
+    "waterfall.analytics",
+    "waterfall.pipeline",
+    "waterfall.results",
+    "waterfall.chunked",
+    "waterfall.shared",
+    "waterfall.reforecast",
+    "waterfall.portfolio",
+    "waterfall.sizing",
+    "waterfall.montecarlo",
+    "waterfall.sensitivity",
+    "waterfall.service",
+    "waterfall.client",
+    "waterfall.instrumentation",
+    "waterfall.cli",
+)
+BUILD = """
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.liabilities.liabilities import LiabilitiesCashFlow
+from waterfall.analytics import waterfall_analytics
+acf = AssetCashFlow(PoolInfo())
+acf.build_asset_side_cashflow()
+lcf = LiabilitiesCashFlow(acf)
+lcf.build_waterfall_engine()
+waterfall_analytics(lcf)
+"""
+
+
+def _imports_pandas(code: str) -> bool:
+    """whether code run in a fresh interpreter leaves pandas imported"""
+    output = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint('pandas' in sys.modules)"],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return output.strip() == "True"
+
+
+@pytest.mark.parametrize("module", CORE)
+def test_core_module_imports_without_pandas(module):
+    assert not _imports_pandas(f"import {module}")
+
+
+def test_build_and_analytics_run_without_pandas():
+    assert not _imports_pandas(BUILD)
+
+
+def test_frames_import_pandas_when_asked_for():
+    assert _imports_pandas(f"{BUILD}\nlcf.build_waterfall_df()")
@@ -0,0 +1,36 @@
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.asset.tape import project_loan_tape
+from dataclasses import replace
+import numpy as np
+import pytest
+
+
+def _tape(n: int, **columns) -> dict[str, np.ndarray]:
+    loan = {"balance": 10_000.0, "coupon": 0.1, "remaining_term": 60, "seasoning": 0}
+    return {name: np.full(n, columns.get(name, value)) for name, value in loan.items()}
+
+
+def test_tape_of_identical_loans_matches_the_pool():
+    projected = project_loan_tape(_tape(500))
+    acf = AssetCashFlow(
+        replace(
+            PoolInfo(),
+            num_loans=500.0,
+            init_balance_per_loan=10_000.0,
+            wac=0.1,
+            wam=60,
+            maturity=60,
+        )
+    )
+    acf.build_asset_arrays()
+    assert projected.pool_info.num_loans == 500
+    assert projected.pool_info.init_balance_per_loan == pytest.approx(10_000.0)
+    np.testing.assert_allclose(projected.buffer, acf.buffer, rtol=1e-9, atol=1e-6)
+
+
+def test_tape_without_live_loans_is_rejected():
+    with pytest.raises(ValueError, match="no live loans"):
+        project_loan_tape(_tape(3, balance=0.0))
+    with pytest.raises(ValueError, match="no live loans"):
+        project_loan_tape(_tape(0))
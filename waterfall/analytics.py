@@ -0,0 +1,239 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from numpy.typing import ArrayLike
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# tranche name -> (interest paid, principal paid, beginning balance) attributes
+# of LiabilitiesCashFlow and LiabilitiesCashFlowBatch
+TRANCHES = {
+    "Class A": (
+        "class_a_interest_paid",
+        "class_a_principal_paid",
+        "class_a_beginning_principal_balance",
+    ),
+    "Class B": (
+        "class_b_interest_paid",
+        "class_b_principal_paid",
+        "class_b_beginning_principal_balance",
+    ),
+}
+
+
+# metric name -> TrancheMetrics attribute reported per tranche
+METRICS = {
+    "WAL": "wal",
+    "Yield": "yield_",
+    "Modified Duration": "modified_duration",
+    "Loss": "loss",
+    "Interest Paid": "interest_paid",
+    "Principal Paid": "principal_paid",
+}
+
+
+def weighted_average_life(
+    principal_paid: ArrayLike, periods_per_year: int = 12
+) -> np.ndarray:
+    """Principal weighted average time to repayment in years
+
+    Parameters
+    ----------
+    principal_paid : ArrayLike
+        principal paid at t = 0..T, shape (T+1,) or (n_scenarios, T+1)
+
+    Returns
+    -------
+    np.ndarray
+        WAL per scenario, NaN where no principal is paid
+    """
+    principal_paid = np.asarray(principal_paid, dtype=float)
+    t = np.arange(principal_paid.shape[-1])
+    total = principal_paid.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        wal = (principal_paid * t).sum(axis=-1) / total / periods_per_year
+    return np.where(total > 0, wal, np.nan)
+
+
+def tranche_loss(principal_paid: ArrayLike, par: ArrayLike) -> np.ndarray:
+    """Unpaid principal as a fraction of par, zero for a tranche without par"""
+    principal_paid = np.asarray(principal_paid, dtype=float)
+    par = np.asarray(par, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        loss = 1 - principal_paid.sum(axis=-1) / par
+    return np.where(par > 0, np.clip(loss, 0.0, 1.0), 0.0)
+
+
+def cashflow_yield(
+    cash_flows: ArrayLike,
+    price: ArrayLike,
+    periods_per_year: int = 12,
+    guess: float = 0.05,
+    tolerance: float = 1e-12,
+    max_iterations: int = 100,
+) -> np.ndarray:
+    """Annual yield, compounded every period, that prices the cash flows
+
+    Solves sum_t cf[t] / (1 + r)^t = price for the periodic rate r with a Newton
+    iteration evaluated for every scenario at once. Scenarios drop out of the
+    update as they converge, steps that would cross r = -1 are halved.
+
+    Parameters
+    ----------
+    cash_flows : ArrayLike
+        cash flows at t = 0..T, shape (T+1,) or (n_scenarios, T+1)
+    price : ArrayLike
+        price paid at t = 0, scalar or one per scenario
+    guess : float, optional
+        starting annual yield
+
+    Returns
+    -------
+    np.ndarray
+        yield per scenario, NaN where there are no cash flows or no convergence
+    """
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    n, periods = cash_flows.shape
+    price = np.broadcast_to(np.asarray(price, dtype=float), (n,))
+    t = np.arange(periods)
+    rate = np.full(n, guess / periods_per_year)
+    active = cash_flows.any(axis=-1) & (price > 0)
+    converged = np.zeros(n, dtype=bool)
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        r = rate[active]
+        flows = cash_flows[active]
+        discount = np.power(1 + r[:, None], -t)
+        value = (flows * discount).sum(axis=-1) - price[active]
+        slope = -(flows * t * discount / (1 + r[:, None])).sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            step = value / slope
+        step = np.where(np.isfinite(step), step, 0.0)
+        updated = r - step
+        # keep the periodic rate above -100%
+        updated = np.where(updated <= -1, (r - 1) / 2, updated)
+        rate[active] = updated
+        done = np.abs(step) < tolerance
+        index = np.flatnonzero(active)
+        converged[index[done]] = True
+        active[index[done | (slope == 0)]] = False
+    return np.where(converged, rate * periods_per_year, np.nan)
+
+
+def modified_duration(
+    cash_flows: ArrayLike, annual_yield: ArrayLike, periods_per_year: int = 12
+) -> np.ndarray:
+    """Modified duration in years at the given yield"""
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    r = np.asarray(annual_yield, dtype=float).reshape(-1, 1) / periods_per_year
+    t = np.arange(cash_flows.shape[-1])
+    discounted = cash_flows * np.power(1 + r, -t)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        macaulay = (discounted * t).sum(axis=-1) / discounted.sum(axis=-1)
+    return macaulay / periods_per_year / (1 + r[:, 0])
+
+
+@dataclass
+class TrancheMetrics:
+    """Per scenario metrics of one tranche, every field has shape (n_scenarios,)
+
+    wal: weighted average life in years
+    yield_: annual yield at par, compounded every period
+    modified_duration: modified duration in years at yield_
+    loss: unpaid principal as a fraction of par
+    interest_paid: total interest paid
+    principal_paid: total principal paid
+    """
+
+    wal: np.ndarray
+    yield_: np.ndarray
+    modified_duration: np.ndarray
+    loss: np.ndarray
+    interest_paid: np.ndarray
+    principal_paid: np.ndarray
+
+    def to_frame(self) -> pd.DataFrame:
+        import pandas as pd
+
+        return pd.DataFrame(
+            {name: getattr(self, attribute) for name, attribute in METRICS.items()}
+        )
+
+
+def tranche_metrics(
+    interest_paid: ArrayLike,
+    principal_paid: ArrayLike,
+    par: ArrayLike,
+    price: ArrayLike | None = None,
+    periods_per_year: int = 12,
+) -> TrancheMetrics:
+    """WAL, yield, modified duration and loss of a tranche
+
+    Parameters
+    ----------
+    interest_paid : ArrayLike
+        interest paid at t = 0..T, shape (T+1,) or (n_scenarios, T+1)
+    principal_paid : ArrayLike
+        principal paid, same shape as interest_paid
+    par : ArrayLike
+        beginning principal balance, scalar or one per scenario
+    price : ArrayLike | None, optional
+        price paid for the tranche, par by default
+
+    Returns
+    -------
+    TrancheMetrics
+        one value per scenario
+    """
+    interest_paid = np.atleast_2d(np.asarray(interest_paid, dtype=float))
+    principal_paid = np.atleast_2d(np.asarray(principal_paid, dtype=float))
+    n = len(principal_paid)
+    par = np.broadcast_to(np.asarray(par, dtype=float), (n,))
+    price = par if price is None else price
+    cash_flows = interest_paid + principal_paid
+    annual_yield = cashflow_yield(cash_flows, price, periods_per_year)
+    return TrancheMetrics(
+        wal=weighted_average_life(principal_paid, periods_per_year),
+        yield_=annual_yield,
+        modified_duration=modified_duration(cash_flows, annual_yield, periods_per_year),
+        loss=tranche_loss(principal_paid, par),
+        interest_paid=interest_paid.sum(axis=-1),
+        principal_paid=principal_paid.sum(axis=-1),
+    )
+
+
+def waterfall_analytics(lcf, periods_per_year: int = 12) -> dict[str, TrancheMetrics]:
+    """TrancheMetrics of every tranche of a built LiabilitiesCashFlow or batch"""
+    return {
+        name: tranche_metrics(
+            getattr(lcf, interest),
+            getattr(lcf, principal),
+            getattr(lcf, par),
+            periods_per_year=periods_per_year,
+        )
+        for name, (interest, principal, par) in TRANCHES.items()
+    }
+
+
+def spec_analytics(cf, periods_per_year: int = 12) -> dict[str, TrancheMetrics]:
+    """TrancheMetrics of every tranche of a built liabilities.spec.SpecCashFlow"""
+    return {
+        name: tranche_metrics(
+            cf.tranche_array(name, "interest_paid"),
+            cf.tranche_array(name, "principal_paid"),
+            par,
+            periods_per_year=periods_per_year,
+        )
+        for name, par in zip(cf.program.tranche_names, cf.program.balances)
+    }
+
+
+def analytics_frame(metrics: dict[str, TrancheMetrics]) -> pd.DataFrame:
+    """Tidy frame of waterfall_analytics indexed by (tranche, scenario)"""
+    import pandas as pd
+
+    frames = {name: tranche.to_frame() for name, tranche in metrics.items()}
+    return pd.concat(frames, names=["tranche", "scenario"])
@@ -1 +1 @@
-from waterfall.asset.asset import AssetCashFlow
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch
@@ -1,9 +1,49 @@
 from __future__ import annotations
-from waterfall.input import PoolInfo
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.instrumentation import instrumented
 from dataclasses import dataclass, field
+from functools import cached_property
+from typing import TYPE_CHECKING, Sequence
 import numpy as np
-import math
-import pandas as pd
+
+if TYPE_CHECKING:
+    # pandas is only imported once a DataFrame is asked for
+    import pandas as pd
+
+# DataFrame column name -> AssetCashFlow attribute
+ASSET_COLUMNS = {
+    "Pool Balance": "pool_balance",
+    "Current Loans Remaining": "current_loans_remaining",
+    "Fully Prepaying": "fully_prepaying",
+    "Scheduled Interest": "scheduled_interest",
+    "Scheduled Principal": "scheduled_principal",
+    "Prepaid Principal": "prepaid_principal",
+    "Total Principal": "total_principal",
+    "Principal Loan Balance": "principal_loan_balance",
+    "Defaulted Balances": "defaulted_balances",
+    "Recoveries": "recoveries",
+    "Available Funds": "available_funds",
+    "Principal Due": "principal_due",
+}
+# rows of the AssetCashFlow state buffer, the DataFrame columns come first
+ASSET_ARRAYS = (
+    *ASSET_COLUMNS.values(),
+    # cumulative non normalized account space loss curve
+    "L",
+    # marginal_non_normalized_account_space_loss
+    "l",
+    # marginal_normalized_account_space_loss
+    "nD",
+)
+# rows holding the pool and its cash flows, the pool is paid off once they are
+# all zero for the rest of the deal, see AssetCashFlow.payoff_period
+PAYOFF_ARRAYS = (
+    "pool_balance",
+    "available_funds",
+    "principal_due",
+    "defaulted_balances",
+    "recoveries",
+)
 
 
 @dataclass
@@ -24,58 +64,123 @@ class AssetCashFlow:
     L: np.ndarray = field(init=False)
     nD: np.ndarray = field(init=False)
     l: np.ndarray = field(init=False)
+    # (len(ASSET_ARRAYS), *shape) storage behind every array above, allocated
+    # when not supplied so callers can recycle one buffer across runs
+    buffer: np.ndarray | None = field(default=None, repr=False)
+    # last period of actuals written by seed, the stages only project after it
+    start: int = field(default=0, init=False)
+    actuals: np.ndarray | None = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
-        self.pool_balance = np.zeros(self.pool_info.maturity + 1)
-        self.current_loans_remaining = np.zeros(self.pool_info.maturity + 1)
-        self.fully_prepaying = np.zeros(self.pool_info.maturity + 1)
-        self.scheduled_interest = np.zeros(self.pool_info.maturity + 1)
-        self.scheduled_principal = np.zeros(self.pool_info.maturity + 1)
-        self.prepaid_principal = np.zeros(self.pool_info.maturity + 1)
-        self.total_principal = np.zeros(self.pool_info.maturity + 1)
-        self.principal_loan_balance = np.zeros(self.pool_info.maturity + 1)
-        self.defaulted_balances = np.zeros(self.pool_info.maturity + 1)
-        self.recoveries = np.zeros(self.pool_info.maturity + 1)
-        self.available_funds = np.zeros(self.pool_info.maturity + 1)
-        self.principal_due = np.zeros(self.pool_info.maturity + 1)
-        # cumulative non normalized account space loss curve
-        self.L = np.zeros(self.pool_info.maturity + 1)
-        # marginal_non_normalized_account_space_loss
-        self.l = np.zeros(self.pool_info.maturity + 1)
-        # marginal_normalized_account_space_loss
-        self.nD = np.zeros(self.pool_info.maturity + 1)
+        shape = (len(ASSET_ARRAYS), *self.shape)
+        if self.buffer is None:
+            self.buffer = np.zeros(shape)
+        elif self.buffer.shape != shape:
+            raise ValueError(f"buffer must have shape {shape}, got {self.buffer.shape}")
+        # every cash flow array is a row view of the single state buffer
+        for i, name in enumerate(ASSET_ARRAYS):
+            setattr(self, name, self.buffer[i])
 
-    def build_normalized_loss_curves(self):
-        self.L[0] = self.credit_loss_cdf(0) * self.pool_info.num_loans
+    def reset(self):
+        """Zeroes the state buffer so the object can be rebuilt in place"""
+        self._check_writeable()
+        self.buffer[...] = 0
+
+    def seed(self, period: int, actuals: np.ndarray):
+        """Writes actual rows of the state buffer up to period
 
-        for t in range(1, self.pool_info.maturity + 1):
-            self.L[t] = self.credit_loss_cdf(t) * self.pool_info.num_loans
-            self.l[t] = self.L[t] - self.L[t - 1]
+        The next build keeps every period up to period as given and projects
+        the later ones from it, the running balances start from the actual
+        pool balance and loans remaining at period and the recoveries follow
+        the actual defaults.
+
+        Parameters
+        ----------
+        period : int
+            last period of actuals, 0 < period < maturity
+        actuals : np.ndarray
+            (len(ASSET_ARRAYS), period + 1) rows of the state buffer,
+            broadcast across the scenarios of a batch
+        """
+        self._check_writeable()
+        if not 0 < period < self.pool_info.maturity:
+            raise ValueError(
+                f"period must be within (0, {self.pool_info.maturity}), got {period}"
+            )
+        actuals = np.asarray(actuals, dtype=float)
+        if actuals.ndim < 2 or actuals.shape[0] != len(ASSET_ARRAYS):
+            raise ValueError(
+                f"actuals must have {len(ASSET_ARRAYS)} rows, got {actuals.shape}"
+            )
+        actuals = actuals.reshape(
+            len(actuals), *(1,) * (self.buffer.ndim - actuals.ndim), -1
+        )
+        self.buffer[..., : period + 1] = actuals
+        self.start = period
+        self.actuals = self.buffer[..., : period + 1].copy()
 
-        for t in range(1, self.pool_info.maturity + 1):
-            self.nD[t] = (
-                self.l[t] * self.pool_info.expected_loss / (self.L[-1] - self.L[0])
+    def _check_writeable(self):
+        if not self.buffer.flags.writeable:
+            raise ValueError(
+                "the state buffer is read only, e.g. shared by an AssetCache, "
+                "build on AssetCashFlow(pool_info, buffer=buffer.copy()) instead"
             )
 
-    def _cumulative_prepayment_curve(self, t: int) -> float:
+    def _restore_actuals(self):
+        """writes the seeded periods back over what a stage projected"""
+        if self.start:
+            self.buffer[..., : self.start + 1] = self.actuals
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """shape of every cash flow array, the last axis is the period t"""
+        return (self.pool_info.maturity + 1,)
+
+    def payoff_period(self, tolerance: float = 0.0) -> int | np.ndarray:
+        """First period from which the pool is paid off
+
+        From that period on the pool balance and every collection of
+        PAYOFF_ARRAYS are within tolerance of zero, so the waterfall engines
+        only carry what is left of the notes and the reserve. maturity + 1 if
+        the pool is never paid off.
+
+        Returns
+        -------
+        int | np.ndarray
+            the period, (n_scenarios,) periods for a batch
+        """
+        return zero_tail([getattr(self, name) for name in PAYOFF_ARRAYS], tolerance)
+
+    @instrumented
+    def build_normalized_loss_curves(self):
+        t = np.arange(self.pool_info.maturity + 1)
+        self.L[...] = self.credit_loss_cdf(t) * self.pool_info.num_loans
+        self.l[..., 1:] = np.diff(self.L)
+        self.nD[..., 1:] = (
+            self.l[..., 1:]
+            * self.pool_info.expected_loss
+            / (self.L[..., -1:] - self.L[..., :1])
+        )
+
+    def _cumulative_prepayment_curve(self, t: np.ndarray) -> np.ndarray:
         """Computes the cumulative prepayment curve G(t)
 
         Parameters
         ----------
-        t : int
+        t : np.ndarray
             given in months, is the time corresponding to that month
 
         Returns
         -------
-        float
+        np.ndarray
             computes cumulative prepayment curve
         """
         top = self.pool_info.inflection_point
         a = self.pool_info.cumulative_prepayment_curve_slope
-        if t < top:
-            return a * t * t * 0.5
-        if top <= t <= self.pool_info.maturity:
-            return a * top * top * 0.5 + (t - top) * a * top
+        t = np.asarray(t)
+        return np.where(
+            t < top, a * t * t * 0.5, a * top * top * 0.5 + (t - top) * a * top
+        )
 
     def credit_loss_cdf(self, t):
         """Cumulative distribution function for credit loss curve
@@ -84,148 +189,270 @@ class AssetCashFlow:
 
         Parameters
         ----------
-        t : _type_
-            _description_
+        t : int | np.ndarray
+            time in months, scalar or array of months
 
         Returns
         -------
-        _type_
-            _description_
+        float | np.ndarray
+            the cumulative credit loss at each t
         """
         a = 0.1
         b = 1
-        c = 0.1
-        t0 = 55
+        c = self.pool_info.loss_curve_steepness
+        t0 = self.pool_info.loss_curve_timing
 
         return a / (1 + b * np.exp(-c * (t - t0)))
 
     def initialize_pool_balance(self):
-        self.pool_balance[0] = self.pool_info.init_pool_balance
+        self.pool_balance[..., :1] = self.pool_info.init_pool_balance
 
+    @instrumented
     def build_fully_prepaying(self):
         """npt = G(t) - G(t-1)"""
-        for t in range(1, self.pool_info.maturity):
-            self.fully_prepaying[t] = self._cumulative_prepayment_curve(
-                t
-            ) - self._cumulative_prepayment_curve(t - 1)
+        t = np.arange(1, self.pool_info.maturity)
+        self.fully_prepaying[..., 1 : self.pool_info.maturity] = (
+            self._cumulative_prepayment_curve(t)
+            - self._cumulative_prepayment_curve(t - 1)
+        )
 
     def initialize_current_loan_remaining(self):
-        self.current_loans_remaining[0] = self.pool_info.num_loans
+        self.current_loans_remaining[..., :1] = self.pool_info.num_loans
 
+    @instrumented
     def build_pool_balance(self):
-        self.initialize_pool_balance()
-        for t in range(1, self.pool_info.maturity + 1):
-            self.pool_balance[t] = (
-                self.pool_balance[t - 1]
-                - self.defaulted_balances[t]
-                - self.prepaid_principal[t]
-                - self.scheduled_principal[t]
-            )
+        s = self.start
+        if not s:
+            self.initialize_pool_balance()
+        self.pool_balance[..., s:] = _running_balance(
+            self.pool_balance[..., s : s + 1],
+            self.defaulted_balances[..., s:],
+            self.prepaid_principal[..., s:],
+            self.scheduled_principal[..., s:],
+        )
 
+    @instrumented
     def build_current_loans_remaining(self):
-        self.initialize_current_loan_remaining()
-        for t in range(1, self.pool_info.maturity + 1):
-            self.current_loans_remaining[t] = (
-                self.current_loans_remaining[t - 1]
-                - self.nD[t]
-                - self.fully_prepaying[t]
-            )
+        s = self.start
+        if not s:
+            self.initialize_current_loan_remaining()
+        self.current_loans_remaining[..., s:] = _running_balance(
+            self.current_loans_remaining[..., s : s + 1],
+            self.nD[..., s:],
+            self.fully_prepaying[..., s:],
+        )
 
-    def compute_beginning_balance(self, t: int):
+    def compute_beginning_balance(self, t: int | np.ndarray):
         """computes the beginning balance at beginning of each period
 
         Parameters
         ----------
-        t : int
-            _description_
+        t : int | np.ndarray
+            the period, scalar or array of periods
 
         Returns
         -------
-        _type_
-            _description_
+        float | np.ndarray
+            the amortized balance per loan at the beginning of each t
         """
         m = self.pool_info.periodic_payment
         r = self.pool_info.periodic_coupon
         maturity = self.pool_info.maturity
         return (m / r) * (1 - np.pow(1 + r, t - maturity))
 
+    @instrumented
     def build_balance_and_recoveries(self):
         m = self.pool_info.periodic_payment
         r = self.pool_info.periodic_coupon
         wam = self.pool_info.wam
-        self.principal_loan_balance[0] = self.compute_beginning_balance(0)
-        for t in range(1, self.pool_info.maturity + 1):
-            self.principal_loan_balance[t] = self.compute_beginning_balance(t)
-            self.defaulted_balances[t] = (
-                self.nD[t] * (m / r) * (1 - math.pow(1 + r, t - 1 - wam))
-            )
+        maturity = self.pool_info.maturity
+        t = np.arange(1, maturity + 1)
+        self.principal_loan_balance[...] = self.compute_beginning_balance(
+            np.arange(maturity + 1)
+        )
+        self.defaulted_balances[..., 1:] = (
+            self.nD[..., 1:] * (m / r) * (1 - np.pow(1 + r, t - 1 - wam))
+        )
+        # the recoveries after a seeded period follow its actual defaults
+        self._restore_actuals()
         # assume recoveries are delayed until the 4th period
-        for t in range(4, self.pool_info.maturity + 1):
-            self.recoveries[t] = (1 - self.pool_info.lgd) * self.defaulted_balances[
-                t - 3
-            ]
+        self.recoveries[..., 4:] = (1 - self.pool_info.lgd) * self.defaulted_balances[
+            ..., 1 : max(maturity - 2, 1)
+        ]
 
+    @instrumented
     def build_scheduled_interest_and_principal(self):
         r = self.pool_info.periodic_coupon
         m = self.pool_info.periodic_payment
         wam = self.pool_info.wam
-        for t in range(1, self.pool_info.maturity + 1):
-            self.scheduled_interest[t] = (
-                (self.current_loans_remaining[t - 1] - self.nD[t])
-                * r
-                * self.principal_loan_balance[t - 1]
-            )
-            self.scheduled_principal[t] = (
-                (self.current_loans_remaining[t - 1] - self.nD[t])
-                * (m / r)
-                * (math.pow(1 + r, t - wam) - math.pow(r + 1, t - 1 - wam))
-            )
-            self.prepaid_principal[t] = (self.fully_prepaying[t] * m / r) * (
-                1 - math.pow(1 + r, t - wam)
-            )
-            self.total_principal[t] = (
-                self.prepaid_principal[t] + self.scheduled_principal[t]
-            )
+        t = np.arange(1, self.pool_info.maturity + 1)
+        # loans still performing at the start of each period
+        performing = self.current_loans_remaining[..., :-1] - self.nD[..., 1:]
+        self.scheduled_interest[..., 1:] = (
+            performing * r * self.principal_loan_balance[..., :-1]
+        )
+        self.scheduled_principal[..., 1:] = (
+            performing * (m / r) * (np.pow(1 + r, t - wam) - np.pow(r + 1, t - 1 - wam))
+        )
+        self.prepaid_principal[..., 1:] = (self.fully_prepaying[..., 1:] * m / r) * (
+            1 - np.pow(1 + r, t - wam)
+        )
+        self.total_principal[..., 1:] = (
+            self.prepaid_principal[..., 1:] + self.scheduled_principal[..., 1:]
+        )
 
+    @instrumented
     def build_current_collections(self):
-        for t in range(1, self.pool_info.maturity + 1):
-            self.available_funds[t] = (
-                self.scheduled_interest[t]
-                + self.total_principal[t]
-                + self.recoveries[t]
-            )
-            self.principal_due[t] = (
-                self.scheduled_principal[t]
-                + self.prepaid_principal[t]
-                + self.defaulted_balances[t]
-            )
+        self.available_funds[..., 1:] = (
+            self.scheduled_interest[..., 1:]
+            + self.total_principal[..., 1:]
+            + self.recoveries[..., 1:]
+        )
+        self.principal_due[..., 1:] = (
+            self.scheduled_principal[..., 1:]
+            + self.prepaid_principal[..., 1:]
+            + self.defaulted_balances[..., 1:]
+        )
 
+    @instrumented
     def build_asset_side_cashflow(self):
-        self.build_fully_prepaying()
-        self.build_normalized_loss_curves()
-        self.build_balance_and_recoveries()
-        self.build_current_loans_remaining()
-        self.build_scheduled_interest_and_principal()
-        self.build_pool_balance()
-        self.build_current_collections()
-        data = {
-            "Pool Balance": self.pool_balance,
-            "Current Loans Remaining": self.current_loans_remaining,
-            "Fully Prepaying": self.fully_prepaying,
-            "Scheduled Interest": self.scheduled_interest,
-            "Scheduled Principal": self.scheduled_principal,
-            "Prepaid Principal": self.prepaid_principal,
-            "Total Principal": self.total_principal,
-            "Principal Loan Balance": self.principal_loan_balance,
-            "Defaulted Balances": self.defaulted_balances,
-            "Recoveries": self.recoveries,
-            "Available Funds": self.available_funds,
-            "Principal Due": self.principal_due,
-        }
-        self.asset = pd.DataFrame(data)
+        """Runs every asset stage, asset is built on its first access"""
+        self.__dict__.pop("asset", None)
+        self.build_asset_arrays()
+
+    @cached_property
+    def asset(self) -> pd.DataFrame:
+        """build_asset_df of the state buffer, built once on first access"""
+        return self.build_asset_df()
+
+    @instrumented
+    def build_asset_arrays(self):
+        """Runs every asset stage without building the asset DataFrame
+
+        Periods up to start hold the actuals of seed and are kept as they are.
+        """
+        self._check_writeable()
+        for build in (
+            self.build_fully_prepaying,
+            self.build_normalized_loss_curves,
+            self.build_balance_and_recoveries,
+            self.build_current_loans_remaining,
+            self.build_scheduled_interest_and_principal,
+            self.build_pool_balance,
+            self.build_current_collections,
+        ):
+            build()
+            self._restore_actuals()
+
+    @instrumented
+    def build_asset_df(self) -> pd.DataFrame:
+        """DataFrame view of the state buffer, it is not copied"""
+        import pandas as pd
+
+        return pd.DataFrame(
+            self.buffer[: len(ASSET_COLUMNS)].T, columns=list(ASSET_COLUMNS), copy=False
+        )
+
+
+@dataclass
+class AssetCashFlowBatch(AssetCashFlow):
+    """Asset side cash flows for a batch of scenarios evaluated at once
+
+    Every cash flow array has shape (n_scenarios, maturity + 1) and the stages
+    of AssetCashFlow broadcast the (n_scenarios, 1) fields of PoolInfoBatch
+    against the period axis, so the whole batch costs a handful of NumPy calls.
+    """
+
+    pool_info: PoolInfoBatch
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return (self.pool_info.n_scenarios, self.pool_info.maturity + 1)
+
+    @instrumented
+    def build_asset_df(self) -> pd.DataFrame:
+        """Long format DataFrame view of the state buffer indexed by (scenario, t)"""
+        import pandas as pd
+
+        n, periods = self.shape
+        index = pd.MultiIndex.from_product(
+            [range(n), range(periods)], names=["scenario", "t"]
+        )
+        data = self.buffer[: len(ASSET_COLUMNS)].reshape(len(ASSET_COLUMNS), -1)
+        return pd.DataFrame(
+            data.T, index=index, columns=list(ASSET_COLUMNS), copy=False
+        )
+
+
+def _running_balance(
+    initial: float | np.ndarray, *decrements: np.ndarray
+) -> np.ndarray:
+    """Computes balance[t] = balance[t-1] - decrements[0][t] - decrements[1][t] - ...
+
+    The decrements are interleaved period by period and folded with a single
+    np.subtract.accumulate, so the result matches the sequential loop bit for bit.
+
+    Parameters
+    ----------
+    initial : float | np.ndarray
+        the balance at time 0, broadcastable against decrements[..., :1]
+    *decrements : np.ndarray
+        arrays whose last axis is the period, subtracted in order for every t >= 1
+
+    Returns
+    -------
+    np.ndarray
+        the running balance, same shape as each decrement
+    """
+    k = len(decrements)
+    *batch, periods = decrements[0].shape
+    steps = np.empty((*batch, k * (periods - 1) + 1))
+    steps[..., :1] = initial
+    for j, decrement in enumerate(decrements):
+        steps[..., 1 + j :: k] = decrement[..., 1:]
+    return np.subtract.accumulate(steps, axis=-1)[..., ::k]
+
+
+def zero_tail(rows: Sequence[np.ndarray], tolerance: float) -> int | np.ndarray:
+    """First period from which every row is within tolerance of zero
+
+    The rows are walked back from maturity in doubling blocks, so the cost
+    follows the zero tail of each scenario rather than its maturity.
+
+    Parameters
+    ----------
+    rows : Sequence[np.ndarray]
+        arrays of the same shape whose last axis is the period
+    tolerance : float
+        largest absolute value counted as zero
+
+    Returns
+    -------
+    int | np.ndarray
+        the period, periods if the last one is not zero, one per scenario for
+        rows with a scenario axis
+    """
+    *batch, periods = np.shape(rows[0])
+    n = int(np.prod(batch))
+    rows = [np.reshape(row, (n, periods)) for row in rows]
+    end = np.zeros(n, dtype=np.int64)
+    remaining = np.arange(n)
+    stop, width = periods, 1
+    while len(remaining) and stop > 0:
+        start = max(stop - width, 0)
+        index = (remaining, slice(start, stop))
+        live = np.abs(rows[0][index]) > tolerance
+        for row in rows[1:]:
+            live |= np.abs(row[index]) > tolerance
+        found = live.any(axis=-1)
+        end[remaining[found]] = stop - np.argmax(live[found, ::-1], axis=-1)
+        remaining = remaining[~found]
+        stop, width = start, 2 * width
+    return int(end[0]) if not batch else end.reshape(batch)
 
 
 def main():
+    import pandas as pd
 
     pd.set_option("display.float_format", lambda x: "%.3f" % x)
 
@@ -0,0 +1,141 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, ASSET_FIELDS
+from waterfall.asset import asset as asset_engine
+from waterfall.asset.asset import AssetCashFlow, ASSET_ARRAYS
+from waterfall import input as pool_input
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+import hashlib
+import os
+import numpy as np
+
+
+@cache
+def engine_version() -> str:
+    """sha256 digest of the modules the asset build depends on
+
+    It changes with any edit of the asset engine or of PoolInfo, so entries
+    saved to disk by another version of the engine are never read back.
+    """
+    digest = hashlib.sha256()
+    for module in (asset_engine, pool_input):
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+def asset_key(pool_info: PoolInfo) -> str:
+    """sha256 digest of engine_version and the PoolInfo fields of the asset side"""
+    payload = repr(
+        [
+            engine_version(),
+            *((name, float(getattr(pool_info, name))) for name in ASSET_FIELDS),
+        ]
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class AssetCache:
+    """Content addressed cache of built asset side state buffers
+
+    Entries are keyed on the asset relevant PoolInfo fields only, so pools that
+    differ in liability fields share one asset build. The in-memory tier is an
+    LRU bounded by maxsize. When a directory is given every build is also saved
+    there as <key>.npy and memory mapped back on a later miss, so a warm restart
+    skips recomputation. Keys include engine_version, so a changed engine misses
+    instead of reading stale files.
+
+    Cached buffers are read only and shared between the AssetCashFlow objects
+    handed out, which is fine for LiabilitiesCashFlow as it copies what it needs.
+    Their build_asset_side_cashflow, build_asset_arrays, reset and seed raise
+    ValueError, rebuild on a copy of the buffer to edit one.
+
+    maxsize: int
+        number of state buffers kept in memory
+    directory: str | Path | None
+        on-disk tier, disabled when None
+    """
+
+    maxsize: int = 128
+    directory: str | Path | None = None
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    _entries: OrderedDict[str, np.ndarray] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+
+    def __post_init__(self):
+        if self.directory is not None:
+            self.directory = Path(self.directory)
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, pool_info: PoolInfo) -> AssetCashFlow:
+        """Built asset cash flows of pool_info, from the cache when possible
+
+        The returned AssetCashFlow carries pool_info itself, so its liability
+        fields are the caller's even when the buffer was built for another pool.
+        Its buffer is the read only cached one, it can be read and handed to the
+        liabilities engines but not rebuilt or seeded.
+        """
+        key = asset_key(pool_info)
+        buffer = self._entries.get(key)
+        if buffer is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return AssetCashFlow(pool_info, buffer=buffer)
+
+        buffer = self._load(key, pool_info)
+        if buffer is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            acf = AssetCashFlow(pool_info)
+            acf.build_asset_arrays()
+            buffer = acf.buffer
+            buffer.flags.writeable = False
+            self._save(key, buffer)
+        self._entries[key] = buffer
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return AssetCashFlow(pool_info, buffer=buffer)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.npy"
+
+    def _load(self, key: str, pool_info: PoolInfo) -> np.ndarray | None:
+        if self.directory is None or not self._path(key).exists():
+            return None
+        try:
+            buffer = np.load(self._path(key), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if buffer.shape != (len(ASSET_ARRAYS), pool_info.maturity + 1):
+            return None
+        return buffer
+
+    def _save(self, key: str, buffer: np.ndarray):
+        if self.directory is None:
+            return
+        # write then rename so a concurrent reader never maps a partial file
+        partial = self.directory / f"{key}.{os.getpid()}.tmp.npy"
+        np.save(partial, buffer)
+        os.replace(partial, self._path(key))
+
+    @property
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        """Empties the in-memory tier and the counters, the disk tier is kept"""
+        self._entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
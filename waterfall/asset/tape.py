@@ -0,0 +1,265 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch, ASSET_ARRAYS
+from dataclasses import dataclass, field, replace
+from typing import Mapping
+from numpy.typing import ArrayLike
+import numpy as np
+
+# loan tape columns, coupon is annual and terms are in months
+TAPE_COLUMNS = ("balance", "coupon", "remaining_term", "seasoning")
+
+
+@dataclass
+class RepLineBuckets:
+    """Bucket edges used to group loans into representative lines
+
+    A value v falls in bucket i when edges[i] <= v < edges[i + 1], values
+    outside the edges land in the first or last bucket.
+    """
+
+    coupon_edges: np.ndarray = field(
+        default_factory=lambda: np.arange(0.0, 0.3001, 0.005)
+    )
+    term_edges: np.ndarray = field(default_factory=lambda: np.arange(0, 367, 6))
+    seasoning_edges: np.ndarray = field(default_factory=lambda: np.arange(0, 121, 12))
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return (
+            len(self.coupon_edges) - 1,
+            len(self.term_edges) - 1,
+            len(self.seasoning_edges) - 1,
+        )
+
+    def index(
+        self, coupon: np.ndarray, remaining_term: np.ndarray, seasoning: np.ndarray
+    ) -> np.ndarray:
+        """flat bucket index of every loan"""
+        n_coupon, n_term, n_seasoning = self.shape
+        i = _bucket(self.coupon_edges, coupon, n_coupon)
+        j = _bucket(self.term_edges, remaining_term, n_term)
+        k = _bucket(self.seasoning_edges, seasoning, n_seasoning)
+        return (i * n_term + j) * n_seasoning + k
+
+
+@dataclass
+class RepLines:
+    """Balance weighted representative lines, one per non empty bucket
+
+    count: np.ndarray
+        number of loans in the line
+    balance: np.ndarray
+        current balance of the line
+    wac: np.ndarray
+        balance weighted annual coupon
+    remaining_term: np.ndarray
+        balance weighted remaining term in months
+    seasoning: np.ndarray
+        balance weighted loan age in months
+    """
+
+    count: np.ndarray
+    balance: np.ndarray
+    wac: np.ndarray
+    remaining_term: np.ndarray
+    seasoning: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    def pool_info_batches(self, base: PoolInfo | None = None) -> list[PoolInfoBatch]:
+        """One PoolInfoBatch per distinct rep line maturity
+
+        Each line amortizes over its rounded remaining term, so both maturity and
+        wam are set to it. Seasoning moves the line along the loss and prepayment
+        curves of base, which are measured from origination.
+        """
+        base = PoolInfo() if base is None else base
+        maturity = np.maximum(np.rint(self.remaining_term), 1).astype(int)
+        batches = []
+        for m in np.unique(maturity):
+            line = maturity == m
+            table = {
+                "num_loans": self.count[line],
+                "init_balance_per_loan": self.balance[line] / self.count[line],
+                "wac": self.wac[line],
+                "wam": m,
+                "maturity": m,
+                "loss_curve_timing": base.loss_curve_timing - self.seasoning[line],
+                "inflection_point": np.clip(
+                    base.inflection_point - np.rint(self.seasoning[line]),
+                    1,
+                    max(m - 1, 1),
+                ),
+            }
+            batches.append(PoolInfoBatch.from_table(table, base))
+        return batches
+
+
+@dataclass
+class RepLineAccumulator:
+    """Streaming group-by of loan tape chunks onto the RepLineBuckets grid
+
+    Memory is fixed by the grid, so tapes of any length can be fed chunk by
+    chunk with update and accumulators of different chunks combined with merge.
+    """
+
+    buckets: RepLineBuckets = field(default_factory=RepLineBuckets)
+    count: np.ndarray = field(init=False)
+    balance: np.ndarray = field(init=False)
+    coupon_balance: np.ndarray = field(init=False)
+    term_balance: np.ndarray = field(init=False)
+    seasoning_balance: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        size = int(np.prod(self.buckets.shape))
+        self.count = np.zeros(size)
+        self.balance = np.zeros(size)
+        self.coupon_balance = np.zeros(size)
+        self.term_balance = np.zeros(size)
+        self.seasoning_balance = np.zeros(size)
+
+    def update(
+        self,
+        balance: ArrayLike,
+        coupon: ArrayLike,
+        remaining_term: ArrayLike,
+        seasoning: ArrayLike,
+    ):
+        """Adds a chunk of loans, loans without balance or remaining term are skipped"""
+        balance = np.asarray(balance, dtype=float)
+        coupon = np.asarray(coupon, dtype=float)
+        remaining_term = np.asarray(remaining_term, dtype=float)
+        seasoning = np.asarray(seasoning, dtype=float)
+        live = (balance > 0) & (remaining_term > 0)
+        if not live.all():
+            balance, coupon = balance[live], coupon[live]
+            remaining_term, seasoning = remaining_term[live], seasoning[live]
+        index = self.buckets.index(coupon, remaining_term, seasoning)
+        size = len(self.count)
+        self.count += np.bincount(index, minlength=size)
+        self.balance += np.bincount(index, weights=balance, minlength=size)
+        self.coupon_balance += np.bincount(
+            index, weights=balance * coupon, minlength=size
+        )
+        self.term_balance += np.bincount(
+            index, weights=balance * remaining_term, minlength=size
+        )
+        self.seasoning_balance += np.bincount(
+            index, weights=balance * seasoning, minlength=size
+        )
+
+    def merge(self, other: RepLineAccumulator):
+        self.count += other.count
+        self.balance += other.balance
+        self.coupon_balance += other.coupon_balance
+        self.term_balance += other.term_balance
+        self.seasoning_balance += other.seasoning_balance
+
+    def rep_lines(self) -> RepLines:
+        line = self.balance > 0
+        balance = self.balance[line]
+        return RepLines(
+            count=self.count[line],
+            balance=balance,
+            wac=self.coupon_balance[line] / balance,
+            remaining_term=self.term_balance[line] / balance,
+            seasoning=self.seasoning_balance[line] / balance,
+        )
+
+
+def build_rep_lines(
+    tape: Mapping[str, ArrayLike],
+    buckets: RepLineBuckets | None = None,
+    chunk_size: int = 1_000_000,
+) -> RepLines:
+    """Buckets a loan tape into rep lines
+
+    Parameters
+    ----------
+    tape : Mapping[str, ArrayLike]
+        columns named in TAPE_COLUMNS, a DataFrame or structured array works too
+    buckets : RepLineBuckets | None, optional
+        the bucket grid, by default RepLineBuckets()
+    chunk_size : int, optional
+        loans grouped at a time, bounds the temporary bucket index arrays
+
+    Returns
+    -------
+    RepLines
+        one line per non empty bucket
+    """
+    accumulator = RepLineAccumulator(RepLineBuckets() if buckets is None else buckets)
+    columns = [np.asarray(tape[name]) for name in TAPE_COLUMNS]
+    for start in range(0, len(columns[0]), chunk_size):
+        accumulator.update(*(column[start : start + chunk_size] for column in columns))
+    return accumulator.rep_lines()
+
+
+def project_rep_lines(
+    rep_lines: RepLines, base: PoolInfo | None = None
+) -> AssetCashFlow:
+    """Projects every rep line and sums them into pool level asset cash flows
+
+    Lines sharing a maturity run as one AssetCashFlowBatch. Shorter lines are
+    zero after their maturity. Principal Loan Balance, a per loan amount, is
+    averaged weighted by the loans remaining in each line. A tape without a
+    loan with balance and remaining term raises ValueError.
+
+    Parameters
+    ----------
+    rep_lines : RepLines
+        the lines to project
+    base : PoolInfo | None, optional
+        credit, prepayment and liability assumptions, by default PoolInfo()
+
+    Returns
+    -------
+    AssetCashFlow
+        pool level cash flows whose pool_info summarizes the tape, it can be
+        handed to LiabilitiesCashFlow unchanged
+    """
+    if not len(rep_lines):
+        raise ValueError("the loan tape has no live loans")
+    base = PoolInfo() if base is None else base
+    batches = rep_lines.pool_info_batches(base)
+    horizon = max(batch.maturity for batch in batches)
+    pool_info = replace(
+        base,
+        num_loans=float(rep_lines.count.sum()),
+        init_balance_per_loan=rep_lines.balance.sum() / rep_lines.count.sum(),
+        wac=np.average(rep_lines.wac, weights=rep_lines.balance),
+        wam=int(
+            np.rint(np.average(rep_lines.remaining_term, weights=rep_lines.balance))
+        ),
+        maturity=horizon,
+    )
+    buffer = np.zeros((len(ASSET_ARRAYS), horizon + 1))
+    loan_balance = ASSET_ARRAYS.index("principal_loan_balance")
+    loans = ASSET_ARRAYS.index("current_loans_remaining")
+    for batch in batches:
+        acf = AssetCashFlowBatch(batch)
+        acf.build_asset_arrays()
+        # weight the per loan balance by loans remaining before summing lines
+        acf.principal_loan_balance *= acf.current_loans_remaining
+        buffer[:, : batch.maturity + 1] += acf.buffer.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        buffer[loan_balance] = np.where(
+            buffer[loans] != 0, buffer[loan_balance] / buffer[loans], 0.0
+        )
+    return AssetCashFlow(pool_info, buffer=buffer)
+
+
+def project_loan_tape(
+    tape: Mapping[str, ArrayLike],
+    base: PoolInfo | None = None,
+    buckets: RepLineBuckets | None = None,
+    chunk_size: int = 1_000_000,
+) -> AssetCashFlow:
+    """build_rep_lines followed by project_rep_lines"""
+    return project_rep_lines(build_rep_lines(tape, buckets, chunk_size), base)
+
+
+def _bucket(edges: np.ndarray, values: np.ndarray, n_bins: int) -> np.ndarray:
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
@@ -0,0 +1,333 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch, LIABILITY_FIELDS
+from waterfall.asset.asset import AssetCashFlowBatch, ASSET_ARRAYS
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlowBatch,
+    LIABILITY_ARRAYS,
+)
+from waterfall.analytics import (
+    TRANCHES,
+    TrancheMetrics,
+    analytics_frame,
+    spec_analytics,
+)
+from waterfall.liabilities.spec import (
+    DEAL_COLUMNS,
+    TRANCHE_COLUMNS,
+    SpecCashFlow,
+    WaterfallProgram,
+    WaterfallSpec,
+)
+from waterfall.montecarlo import MonteCarloResult
+from waterfall.results import FULL_PRECISION, ResultStore, ResultWriter
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Mapping, Sequence
+from numpy.typing import ArrayLike
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# (n_scenarios, T+1) float64 temporaries alive at once on top of the state
+# buffers, the asset stages peak at about six
+TEMPORARIES = 8
+# trigger metrics of the asset side a SpecCashFlow keeps for the whole run
+SPEC_TEMPORARIES = 2
+
+# sink(lcf, rows) receives every finished chunk with the table rows it holds,
+# a sink that allocates per scenario state of its own declares its
+# (n_scenarios, T+1) float64 rows as scenario_rows
+Sink = Callable[[LiabilitiesCashFlowBatch, np.ndarray], None]
+
+
+def scenario_bytes(maturity: int, extra_rows: int = 0) -> int:
+    """Working memory one scenario of the batched engines needs
+
+    extra_rows are the (T+1) float64 rows the sinks add per scenario.
+    """
+    rows = len(ASSET_ARRAYS) + len(LIABILITY_ARRAYS) + TEMPORARIES + extra_rows
+    return rows * (maturity + 1) * np.dtype(float).itemsize
+
+
+def chunk_size_for(memory_budget: int, maturity: int, extra_rows: int = 0) -> int:
+    """Largest number of scenarios of one maturity that fits in memory_budget"""
+    size = memory_budget // scenario_bytes(maturity, extra_rows)
+    if size < 1:
+        raise ValueError(
+            f"memory_budget of {memory_budget} bytes is below the "
+            f"{scenario_bytes(maturity, extra_rows)} bytes of one scenario"
+        )
+    return size
+
+
+def spec_rows(program: WaterfallProgram) -> int:
+    """(T+1) float64 rows per scenario of a SpecCashFlow running program"""
+    # the trigger states are bool, eight of them take the bytes of one row
+    triggers = -(-len(program.trigger_names) // np.dtype(float).itemsize)
+    return (
+        len(DEAL_COLUMNS)
+        + len(TRANCHE_COLUMNS) * len(program.tranche_names)
+        + triggers
+        + SPEC_TEMPORARIES
+    )
+
+
+@dataclass
+class ChunkedRunner:
+    """Runs scenario tables of any size within a memory budget
+
+    The rows of the table are grouped by maturity and split into chunks of
+    chunk_size_for(memory_budget, maturity) scenarios. Every chunk runs the
+    batched asset and waterfall engines in the same two state buffers, which
+    are allocated once and recycled, and is handed to the sinks before the
+    next one overwrites it. Only what the sinks keep outlives a chunk. The
+    scenario_rows the sinks declare, e.g. the SpecCashFlow of a MetricsSink,
+    count against memory_budget as well.
+    e.g.
+    writer = ResultWriter("results", len(table), 360, dtype="float32")
+    ChunkedRunner(memory_budget=1 << 30).run(table, [ResultSink(writer)])
+
+    base: PoolInfo
+        supplies every field missing from the table
+    memory_budget: int
+        bytes the state buffers and engine temporaries of a chunk may use
+    backend: str | None
+        waterfall backend, kernel.default_backend() if None
+    """
+
+    base: PoolInfo = field(default_factory=PoolInfo)
+    memory_budget: int = 1 << 30
+    backend: str | None = None
+    _asset_buffer: np.ndarray = field(
+        default_factory=lambda: np.empty(0), init=False, repr=False
+    )
+    _liability_buffer: np.ndarray = field(
+        default_factory=lambda: np.empty(0), init=False, repr=False
+    )
+
+    def chunks(
+        self, table: Mapping[str, ArrayLike], extra_rows: int = 0
+    ) -> Iterator[np.ndarray]:
+        """Row numbers of every chunk, in table order within each maturity
+
+        extra_rows are the per scenario rows of the sinks, see scenario_bytes.
+        """
+        table = _columns(table)
+        n = len(next(iter(table.values()))) if table else 1
+        if "maturity" in table:
+            maturities = table["maturity"]
+        else:
+            maturities = np.full(n, self.base.maturity)
+        for maturity in np.unique(maturities):
+            rows = np.flatnonzero(maturities == maturity)
+            size = chunk_size_for(self.memory_budget, int(maturity), extra_rows)
+            for start in range(0, len(rows), size):
+                yield rows[start : start + size]
+
+    def run(self, table: Mapping[str, ArrayLike], sinks: Sequence[Sink]) -> int:
+        """Streams every chunk of the table through the sinks
+
+        Parameters
+        ----------
+        table : Mapping[str, ArrayLike]
+            PoolInfo field name -> one value per scenario, a DataFrame works too
+        sinks : Sequence[Sink]
+            called as sink(lcf, rows) once per chunk, lcf is only valid
+            during the call
+
+        Returns
+        -------
+        int
+            number of scenarios run
+        """
+        names = {f.name for f in fields(PoolInfo) if f.init}
+        columns = _columns(table)
+        unknown = set(columns) - names
+        if unknown:
+            raise ValueError(f"unknown PoolInfo fields {sorted(unknown)}")
+        extra_rows = sum(getattr(sink, "scenario_rows", 0) for sink in sinks)
+        done = 0
+        for rows in self.chunks(columns, extra_rows):
+            batch = PoolInfoBatch.from_table(
+                {name: column[rows] for name, column in columns.items()}, self.base
+            )
+            periods = batch.maturity + 1
+            acf = AssetCashFlowBatch(
+                batch, buffer=self._buffer("_asset_buffer", ASSET_ARRAYS, rows, periods)
+            )
+            # the asset stages only write part of some rows
+            acf.reset()
+            acf.build_asset_arrays()
+            lcf = LiabilitiesCashFlowBatch(
+                acf,
+                buffer=self._buffer(
+                    "_liability_buffer", LIABILITY_ARRAYS, rows, periods
+                ),
+                backend=self.backend,
+            )
+            lcf.build_waterfall_engine()
+            for sink in sinks:
+                sink(lcf, rows)
+            done += len(rows)
+        return done
+
+    def _buffer(
+        self, name: str, arrays: tuple[str, ...], rows: np.ndarray, periods: int
+    ) -> np.ndarray:
+        """(len(arrays), len(rows), periods) contiguous view of a recycled buffer"""
+        shape = (len(arrays), len(rows), periods)
+        size = int(np.prod(shape))
+        if getattr(self, name).size < size:
+            setattr(self, name, np.empty(size))
+        return getattr(self, name)[:size].reshape(shape)
+
+
+@dataclass
+class ResultSink:
+    """Writes every chunk into a ResultWriter at the table rows it holds
+
+    The writer has one maturity, so the table must have one too.
+    """
+
+    writer: ResultWriter
+
+    def __call__(self, lcf: LiabilitiesCashFlowBatch, rows: np.ndarray):
+        if np.any(np.diff(rows) != 1):
+            raise ValueError("a ResultWriter needs the rows of a single maturity table")
+        self.writer.write(lcf, int(rows[0]))
+
+
+@dataclass
+class MetricsSink:
+    """Collects the TrancheMetrics of every scenario of the table
+
+    The metrics are measured on the SpecCashFlow engine of spec run over the
+    asset side of every chunk, as in montecarlo, the legacy waterfall never
+    pays class A any principal.
+
+    n_scenarios: int
+        number of rows of the table
+    periods_per_year: int
+        payment frequency used by the metrics
+    spec: WaterfallSpec | None
+        priority of payments, WaterfallSpec.from_pool_info of the deal of every
+        chunk if None, which needs the liability fields to be the same across
+        the chunk
+    """
+
+    n_scenarios: int
+    periods_per_year: int = 12
+    spec: WaterfallSpec | None = None
+    metrics: dict[str, TrancheMetrics] = field(init=False)
+
+    def __post_init__(self):
+        self._program = None if self.spec is None else self.spec.compile()
+        names = TRANCHES if self._program is None else self._program.tranche_names
+        self.metrics = {
+            name: TrancheMetrics(
+                *(np.full(self.n_scenarios, np.nan) for _ in fields(TrancheMetrics))
+            )
+            for name in names
+        }
+
+    @property
+    def scenario_rows(self) -> int:
+        """rows per scenario of the SpecCashFlow built for every chunk"""
+        if self._program is None:
+            return spec_rows(WaterfallSpec.from_pool_info(PoolInfo()).compile())
+        return spec_rows(self._program)
+
+    def __call__(self, lcf: LiabilitiesCashFlowBatch, rows: np.ndarray):
+        program = self._program
+        if program is None:
+            program = WaterfallSpec.from_pool_info(_deal(lcf.pool_info)).compile()
+        cf = SpecCashFlow(lcf.asset_cf, program)
+        cf.build_waterfall_engine()
+        chunk = spec_analytics(cf, self.periods_per_year)
+        for name, metrics in chunk.items():
+            for f in fields(TrancheMetrics):
+                getattr(self.metrics[name], f.name)[rows] = getattr(metrics, f.name)
+
+    def frame(self) -> pd.DataFrame:
+        return analytics_frame(self.metrics)
+
+
+@dataclass
+class AggregatorSink:
+    """Running tranche loss and WAL statistics of the table, see montecarlo
+
+    The statistics are measured on the SpecCashFlow engine of spec run over
+    the asset side of every chunk, or on the legacy waterfall of the chunk
+    when spec is None, whose class A never receives principal.
+    """
+
+    wal_edges: np.ndarray
+    impairment_tolerance: float = 1e-6
+    spec: WaterfallSpec | None = None
+    result: MonteCarloResult = field(init=False)
+
+    def __post_init__(self):
+        self._program = None if self.spec is None else self.spec.compile()
+        names = TRANCHES if self._program is None else self._program.tranche_names
+        self.result = MonteCarloResult.empty(
+            names, self.wal_edges, self.impairment_tolerance
+        )
+
+    @property
+    def scenario_rows(self) -> int:
+        """rows per scenario of the SpecCashFlow built for every chunk"""
+        return 0 if self._program is None else spec_rows(self._program)
+
+    def __call__(self, lcf: LiabilitiesCashFlowBatch, rows: np.ndarray):
+        if self._program is None:
+            self.result.update(lcf)
+            return
+        cf = SpecCashFlow(lcf.asset_cf, self._program)
+        cf.build_waterfall_engine()
+        self.result.update(cf)
+
+
+def write_chunked(
+    table: Mapping[str, ArrayLike],
+    directory: str | Path,
+    base: PoolInfo | None = None,
+    memory_budget: int = 1 << 30,
+    dtype: str = "float64",
+) -> ResultStore:
+    """Runs a single maturity table chunk by chunk straight into a ResultWriter
+
+    Parameters
+    ----------
+    dtype : str, optional
+        "float32" stores every column but the balances and running totals of
+        FULL_PRECISION in single precision, the engines always run in float64
+    """
+    base = PoolInfo() if base is None else base
+    table = _columns(table)
+    n_scenarios = len(next(iter(table.values()))) if table else 1
+    maturities = np.unique(table.get("maturity", base.maturity))
+    if len(maturities) != 1:
+        raise ValueError(
+            f"a result directory needs exactly one maturity, got {maturities.tolist()}"
+        )
+    full_precision = FULL_PRECISION if dtype != "float64" else ()
+    with ResultWriter(
+        directory, n_scenarios, int(maturities[0]), dtype, full_precision
+    ) as writer:
+        ChunkedRunner(base, memory_budget).run(table, [ResultSink(writer)])
+    return ResultStore(directory)
+
+
+def _deal(batch: PoolInfoBatch) -> PoolInfo:
+    """the PoolInfo of a batch whose liability fields are the same in every row"""
+    varying = [name for name in LIABILITY_FIELDS if np.ptp(getattr(batch, name))]
+    if varying:
+        raise ValueError(
+            f"{varying} vary across the scenarios, give MetricsSink a spec"
+        )
+    return batch.scenario(0)
+
+
+def _columns(table: Mapping[str, ArrayLike]) -> dict[str, np.ndarray]:
+    return {name: np.asarray(table[name]) for name in table.keys()}
@@ -0,0 +1,252 @@
+"""Batch runner of scenario files
+
+    python -m waterfall.cli scenarios.csv results/ --chunk-size 5000 --workers 8
+
+Every row of the scenario file holds PoolInfo overrides of one scenario, fields
+not given keep the value of the base deal. Rows are grouped by maturity and
+split into shards of at most chunk-size rows, each shard runs the batched asset
+and waterfall engines in a worker process and is written as a ResultWriter
+directory results/shard-<n>/ holding the original row numbers in scenarios.npy.
+A finished shard gets a _SUCCESS marker, rerunning the same command skips
+those shards so an interrupted run resumes where it stopped. The manifest of
+the output directory holds a hash of the scenario rows, a run over a changed
+scenario file is refused instead of mixing its shards with the earlier ones.
+"""
+
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.results import ResultStore, ResultWriter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+import argparse
+import hashlib
+import json
+import sys
+import time
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MANIFEST = "manifest.json"
+SUCCESS = "_SUCCESS"
+
+
+@dataclass
+class Shard:
+    """One chunk of scenario rows sharing a maturity
+
+    name: str
+        directory of the shard under the output directory
+    maturity: int
+        maturity of every scenario in the shard
+    rows: np.ndarray
+        row numbers of the scenarios in the scenario file
+    """
+
+    name: str
+    maturity: int
+    rows: np.ndarray
+
+
+def plan_shards(
+    scenarios: pd.DataFrame, base: PoolInfo, chunk_size: int
+) -> list[Shard]:
+    """Splits the scenario rows into shards, deterministic for a given file"""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if "maturity" in scenarios:
+        maturities = scenarios["maturity"].to_numpy()
+    else:
+        maturities = np.full(len(scenarios), base.maturity)
+    shards = []
+    for maturity in np.unique(maturities):
+        rows = np.flatnonzero(maturities == maturity)
+        for start in range(0, len(rows), chunk_size):
+            shards.append(
+                Shard(
+                    f"shard-{len(shards):05d}",
+                    int(maturity),
+                    rows[start : start + chunk_size],
+                )
+            )
+    return shards
+
+
+def run_shard(task: tuple) -> int:
+    """Runs and writes one shard, returns its number of scenarios"""
+    table, base, maturity, rows, directory = task
+    directory = Path(directory)
+    batch = PoolInfoBatch.from_table(table, base)
+    acf = AssetCashFlowBatch(batch)
+    acf.build_asset_arrays()
+    lcf = LiabilitiesCashFlowBatch(acf)
+    lcf.build_waterfall_engine()
+    with ResultWriter(directory, len(rows), maturity) as writer:
+        writer.write(lcf)
+    np.save(directory / "scenarios.npy", rows)
+    (directory / SUCCESS).touch()
+    return len(rows)
+
+
+def run_batch(
+    scenarios: pd.DataFrame,
+    output: str | Path,
+    base: PoolInfo | None = None,
+    chunk_size: int = 5_000,
+    max_workers: int | None = None,
+) -> dict[str, float]:
+    """Runs every shard of the scenario table that has not finished yet
+
+    Parameters
+    ----------
+    scenarios : pd.DataFrame
+        one row of PoolInfo overrides per scenario
+    output : str | Path
+        directory of the shards, reused to resume an earlier run
+    base : PoolInfo | None, optional
+        supplies every field missing from the table, by default PoolInfo()
+    chunk_size : int, optional
+        maximum number of scenarios per shard
+    max_workers : int | None, optional
+        size of the process pool, 1 runs every shard in this process
+
+    Returns
+    -------
+    dict[str, float]
+        scenarios run and skipped, elapsed seconds and scenarios per second
+    """
+    base = PoolInfo() if base is None else base
+    names = {f.name for f in fields(PoolInfo) if f.init}
+    unknown = set(scenarios.columns) - names
+    if unknown:
+        raise ValueError(f"unknown PoolInfo fields {sorted(unknown)}")
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    shards = plan_shards(scenarios, base, chunk_size)
+    _check_manifest(output, scenarios, base, chunk_size)
+
+    start = time.perf_counter()
+    pending = [
+        shard for shard in shards if not (output / shard.name / SUCCESS).exists()
+    ]
+    skipped = sum(len(shard.rows) for shard in shards) - sum(
+        len(shard.rows) for shard in pending
+    )
+    tasks = [
+        (
+            {
+                column: scenarios[column].to_numpy()[shard.rows]
+                for column in scenarios.columns
+            },
+            base,
+            shard.maturity,
+            shard.rows,
+            output / shard.name,
+        )
+        for shard in pending
+    ]
+    done = 0
+    if max_workers == 1:
+        for task in tasks:
+            done += run_shard(task)
+            _progress(done, len(scenarios) - skipped, start)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for future in as_completed(executor.submit(run_shard, t) for t in tasks):
+                done += future.result()
+                _progress(done, len(scenarios) - skipped, start)
+    elapsed = time.perf_counter() - start
+    return {
+        "scenarios": done,
+        "skipped": skipped,
+        "shards": len(pending),
+        "seconds": elapsed,
+        "scenarios_per_second": done / elapsed if elapsed > 0 else float("nan"),
+    }
+
+
+def iter_shards(output: str | Path) -> Iterator[tuple[np.ndarray, ResultStore]]:
+    """(scenario rows, results) of every finished shard of a batch run"""
+    for directory in sorted(Path(output).glob("shard-*")):
+        if (directory / SUCCESS).exists():
+            yield np.load(directory / "scenarios.npy"), ResultStore(directory)
+
+
+def main(argv: list[str] | None = None) -> int:
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(
+        prog="python -m waterfall.cli", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("scenarios", type=Path, help="scenario file, .csv")
+    parser.add_argument("output", type=Path, help="directory of the result shards")
+    parser.add_argument("--base", type=Path, help="JSON of base PoolInfo overrides")
+    parser.add_argument("--chunk-size", type=int, default=5_000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    base = PoolInfo()
+    if args.base is not None:
+        base = PoolInfo(**json.loads(args.base.read_text()))
+    scenarios = pd.read_csv(args.scenarios)
+    try:
+        summary = run_batch(scenarios, args.output, base, args.chunk_size, args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+    print(
+        f"ran {summary['scenarios']} scenarios in {summary['shards']} shards, "
+        f"skipped {summary['skipped']} already finished, "
+        f"{summary['seconds']:.2f}s, "
+        f"{summary['scenarios_per_second']:.1f} scenarios/sec"
+    )
+    return 0
+
+
+def _check_manifest(
+    output: Path, scenarios: pd.DataFrame, base: PoolInfo, chunk_size: int
+):
+    """Records the run settings, a resumed run must use the same ones"""
+    manifest = {
+        "n_scenarios": len(scenarios),
+        "scenarios_sha256": _scenario_hash(scenarios),
+        "chunk_size": chunk_size,
+        "base": {f.name: getattr(base, f.name) for f in fields(base) if f.init},
+    }
+    path = output / MANIFEST
+    if path.exists():
+        previous = json.loads(path.read_text())
+        if previous.get("scenarios_sha256") != manifest["scenarios_sha256"]:
+            raise ValueError(
+                f"{output} holds a run of other scenarios, use a new directory"
+            )
+        if previous != json.loads(json.dumps(manifest)):
+            raise ValueError(
+                f"{output} holds a run with other settings, use a new directory"
+            )
+    else:
+        path.write_text(json.dumps(manifest, indent=2))
+
+
+def _scenario_hash(scenarios: pd.DataFrame) -> str:
+    """sha256 of the column names and values of every scenario row, in order"""
+    import pandas as pd
+
+    digest = hashlib.sha256(json.dumps(list(map(str, scenarios.columns))).encode())
+    rows = pd.util.hash_pandas_object(scenarios, index=False)
+    digest.update(rows.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _progress(done: int, total: int, start: float):
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else float("nan")
+    print(f"{done}/{total} scenarios, {rate:.1f} scenarios/sec", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Client of the waterfall.service pricing server
+
+Only imports the standard library, so notebooks and tools do not pay for
+NumPy, pandas or the engines.
+e.g.
+async with Client(port=8765) as client:
+    quote = await client.price(wac=0.1, cumulative_default_rate=0.05)
+    quotes = await client.price_many([{"wac": 0.1}, {"wac": 0.11}])
+"""
+
+from __future__ import annotations
+from typing import Any, Sequence
+import asyncio
+import itertools
+import json
+
+
+class Client:
+    """Asyncio JSON lines client, requests on one connection run concurrently"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765):
+        self.host = host
+        self.port = port
+        self._ids = itertools.count()
+        self._waiting: dict[int, asyncio.Future] = {}
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._listener: asyncio.Task | None = None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._listener.cancel()
+        self._writer = None
+
+    async def __aenter__(self) -> Client:
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def price(self, **overrides) -> dict[str, Any]:
+        """Quote of the PoolInfo with the given overrides of the default deal"""
+        return (await self._request({"pool_info": overrides}))["quote"]
+
+    async def price_many(self, deals: Sequence[dict]) -> list[dict[str, Any]]:
+        return list(await asyncio.gather(*(self.price(**deal) for deal in deals)))
+
+    async def stats(self) -> dict[str, float | None]:
+        return (await self._request({"stats": True}))["stats"]
+
+    async def _request(self, request: dict) -> dict:
+        if self._writer is None:
+            raise RuntimeError("the client is not connected, call connect()")
+        request["id"] = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request["id"]] = future
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        await self._writer.drain()
+        response = await future
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    async def _listen(self):
+        while line := await self._reader.readline():
+            response = json.loads(line)
+            future = self._waiting.pop(response["id"], None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self._waiting.values():
+            future.set_exception(ConnectionError("the pricing server went away"))
+        self._waiting.clear()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo
+from waterfall.asset.tape import TAPE_COLUMNS, RepLineAccumulator
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Iterator, Mapping
+import math
+import numpy as np
+
+
+def iter_tape_chunks(
+    path: str | Path,
+    chunk_size: int = 500_000,
+    column_map: Mapping[str, str] | None = None,
+) -> Iterator[dict[str, np.ndarray]]:
+    """Reads a loan tape in fixed size chunks
+
+    A .csv tape is parsed chunk by chunk, a .npy structured array is memory
+    mapped and sliced, so peak memory follows chunk_size and not the tape size.
+
+    Parameters
+    ----------
+    path : str | Path
+        the loan tape, .csv or .npy
+    chunk_size : int, optional
+        number of loans per chunk
+    column_map : Mapping[str, str] | None, optional
+        TAPE_COLUMNS name -> column name in the tape, when they differ
+
+    Yields
+    ------
+    dict[str, np.ndarray]
+        TAPE_COLUMNS name -> float64 values of the chunk
+    """
+    path = Path(path)
+    names = {name: name for name in TAPE_COLUMNS}
+    names.update(column_map or {})
+    if path.suffix == ".csv":
+        import pandas as pd
+
+        reader = pd.read_csv(
+            path,
+            usecols=list(names.values()),
+            dtype={column: "float64" for column in names.values()},
+            chunksize=chunk_size,
+        )
+        with reader:
+            for frame in reader:
+                yield {name: frame[column].to_numpy() for name, column in names.items()}
+    elif path.suffix == ".npy":
+        tape = np.load(path, mmap_mode="r")
+        for start in range(0, len(tape), chunk_size):
+            chunk = tape[start : start + chunk_size]
+            yield {
+                name: np.asarray(chunk[column], dtype=float)
+                for name, column in names.items()
+            }
+    else:
+        raise ValueError(f"unsupported loan tape format {path.suffix!r}")
+
+
+@dataclass
+class TapeStatistics:
+    """One pass, balance weighted statistics of a loan tape"""
+
+    num_loans: int = 0
+    balance: float = 0.0
+    coupon_balance: float = 0.0
+    term_balance: float = 0.0
+    max_term: float = 0.0
+
+    def update(self, chunk: Mapping[str, np.ndarray]):
+        """Adds a chunk, loans without balance or remaining term are skipped"""
+        balance = chunk["balance"]
+        term = chunk["remaining_term"]
+        live = (balance > 0) & (term > 0)
+        balance, term = balance[live], term[live]
+        # python scalars, so the PoolInfo built from them serializes as is
+        self.num_loans += int(live.sum())
+        self.balance += float(balance.sum())
+        self.coupon_balance += float((balance * chunk["coupon"][live]).sum())
+        self.term_balance += float((balance * term).sum())
+        if term.size:
+            self.max_term = max(self.max_term, float(term.max()))
+
+    def pool_info(self, base: PoolInfo | None = None) -> PoolInfo:
+        """PoolInfo of the tape, every other assumption comes from base
+
+        wam is the balance weighted remaining term and maturity the longest
+        remaining term, the pool runs off over the latter.
+        """
+        if self.num_loans == 0:
+            raise ValueError("the loan tape has no live loans")
+        base = PoolInfo() if base is None else base
+        return replace(
+            base,
+            num_loans=self.num_loans,
+            wac=self.coupon_balance / self.balance,
+            wam=round(self.term_balance / self.balance),
+            init_balance_per_loan=self.balance / self.num_loans,
+            maturity=math.ceil(self.max_term),
+        )
+
+
+def ingest_tape(
+    path: str | Path,
+    base: PoolInfo | None = None,
+    chunk_size: int = 500_000,
+    column_map: Mapping[str, str] | None = None,
+    rep_lines: RepLineAccumulator | None = None,
+) -> PoolInfo:
+    """Streams a loan tape once and emits a populated PoolInfo
+
+    Parameters
+    ----------
+    path : str | Path
+        the loan tape, .csv or .npy
+    base : PoolInfo | None, optional
+        supplies the credit, prepayment and liability assumptions
+    chunk_size : int, optional
+        number of loans per chunk
+    column_map : Mapping[str, str] | None, optional
+        TAPE_COLUMNS name -> column name in the tape, when they differ
+    rep_lines : RepLineAccumulator | None, optional
+        also bucketed into rep lines in the same pass when given
+
+    Returns
+    -------
+    PoolInfo
+        num_loans, wac, wam, init_balance_per_loan and maturity of the tape
+    """
+    statistics = TapeStatistics()
+    for chunk in iter_tape_chunks(path, chunk_size, column_map):
+        statistics.update(chunk)
+        if rep_lines is not None:
+            rep_lines.update(*(chunk[name] for name in TAPE_COLUMNS))
+    return statistics.pool_info(base)
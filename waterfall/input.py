@@ -1,4 +1,8 @@
-from dataclasses import dataclass, field
+from __future__ import annotations
+from dataclasses import dataclass, field, fields
+from typing import Mapping, Sequence
+from numpy.typing import ArrayLike
+import numpy as np
 import math
 
 
@@ -21,6 +25,10 @@ class PoolInfo:
         loss given default
     periodic_coupon: float
         wac / 12 (annualized)
+    loss_curve_timing: float
+        the month t0 where the logistic credit loss curve is steepest
+    loss_curve_steepness: float
+        the steepness c of the logistic credit loss curve
     """
 
     num_loans: int = 16378
@@ -48,11 +56,19 @@ class PoolInfo:
     time_decay: int = 3
     total_loans_prepay_on_recovery: float = field(init=False)
 
+    # logistic credit loss curve, t0 is the month of steepest losses and
+    # c the steepness (parameters from elements of structured finance)
+    loss_curve_timing: float = 55
+    loss_curve_steepness: float = 0.1
+
     # Liabilities
     servicing_fee: float = 0.01
     servicing_fee_short_fall_rate: float = 0.001
     class_a_interest: float = 0.03
     class_b_interest: float = 0.06
+    # note balances at closing
+    class_a_principal_balance: float = 85340000
+    class_b_principal_balance: float = 16411000
     # advance rate assume 80%
     alpha: float = 0.8
 
@@ -72,3 +88,165 @@ class PoolInfo:
             math.pow(self.inflection_point, 2) * 0.5
             + (self.maturity - self.inflection_point) * self.inflection_point
         )
+
+
+# PoolInfo fields read by the asset side, everything else only feeds the liabilities
+ASSET_FIELDS = (
+    "num_loans",
+    "wac",
+    "wam",
+    "cumulative_default_rate",
+    "lgd",
+    "init_balance_per_loan",
+    "maturity",
+    "initial_recovery",
+    "inflection_point",
+    "time_decay",
+    "loss_curve_timing",
+    "loss_curve_steepness",
+)
+LIABILITY_FIELDS = (
+    "servicing_fee",
+    "servicing_fee_short_fall_rate",
+    "class_a_interest",
+    "class_b_interest",
+    "class_a_principal_balance",
+    "class_b_principal_balance",
+    "alpha",
+    "eligible_investment_rate",
+    "target_reserve_percentage",
+)
+
+
+@dataclass
+class PoolInfoBatch:
+    """Pool information for a batch of scenarios sharing a common maturity
+
+    Every scenario field is a column vector of shape (n_scenarios, 1) so it
+    broadcasts against the period axis of the batched cash flow arrays.
+    The derived fields follow the same formulas as PoolInfo.
+    Build it from PoolInfo objects with from_pool_infos or from a table of
+    PoolInfo overrides with from_table.
+    """
+
+    num_loans: np.ndarray
+    wac: np.ndarray
+    wam: np.ndarray
+    cumulative_default_rate: np.ndarray
+    lgd: np.ndarray
+    init_balance_per_loan: np.ndarray
+    maturity: int
+    initial_recovery: np.ndarray
+    inflection_point: np.ndarray
+    time_decay: np.ndarray
+    loss_curve_timing: np.ndarray
+    loss_curve_steepness: np.ndarray
+    servicing_fee: np.ndarray
+    servicing_fee_short_fall_rate: np.ndarray
+    class_a_interest: np.ndarray
+    class_b_interest: np.ndarray
+    class_a_principal_balance: np.ndarray
+    class_b_principal_balance: np.ndarray
+    alpha: np.ndarray
+    eligible_investment_rate: np.ndarray
+    target_reserve_percentage: np.ndarray
+    n_scenarios: int = field(init=False)
+    periodic_coupon: np.ndarray = field(init=False)
+    expected_loss: np.ndarray = field(init=False)
+    init_pool_balance: np.ndarray = field(init=False)
+    periodic_payment: np.ndarray = field(init=False)
+    cumulative_prepayment_curve_slope: np.ndarray = field(init=False)
+    total_loans_prepay_on_recovery: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        names = _scenario_fields()
+        values = [np.asarray(getattr(self, name), dtype=float) for name in names]
+        sizes = {value.size for value in values} - {1}
+        if len(sizes) > 1:
+            raise ValueError(f"scenario fields have mismatched lengths {sizes}")
+        self.n_scenarios = sizes.pop() if sizes else 1
+        for name, value in zip(names, values):
+            setattr(
+                self, name, np.broadcast_to(value.reshape(-1, 1), (self.n_scenarios, 1))
+            )
+
+        self.periodic_coupon = self.wac / 12
+        self.expected_loss = self.cumulative_default_rate * self.num_loans
+        self.init_pool_balance = self.num_loans * self.init_balance_per_loan
+        self.periodic_payment = (self.init_balance_per_loan * self.periodic_coupon) / (
+            1 - np.pow(1 + self.periodic_coupon, -self.maturity)
+        )
+        self.total_loans_prepay_on_recovery = self.initial_recovery * self.num_loans
+        self.cumulative_prepayment_curve_slope = self.total_loans_prepay_on_recovery / (
+            np.pow(self.inflection_point, 2) * 0.5
+            + (self.maturity - self.inflection_point) * self.inflection_point
+        )
+
+    @classmethod
+    def from_pool_infos(cls, pool_infos: Sequence[PoolInfo]) -> PoolInfoBatch:
+        """Stacks PoolInfo objects into a batch, they must share the same maturity"""
+        maturities = {pool_info.maturity for pool_info in pool_infos}
+        if len(maturities) != 1:
+            raise ValueError(
+                f"a batch needs exactly one maturity, got {sorted(maturities)}"
+            )
+        data = {
+            name: np.array([getattr(pool_info, name) for pool_info in pool_infos])
+            for name in _scenario_fields()
+        }
+        return cls(maturity=maturities.pop(), **data)
+
+    @classmethod
+    def from_table(
+        cls, table: Mapping[str, ArrayLike], base: PoolInfo | None = None
+    ) -> PoolInfoBatch:
+        """Builds a batch from columns of PoolInfo overrides
+
+        Parameters
+        ----------
+        table : Mapping[str, ArrayLike]
+            PoolInfo field name -> one value per scenario, a pandas DataFrame works too
+        base : PoolInfo | None, optional
+            supplies every field missing from the table, by default PoolInfo()
+
+        Returns
+        -------
+        PoolInfoBatch
+            one scenario per row of the table
+        """
+        base = PoolInfo() if base is None else base
+        names = _scenario_fields()
+        unknown = set(table.keys()) - set(names) - {"maturity"}
+        if unknown:
+            raise ValueError(f"unknown PoolInfo fields {sorted(unknown)}")
+        maturity = base.maturity
+        if "maturity" in table:
+            maturities = np.unique(np.asarray(table["maturity"]))
+            if len(maturities) != 1:
+                raise ValueError(
+                    f"a batch needs exactly one maturity, got {maturities.tolist()}"
+                )
+            maturity = int(maturities[0])
+        data = {
+            name: np.asarray(table[name]) if name in table else getattr(base, name)
+            for name in names
+        }
+        return cls(maturity=maturity, **data)
+
+    def scenario(self, i: int) -> PoolInfo:
+        """The PoolInfo of the i-th scenario"""
+        types = {f.name: f.type for f in fields(PoolInfo)}
+        data = {}
+        for name in _scenario_fields():
+            value = getattr(self, name)[i, 0].item()
+            if types[name] == "int" and value.is_integer():
+                value = int(value)
+            data[name] = value
+        return PoolInfo(maturity=self.maturity, **data)
+
+
+def _scenario_fields() -> tuple[str, ...]:
+    """names of the PoolInfoBatch fields that vary by scenario"""
+    return tuple(
+        f.name for f in fields(PoolInfoBatch) if f.init and f.name != "maturity"
+    )
@@ -0,0 +1,214 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Callable, Iterator, Protocol
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class StageRecord:
+    """Timing of one call of an instrumented stage
+
+    stage: str
+        name of the method or block, e.g. build_waterfall_engine
+    owner: str
+        class of the instance the stage ran on, empty for blocks
+    wall_time: float
+        elapsed seconds, including nested stages
+    call: int
+        how many times the stage has run since instrumentation was enabled
+    depth: int
+        number of instrumented stages the call is nested in
+    peak_memory: int | None
+        peak bytes allocated above the start of the call, None unless memory
+        tracing was requested
+    """
+
+    stage: str
+    owner: str
+    wall_time: float
+    call: int
+    depth: int
+    peak_memory: int | None = None
+
+
+class Sink(Protocol):
+    def emit(self, record: StageRecord): ...
+
+
+@dataclass
+class MemorySink:
+    """Keeps every record in memory"""
+
+    records: list[StageRecord] = field(default_factory=list)
+
+    def emit(self, record: StageRecord):
+        self.records.append(record)
+
+    def summary(self) -> pd.DataFrame:
+        """Calls, total and mean wall time and largest peak of every stage"""
+        import pandas as pd
+
+        frame = pd.DataFrame([asdict(record) for record in self.records])
+        if frame.empty:
+            return frame
+        return frame.groupby(["owner", "stage"], sort=False).agg(
+            calls=("wall_time", "size"),
+            total_time=("wall_time", "sum"),
+            mean_time=("wall_time", "mean"),
+            peak_memory=("peak_memory", "max"),
+        )
+
+
+@dataclass
+class LoggingSink:
+    """Logs every record as a structured message"""
+
+    logger: logging.Logger = field(
+        default_factory=lambda: logging.getLogger("waterfall.instrumentation")
+    )
+    level: int = logging.DEBUG
+
+    def emit(self, record: StageRecord):
+        if self.logger.isEnabledFor(self.level):
+            name = f"{record.owner}.{record.stage}" if record.owner else record.stage
+            self.logger.log(
+                self.level,
+                "%s took %.6fs",
+                name,
+                record.wall_time,
+                extra={"stage_record": asdict(record)},
+            )
+
+
+class JsonLinesSink:
+    """Appends every record as one JSON object per line"""
+
+    def __init__(self, target: str | Path | IO[str]):
+        self._owned = isinstance(target, (str, Path))
+        self.file = open(target, "a") if self._owned else target
+
+    def emit(self, record: StageRecord):
+        self.file.write(json.dumps(asdict(record)) + "\n")
+
+    def close(self):
+        if self._owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+# module state, read on every call of an instrumented stage
+_sink: Sink | None = None
+_trace_memory = False
+# whether enable started tracemalloc, so disable stops it again
+_started_tracing = False
+_calls: dict[tuple[str, str], int] = {}
+_local = threading.local()
+
+
+def enable(sink: Sink, memory: bool = False):
+    """Routes the records of every instrumented stage to sink
+
+    memory=True also measures peak allocations with tracemalloc, which slows
+    the stages down noticeably. tracemalloc is started if needed, and then
+    stopped again by disable.
+    """
+    global _sink, _trace_memory, _started_tracing
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    _sink, _trace_memory = sink, memory
+    _calls.clear()
+
+
+def disable():
+    """Stops recording, and tracemalloc if enable started it"""
+    global _sink, _trace_memory, _started_tracing
+    _sink, _trace_memory = None, False
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+@contextmanager
+def instrument(sink: Sink | None = None, memory: bool = False) -> Iterator[Sink]:
+    """Enables instrumentation for the block, by default into a MemorySink
+
+    e.g.
+    with instrument() as records:
+        acf.build_asset_side_cashflow()
+    records.summary()
+    """
+    sink = MemorySink() if sink is None else sink
+    enable(sink, memory)
+    try:
+        yield sink
+    finally:
+        disable()
+
+
+def instrumented(method: Callable) -> Callable:
+    """Decorates a build_* method so its calls are recorded while enabled
+
+    A disabled call costs one global lookup on top of the method itself.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if _sink is None:
+            return method(self, *args, **kwargs)
+        with stage(method.__name__, type(self).__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def stage(name: str, owner: str = "") -> Iterator[None]:
+    """Records a block of code, such as an export, as a stage while enabled"""
+    sink = _sink
+    if sink is None:
+        yield
+        return
+    stack = _local.__dict__.setdefault("stack", [])
+    memory = _trace_memory and tracemalloc.is_tracing()
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # the peak so far belongs to the enclosing stage
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+    frame = [current if memory else 0, 0]
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - start
+        stack.pop()
+        peak_memory = None
+        if memory:
+            peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+            peak_memory = max(peak - frame[0], 0)
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+        key = (owner, name)
+        _calls[key] = _calls.get(key, 0) + 1
+        sink.emit(
+            StageRecord(name, owner, wall_time, _calls[key], len(stack), peak_memory)
+        )
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the numpy engine is used without it
+    njit = None
+
+# "numpy" runs the statement by statement engines of LiabilitiesCashFlow,
+# "numba" the compiled scalar kernel below
+BACKENDS = ("numpy", "numba")
+_default_backend = "numba" if njit is not None else "numpy"
+
+
+def available_backends() -> tuple[str, ...]:
+    return BACKENDS if njit is not None else ("numpy",)
+
+
+def default_backend() -> str:
+    return _default_backend
+
+
+def set_default_backend(backend: str):
+    """Selects the backend of LiabilitiesCashFlow objects created without one"""
+    global _default_backend
+    _default_backend = resolve_backend(backend)
+
+
+def resolve_backend(backend: str | None) -> str:
+    """backend, or the default one for None, checked to be available"""
+    backend = _default_backend if backend is None else backend
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+    if backend not in available_backends():
+        raise ValueError(f"the {backend} backend needs the {backend} package")
+    return backend
+
+
+def waterfall_recursion(
+    pool_balance,
+    asset_available_funds,
+    total_principal_due,
+    cumulative_principal_due,
+    sf_rate,
+    sf_short_fall_growth,
+    rb_rate,
+    rb_growth,
+    re_growth,
+    class_a_beginning_balance,
+    sf_amount_due,
+    sf_amount_paid,
+    sf_short_fall,
+    sf_available_funds,
+    a_interest_raf,
+    b_interest_due,
+    b_interest_paid,
+    b_interest_short_fall,
+    b_interest_raf,
+    a_principal_due,
+    a_principal_paid,
+    a_principal_short_fall,
+    a_ending_balance,
+    a_principal_raf,
+    b_principal_due,
+    b_principal_paid,
+    b_principal_short_fall,
+    b_ending_balance,
+    b_principal_raf,
+    ra_beg_balance,
+    ra_end_balance,
+    ra_account_draw,
+    ra_contribution,
+    ra_target,
+    ra_collection,
+    start,
+    input_end,
+    tolerance,
+    payoff_period,
+):
+    """Period recursion of LiabilitiesCashFlow.build_waterfall_engine on scalars
+
+    Every array is (n_scenarios, T+1) and the rates are (n_scenarios,). The
+    statements follow the numpy engines one for one, lagged t - 1 writes
+    included, so both backends give the same numbers. The outputs are expected
+    to be reset and the ending balances initialized at t = 0, or seeded up to
+    start from which the recursion resumes at start + 1. A scenario stops
+    at the first t from input_end[s] on at which every carried value is within
+    tolerance of zero, t is written to payoff_period[s]. A negative tolerance
+    runs every period.
+    """
+    n, periods = pool_balance.shape
+    for s in range(n):
+        payoff_period[s] = periods - 1
+        for t in range(start + 1, periods):
+            # servicing Fee calculations
+            sf_amount_due[s, t] = (
+                sf_rate[s] * pool_balance[s, t - 1]
+                + sf_short_fall[s, t - 1] * sf_short_fall_growth[s]
+            )
+            sf_amount_paid[s, t] = min(asset_available_funds[s, t], sf_amount_due[s, t])
+            sf_short_fall[s, t] = sf_amount_due[s, t] - sf_amount_paid[s, t]
+            b_interest_short_fall[s, t - 1] = (
+                b_interest_due[s, t - 1] - b_interest_paid[s, t - 1]
+            )
+            b_interest_due[s, t] = (
+                rb_rate[s] * b_ending_balance[s, t - 1]
+                + b_interest_short_fall[s, t - 1] * rb_growth[s]
+            )
+            b_interest_raf[s, t - 1] = (
+                a_interest_raf[s, t - 1] - b_interest_paid[s, t - 1]
+            )
+            b_interest_paid[s, t] = min(a_interest_raf[s, t], b_interest_due[s, t])
+            # class a principal account calc
+            a_principal_paid[s, t] = min(b_interest_raf[s, t], a_principal_due[s, t])
+            a_principal_raf[s, t - 1] = (
+                b_interest_raf[s, t - 1] - a_principal_paid[s, t - 1]
+            )
+            a_principal_due[s, t] = min(
+                a_ending_balance[s, t - 1],
+                a_principal_short_fall[s, t - 1] + total_principal_due[s, t],
+            )
+            a_ending_balance[s, t] = a_ending_balance[s, t - 1] - a_principal_paid[s, t]
+            a_principal_paid[s, t] = min(b_interest_raf[s, t], a_principal_due[s, t])
+
+            # class b principal account calc
+            b_principal_raf[s, t - 1] = (
+                a_principal_raf[s, t - 1] - b_principal_paid[s, t - 1]
+            )
+            b_ending_balance[s, t] = b_ending_balance[s, t - 1] - b_principal_paid[s, t]
+            b_principal_due[s, t] = min(
+                b_ending_balance[s, t - 1],
+                max(
+                    0.0,
+                    cumulative_principal_due[s, t]
+                    - max(
+                        class_a_beginning_balance[s],
+                        cumulative_principal_due[s, t - 1],
+                    ),
+                )
+                + b_principal_short_fall[s, t - 1],
+            )
+            b_principal_paid[s, t] = min(a_principal_raf[s, t], b_principal_due[s, t])
+            # reserve accounts
+            ra_account_draw[s, t - 1] = max(
+                0.0, ra_beg_balance[s, t - 1] - b_principal_raf[s, t - 1]
+            )
+            ra_contribution[s, t - 1] = min(
+                ra_collection[s, t - 1],
+                ra_target[s, t - 1]
+                - ra_beg_balance[s, t - 1]
+                + ra_account_draw[s, t - 1],
+            )
+            ra_end_balance[s, t - 1] = (
+                ra_beg_balance[s, t - 1]
+                - ra_account_draw[s, t - 1]
+                + ra_contribution[s, t - 1]
+            )
+            ra_beg_balance[s, t] = ra_end_balance[s, t - 1] * re_growth[s]
+            # servicng fee
+            sf_available_funds[s, t] = (
+                asset_available_funds[s, t]
+                - sf_amount_paid[s, t]
+                + ra_beg_balance[s, t]
+            )
+            # carried rows of liabilities.CARRIED_ARRAYS
+            if (
+                input_end[s] <= t < periods - 1
+                and abs(a_ending_balance[s, t]) <= tolerance
+                and abs(b_ending_balance[s, t]) <= tolerance
+                and abs(sf_short_fall[s, t]) <= tolerance
+                and abs(ra_beg_balance[s, t]) <= tolerance
+                and abs(b_interest_due[s, t]) <= tolerance
+                and abs(b_interest_paid[s, t]) <= tolerance
+                and abs(a_principal_paid[s, t]) <= tolerance
+                and abs(a_principal_short_fall[s, t]) <= tolerance
+                and abs(b_principal_paid[s, t]) <= tolerance
+                and abs(b_principal_short_fall[s, t]) <= tolerance
+            ):
+                payoff_period[s] = t
+                break
+
+
+if njit is not None:
+    # compiled once per process and cached on disk next to this module
+    waterfall_recursion = njit(cache=True)(waterfall_recursion)
+
+
+def per_scenario(value, n: int) -> np.ndarray:
+    """a scalar or (n, 1) PoolInfoBatch field as a contiguous (n,) vector"""
+    return np.ascontiguousarray(np.broadcast_to(np.ravel(value), (n,)), dtype=float)
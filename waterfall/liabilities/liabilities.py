@@ -1,16 +1,161 @@
 from __future__ import annotations
-from waterfall.input import PoolInfo
-from waterfall.asset.asset import AssetCashFlow
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import (
+    AssetCashFlow,
+    AssetCashFlowBatch,
+    ASSET_ARRAYS,
+    zero_tail,
+)
+from waterfall.instrumentation import instrumented, stage
+from waterfall.liabilities import kernel
 from dataclasses import dataclass, field
+from functools import cached_property
+from typing import TYPE_CHECKING
 import numpy as np
 
-import pandas as pd
+if TYPE_CHECKING:
+    # pandas is only imported once a DataFrame is asked for
+    import pandas as pd
 
 
 class NotFinishedException(Exception):
     pass
 
 
+# (group, DataFrame column name) -> LiabilitiesCashFlow attribute
+WATERFALL_COLUMNS = {
+    ("Servicing Fee", "Amount Due"): "sf_amount_due",
+    ("Servicing Fee", "Amount Paid"): "sf_amount_paid",
+    ("Servicing Fee", "ShortFall"): "sf_short_fall",
+    ("Servicing Fee", "Available Funds"): "sf_available_funds",
+    ("Class A Interest", "Interest Due"): "class_a_interest_due",
+    ("Class A Interest", "Interest Paid"): "class_a_interest_paid",
+    ("Class A Interest", "Interest ShortFall"): "class_a_interest_short_fall",
+    (
+        "Class A Interest",
+        "Remaining Available Funds",
+    ): "class_a_interest_remaining_available_funds",
+    ("Class B Interest", "Interest Due"): "class_b_interest_due",
+    ("Class B Interest", "Interest Paid"): "class_b_interest_paid",
+    ("Class B Interest", "Interest ShortFall"): "class_b_interest_short_fall",
+    (
+        "Class B Interest",
+        "Remaining Available Funds",
+    ): "class_b_interest_remaining_available_funds",
+    ("Class A Principal", "Principal Due"): "class_a_principal_due",
+    ("Class A Principal", "Principal Paid"): "class_a_principal_paid",
+    ("Class A Principal", "Principal ShortFall"): "class_a_principal_short_fall",
+    (
+        "Class A Principal",
+        "Ending Principal Balance",
+    ): "class_a_ending_principal_balance",
+    (
+        "Class A Principal",
+        "Remaining Available Funds",
+    ): "class_a_principal_remaining_available_funds",
+    ("Class B Principal", "Principal Due"): "class_b_principal_due",
+    ("Class B Principal", "Principal Paid"): "class_b_principal_paid",
+    ("Class B Principal", "Principal ShortFall"): "class_b_principal_short_fall",
+    (
+        "Class B Principal",
+        "Ending Principal Balance",
+    ): "class_b_ending_principal_balance",
+    (
+        "Class B Principal",
+        "Remaining Available Funds",
+    ): "class_b_principal_remaining_available_funds",
+    ("Reserve Account", "Beg Balance(at month end)"): "ra_beg_balance",
+    (
+        "Reserve Account",
+        "Collection Account Balance after class B Principal",
+    ): "ra_collection_account_balance_after_class_b_principal",
+    ("Reserve Account", "Account Draw(in current period)"): "ra_account_draw",
+    ("Reserve Account", "Target Reserve Amount"): "ra_target_reseserve_amount",
+    (
+        "Reserve Account",
+        "Reserve Contribution Amount",
+    ): "ra_reserve_contribution_amount",
+    ("Reserve Account", "Ending Reserve Balance"): "ra_end_balance",
+}
+# loan info DataFrame column name -> LiabilitiesCashFlow attribute
+LOAN_INFO_COLUMNS = {
+    "Available Funds": "available_funds",
+    "Total Principal Due": "total_principal_due",
+    "Cumulative Principal Due": "cumulative_principal_due",
+}
+# rows of the LiabilitiesCashFlow state buffer
+LIABILITY_ARRAYS = (*WATERFALL_COLUMNS.values(), *LOAN_INFO_COLUMNS.values())
+# waterfall rows in the argument order of kernel.waterfall_recursion
+KERNEL_ARRAYS = (
+    "sf_amount_due",
+    "sf_amount_paid",
+    "sf_short_fall",
+    "sf_available_funds",
+    "class_a_interest_remaining_available_funds",
+    "class_b_interest_due",
+    "class_b_interest_paid",
+    "class_b_interest_short_fall",
+    "class_b_interest_remaining_available_funds",
+    "class_a_principal_due",
+    "class_a_principal_paid",
+    "class_a_principal_short_fall",
+    "class_a_ending_principal_balance",
+    "class_a_principal_remaining_available_funds",
+    "class_b_principal_due",
+    "class_b_principal_paid",
+    "class_b_principal_short_fall",
+    "class_b_ending_principal_balance",
+    "class_b_principal_remaining_available_funds",
+    "ra_beg_balance",
+    "ra_end_balance",
+    "ra_account_draw",
+    "ra_reserve_contribution_amount",
+    "ra_target_reseserve_amount",
+    "ra_collection_account_balance_after_class_b_principal",
+)
+# waterfall rows the recursion carries into the next period, a scenario whose
+# carried rows and remaining inputs are all zero only produces zeros from then on
+CARRIED_ARRAYS = (
+    "class_a_ending_principal_balance",
+    "class_b_ending_principal_balance",
+    "sf_short_fall",
+    "ra_beg_balance",
+    "class_b_interest_due",
+    "class_b_interest_paid",
+    "class_a_principal_paid",
+    "class_a_principal_short_fall",
+    "class_b_principal_paid",
+    "class_b_principal_short_fall",
+)
+CARRIED_ROWS = np.array([LIABILITY_ARRAYS.index(name) for name in CARRIED_ARRAYS])
+# waterfall rows the recursion writes one period late, period t of them is
+# settled by the step of t + 1 and so stays zero at maturity
+LAGGED_ARRAYS = (
+    "class_b_interest_short_fall",
+    "class_b_interest_remaining_available_funds",
+    "class_a_principal_remaining_available_funds",
+    "class_b_principal_remaining_available_funds",
+    "ra_account_draw",
+    "ra_reserve_contribution_amount",
+    "ra_end_balance",
+)
+LAGGED_ROWS = np.array([LIABILITY_ARRAYS.index(name) for name in LAGGED_ARRAYS])
+# below this fraction of alive scenarios in their span the batch engine gathers
+# the alive rows, above it a slice over the span is cheaper
+ACTIVE_FRACTION = 0.125
+# periods between two looks for retired scenarios in the batch engine, a retired
+# scenario only adds zeros so a late look changes nothing but the time saved
+PAYOFF_INTERVAL = 6
+# rows the recursion reads but never writes, next to the asset rows of
+# asset.PAYOFF_ARRAYS
+INPUT_ARRAYS = (
+    "total_principal_due",
+    "class_a_interest_remaining_available_funds",
+    "ra_target_reseserve_amount",
+    "ra_collection_account_balance_after_class_b_principal",
+)
+
+
 @dataclass
 class LiabilitiesCashFlow:
     asset_cf: AssetCashFlow
@@ -49,71 +194,108 @@ class LiabilitiesCashFlow:
         init=False
     )
     finish: bool = False
+    # (len(LIABILITY_ARRAYS), *shape) storage behind every array above, allocated
+    # when not supplied so callers can recycle one buffer across runs
+    buffer: np.ndarray | None = field(default=None, repr=False)
+    # period recursion backend, "numpy" or "numba", kernel.default_backend() if None
+    backend: str | None = None
+    # the recursion stops once the pool and the notes are retired, i.e. every
+    # carried row and every remaining input is within payoff_tolerance of zero,
+    # and leaves the zeros of reset() in the periods after. The default of 0
+    # only stops when the rest would be exactly zero, None runs every period
+    payoff_tolerance: float | None = 0.0
+    # last period computed, per scenario for a batch where it can be up to
+    # PAYOFF_INTERVAL - 1 periods past the payoff
+    payoff_period: int | np.ndarray = field(default=0, init=False)
+    # last period of actuals written by seed, the recursion resumes after it
+    start: int = field(default=0, init=False)
 
     def __post_init__(self):
+        self.backend = kernel.resolve_backend(self.backend)
         self.pool_info = self.asset_cf.pool_info
-        self.class_a_beginning_principal_balance = 85340000
-        self.class_b_beginning_principal_balance = 16411000
-        self.available_funds = self.asset_cf.available_funds.copy()
-        self.total_principal_due = self.asset_cf.principal_due.copy()
-        self.cumulative_principal_due = self.asset_cf.principal_due.cumsum()
-        self.sf_amount_due = np.zeros(self.pool_info.maturity + 1)
-        self.sf_amount_paid = np.zeros(self.pool_info.maturity + 1)
-        self.sf_short_fall = np.zeros(self.pool_info.maturity + 1)
-        self.sf_available_funds = np.zeros(self.pool_info.maturity + 1)
-
-        # class a cashflows
-        self.class_a_interest_due = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_interest_paid = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_interest_short_fall = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_interest_remaining_available_funds = np.zeros(
-            self.pool_info.maturity + 1
+        self.class_a_beginning_principal_balance = (
+            self.pool_info.class_a_principal_balance
         )
-        self.class_a_principal_due = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_principal_paid = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_principal_short_fall = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_ending_principal_balance = np.zeros(self.pool_info.maturity + 1)
-        self.class_a_principal_remaining_available_funds = np.zeros(
-            self.pool_info.maturity + 1
+        self.class_b_beginning_principal_balance = (
+            self.pool_info.class_b_principal_balance
         )
+        shape = (len(LIABILITY_ARRAYS), *self.asset_cf.shape)
+        if self.buffer is None:
+            self.buffer = np.zeros(shape)
+        elif self.buffer.shape != shape:
+            raise ValueError(f"buffer must have shape {shape}, got {self.buffer.shape}")
+        # every waterfall array is a row view of the single state buffer
+        for i, name in enumerate(LIABILITY_ARRAYS):
+            setattr(self, name, self.buffer[i])
+        self.load_asset_cashflow()
 
-        # class b cashflows
-        self.class_b_interest_due = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_interest_paid = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_interest_short_fall = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_interest_remaining_available_funds = np.zeros(
-            self.pool_info.maturity + 1
-        )
-        self.class_b_principal_due = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_principal_paid = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_principal_short_fall = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_ending_principal_balance = np.zeros(self.pool_info.maturity + 1)
-        self.class_b_principal_remaining_available_funds = np.zeros(
-            self.pool_info.maturity + 1
+    @instrumented
+    def load_asset_cashflow(self):
+        """Copies the collections of asset_cf into the loan info rows"""
+        self.available_funds[...] = self.asset_cf.available_funds
+        self.total_principal_due[...] = self.asset_cf.principal_due
+        np.cumsum(
+            self.asset_cf.principal_due, axis=-1, out=self.cumulative_principal_due
         )
 
-        # reserve accounts
-        self.ra_beg_balance = np.zeros(self.pool_info.maturity + 1)
-        self.ra_end_balance = np.zeros(self.pool_info.maturity + 1)
-        self.ra_account_draw = np.zeros(self.pool_info.maturity + 1)
-        self.ra_reserve_contribution_amount = np.zeros(self.pool_info.maturity + 1)
-        self.ra_target_reseserve_amount = np.zeros(self.pool_info.maturity + 1)
-        self.ra_collection_account_balance_after_class_b_principal = np.zeros(
-            self.pool_info.maturity + 1
+    def seed(self, period: int, actuals: np.ndarray):
+        """Writes actual rows of the state buffer up to period
+
+        The next build_waterfall_engine keeps the periods before period and
+        resumes the recursion at period + 1 from the seeded note and reserve
+        balances and shortfalls. As in a run from t = 0, that first step also
+        settles the lagged rows of period itself (remaining funds, interest
+        shortfall of class B and the reserve draw, contribution and ending
+        balance) from the seeded rows.
+
+        Parameters
+        ----------
+        period : int
+            last period of actuals, 0 < period < maturity
+        actuals : np.ndarray
+            (len(LIABILITY_ARRAYS), period + 1) rows of the state buffer,
+            broadcast across the scenarios of a batch
+        """
+        if not 0 < period < self.pool_info.maturity:
+            raise ValueError(
+                f"period must be within (0, {self.pool_info.maturity}), got {period}"
+            )
+        actuals = np.asarray(actuals, dtype=float)
+        if actuals.ndim < 2 or actuals.shape[0] != len(LIABILITY_ARRAYS):
+            raise ValueError(
+                f"actuals must have {len(LIABILITY_ARRAYS)} rows, got {actuals.shape}"
+            )
+        self.buffer[..., : period + 1] = actuals.reshape(
+            len(actuals), *(1,) * (self.buffer.ndim - actuals.ndim), -1
         )
+        self.start = period
+        self.finish = False
+
+    def reset(self):
+        """Zeroes the waterfall rows of the state buffer so the engine can rerun
+
+        The periods before a seeded start are kept.
+        """
+        first = self.start + 1 if self.start else 0
+        self.buffer[: len(WATERFALL_COLUMNS), ..., first:] = 0
+        self.finish = False
+        # loan_info holds copies of the opening balances, rebuild both on access
+        self.__dict__.pop("waterfall", None)
+        self.__dict__.pop("loan_info", None)
 
     def initialize_ending_principal_balance(self):
         """Initializes the ending principal balance for both tranches at time t = 0"""
-        self.class_a_ending_principal_balance[0] = (
+        self.class_a_ending_principal_balance[..., 0] = (
             self.class_a_beginning_principal_balance
         )
-        self.class_b_ending_principal_balance[0] = (
+        self.class_b_ending_principal_balance[..., 0] = (
             self.class_b_beginning_principal_balance
         )
 
     def initialize_target_reserve_amount(self):
         raise NotImplementedError("Yet to Implement")
 
+    @instrumented
     def build_waterfall_engine(self):
         """Builds the WaterFall Engine based on the prospectus"""
         sf = self.pool_info.servicing_fee
@@ -127,10 +309,18 @@ class LiabilitiesCashFlow:
         ra = self.pool_info.class_a_interest
         rb = self.pool_info.class_b_interest
 
-        self.initialize_ending_principal_balance()
+        self.reset()
+        if not self.start:
+            self.initialize_ending_principal_balance()
         # self.initialize_target_reserve_amount()
+        if self.backend == "numba":
+            self._run_kernel()
+            return
 
-        for t in range(1, self.pool_info.maturity + 1):
+        maturity = self.pool_info.maturity
+        input_end = self._input_end()
+        self.payoff_period = maturity
+        for t in range(self.start + 1, maturity + 1):
             # servicing Fee calculations
             self.sf_amount_due[t] = (sf / 12) * self.asset_cf.pool_balance[
                 t - 1
@@ -232,98 +422,340 @@ class LiabilitiesCashFlow:
                 - self.sf_amount_paid[t]
                 + self.ra_beg_balance[t]
             )
+            if input_end <= t < maturity and self._retired(t):
+                self.payoff_period = t
+                break
+
+        self.finish = True
 
+    def _run_kernel(self):
+        """Runs the period recursion with the compiled kernel.waterfall_recursion"""
+        n = int(np.prod(self.asset_cf.shape[:-1]))
+        pool_info = self.pool_info
+        sf = kernel.per_scenario(pool_info.servicing_fee, n)
+        sr = kernel.per_scenario(pool_info.servicing_fee_short_fall_rate, n)
+        re = kernel.per_scenario(pool_info.eligible_investment_rate, n)
+        rb = kernel.per_scenario(pool_info.class_b_interest, n)
+        rows = self.buffer.reshape(len(LIABILITY_ARRAYS), n, -1)
+        asset = self.asset_cf.buffer.reshape(len(self.asset_cf.buffer), n, -1)
+        payoff_period = np.empty(n, dtype=np.int64)
+        input_end = np.reshape(self._input_end(), n).astype(np.int64)
+        kernel.waterfall_recursion(
+            asset[ASSET_ARRAYS.index("pool_balance")],
+            asset[ASSET_ARRAYS.index("available_funds")],
+            rows[LIABILITY_ARRAYS.index("total_principal_due")],
+            rows[LIABILITY_ARRAYS.index("cumulative_principal_due")],
+            sf / 12,
+            1 + sr / 12,
+            rb / 12,
+            1 + rb / 12,
+            1 + re / 12,
+            kernel.per_scenario(self.class_a_beginning_principal_balance, n),
+            *(rows[LIABILITY_ARRAYS.index(name)] for name in KERNEL_ARRAYS),
+            self.start,
+            input_end,
+            -1.0 if self.payoff_tolerance is None else float(self.payoff_tolerance),
+            payoff_period,
+        )
+        self.payoff_period = payoff_period.reshape(self.asset_cf.shape[:-1])
+        if self.payoff_period.ndim == 0:
+            self.payoff_period = int(self.payoff_period)
         self.finish = True
 
+    def _input_end(self) -> int | np.ndarray:
+        """First period from which every input is within payoff_tolerance of zero
+
+        The later of the payoff of the pool, see AssetCashFlow.payoff_period,
+        and the zero tail of INPUT_ARRAYS. maturity + 1 when payoff_tolerance
+        is None so the recursion never stops.
+        """
+        if self.payoff_tolerance is None:
+            return np.full(self.asset_cf.shape[:-1], self.asset_cf.shape[-1])
+        return np.maximum(
+            self.asset_cf.payoff_period(self.payoff_tolerance),
+            zero_tail(
+                [getattr(self, name) for name in INPUT_ARRAYS], self.payoff_tolerance
+            ),
+        )
+
+    def _retired(self, t: int) -> bool:
+        """whether every carried row is within payoff_tolerance of zero at t"""
+        return all(
+            abs(getattr(self, name)[t]) <= self.payoff_tolerance
+            for name in CARRIED_ARRAYS
+        )
+
+    @instrumented
     def build_waterfall_df(self):
+        """Builds waterfall and loan_info now rather than on their first access"""
+        self.__dict__.pop("waterfall", None)
+        self.__dict__.pop("loan_info", None)
+        self.waterfall
+        self.loan_info
+
+    # Building the pandas dataframes to display results, they are views of the
+    # state buffer rather than copies and only built when first asked for
+    @cached_property
+    def waterfall(self) -> pd.DataFrame:
+        """waterfall rows, columns are (group, name) of WATERFALL_COLUMNS"""
+        import pandas as pd
+
+        self._check_finished()
+        return self._frame(
+            self.buffer[: len(WATERFALL_COLUMNS)],
+            pd.MultiIndex.from_tuples(WATERFALL_COLUMNS),
+        )
+
+    @cached_property
+    def loan_info(self) -> pd.DataFrame:
+        """loan info rows with the opening note balances"""
+        self._check_finished()
+        loan_info = self._frame(
+            self.buffer[len(WATERFALL_COLUMNS) :], list(LOAN_INFO_COLUMNS)
+        )
+        loan_info.insert(
+            2,
+            "Class A Beginning Principal Balance",
+            self._opening_balance(self.class_a_beginning_principal_balance),
+        )
+        loan_info.insert(
+            3,
+            "Class B Beginning Principal Balance",
+            self._opening_balance(self.class_b_beginning_principal_balance),
+        )
+        return loan_info
+
+    def _check_finished(self):
         if not self.finish:
             raise NotFinishedException(
                 "The WaterFall building process has not been completed"
             )
-        # Building the pandas dataframe to display results
-        data = {
-            "Available Funds": self.available_funds,
-            "Total Principal Due": self.total_principal_due,
-            "Class A Beginning Principal Balance": self.class_a_beginning_principal_balance,
-            "Class B Beginning Principal Balance": self.class_b_beginning_principal_balance,
-            "Cumulative Principal Due": self.cumulative_principal_due,
-        }
-        df = pd.DataFrame(data)
-        df.loc[1:, "Class A Beginning Principal Balance"] = None
-        df.loc[1:, "Class B Beginning Principal Balance"] = None
-        self.loan_info = df.round(3)
-
-        index = pd.MultiIndex.from_tuples(
-            [
-                ("Servicing Fee", "Amount Due"),
-                ("Servicing Fee", "Amount Paid"),
-                ("Servicing Fee", "ShortFall"),
-                ("Servicing Fee", "Available Funds"),
-                ("Class A Interest", "Interest Due"),
-                ("Class A Interest", "Interest Paid"),
-                ("Class A Interest", "Interest ShortFall"),
-                ("Class A Interest", "Remaining Available Funds"),
-                ("Class B Interest", "Interest Due"),
-                ("Class B Interest", "Interest Paid"),
-                ("Class B Interest", "Interest ShortFall"),
-                ("Class B Interest", "Remaining Available Funds"),
-                ("Class A Principal", "Principal Due"),
-                ("Class A Principal", "Principal Paid"),
-                ("Class A Principal", "Principal ShortFall"),
-                ("Class A Principal", "Ending Principal Balance"),
-                ("Class A Principal", "Remaining Available Funds"),
-                ("Class B Principal", "Principal Due"),
-                ("Class B Principal", "Principal Paid"),
-                ("Class B Principal", "Principal ShortFall"),
-                ("Class B Principal", "Ending Principal Balance"),
-                ("Class B Principal", "Remaining Available Funds"),
-                ("Reserve Account", "Beg Balance(at month end)"),
-                (
-                    "Reserve Account",
-                    "Collection Account Balance after class B Principal",
-                ),
-                ("Reserve Account", "Account Draw(in current period)"),
-                ("Reserve Account", "Target Reserve Amount"),
-                ("Reserve Account", "Reserve Contribution Amount"),
-                ("Reserve Account", "Ending Reserve Balance"),
-            ]
+
+    def _frame(self, rows: np.ndarray, columns) -> pd.DataFrame:
+        """DataFrame wrapping rows of the state buffer without copying them"""
+        import pandas as pd
+
+        return pd.DataFrame(rows.T, columns=columns, copy=False)
+
+    def _opening_balance(self, balance: float) -> np.ndarray:
+        """balance at t = 0 and NaN afterwards"""
+        column = np.full(self.asset_cf.shape[-1], np.nan)
+        column[0] = balance
+        return column
+
+
+@dataclass
+class LiabilitiesCashFlowBatch(LiabilitiesCashFlow):
+    """Liabilities waterfall for a batch of scenarios evaluated at once
+
+    Every waterfall array has shape (n_scenarios, maturity + 1). The recursion in
+    time stays sequential but each period is evaluated for all scenarios with
+    np.minimum / np.maximum, following the same order of operations as
+    LiabilitiesCashFlow.build_waterfall_engine so a single scenario batch gives
+    identical results. Scenarios whose pool and notes are retired are dropped
+    from the rows evaluated in the later periods.
+    """
+
+    asset_cf: AssetCashFlowBatch
+    pool_info: PoolInfoBatch = field(init=False)
+    class_a_beginning_principal_balance: np.ndarray = field(init=False)
+    class_b_beginning_principal_balance: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        super().__post_init__()
+        # per scenario note balances as (n_scenarios,) vectors
+        self.class_a_beginning_principal_balance = (
+            self.pool_info.class_a_principal_balance[:, 0]
         )
-        df = pd.DataFrame(
-            np.column_stack(
-                [
-                    self.sf_amount_due,
-                    self.sf_amount_paid,
-                    self.sf_short_fall,
-                    self.sf_available_funds,
-                    self.class_a_interest_due,
-                    self.class_a_interest_paid,
-                    self.class_a_interest_short_fall,
-                    self.class_a_interest_remaining_available_funds,
-                    self.class_b_interest_due,
-                    self.class_b_interest_paid,
-                    self.class_b_interest_short_fall,
-                    self.class_b_interest_remaining_available_funds,
-                    self.class_a_principal_due,
-                    self.class_a_principal_paid,
-                    self.class_a_principal_short_fall,
-                    self.class_a_ending_principal_balance,
-                    self.class_a_principal_remaining_available_funds,
-                    self.class_b_principal_due,
-                    self.class_b_principal_paid,
-                    self.class_b_principal_short_fall,
-                    self.class_b_ending_principal_balance,
-                    self.class_b_principal_remaining_available_funds,
-                    self.ra_beg_balance,
-                    self.ra_collection_account_balance_after_class_b_principal,
-                    self.ra_account_draw,
-                    self.ra_target_reseserve_amount,
-                    self.ra_reserve_contribution_amount,
-                    self.ra_end_balance,
-                ]
-            ),
-            columns=index,
+        self.class_b_beginning_principal_balance = (
+            self.pool_info.class_b_principal_balance[:, 0]
+        )
+
+    @instrumented
+    def build_waterfall_engine(self):
+        """Builds the WaterFall Engine for every scenario of the batch"""
+        # per scenario rates as (n_scenarios,) vectors
+        sf = self.pool_info.servicing_fee[:, 0]
+        sr = self.pool_info.servicing_fee_short_fall_rate[:, 0]
+        re = self.pool_info.eligible_investment_rate[:, 0]
+        rb = self.pool_info.class_b_interest[:, 0]
+        sf_rate = sf / 12
+        sf_short_fall_growth = 1 + sr / 12
+        rb_rate = rb / 12
+        rb_growth = 1 + rb / 12
+        re_growth = 1 + re / 12
+        # a scalar when set for the whole batch
+        class_a_beginning_balance = kernel.per_scenario(
+            self.class_a_beginning_principal_balance, len(sf)
         )
-        self.waterfall = df.round(3)
+
+        pool_balance = self.asset_cf.pool_balance
+        asset_available_funds = self.asset_cf.available_funds
+        total_principal_due = self.total_principal_due
+        cumulative_principal_due = self.cumulative_principal_due
+        sf_amount_due = self.sf_amount_due
+        sf_amount_paid = self.sf_amount_paid
+        sf_short_fall = self.sf_short_fall
+        sf_available_funds = self.sf_available_funds
+        a_interest_raf = self.class_a_interest_remaining_available_funds
+        b_interest_due = self.class_b_interest_due
+        b_interest_paid = self.class_b_interest_paid
+        b_interest_short_fall = self.class_b_interest_short_fall
+        b_interest_raf = self.class_b_interest_remaining_available_funds
+        a_principal_due = self.class_a_principal_due
+        a_principal_paid = self.class_a_principal_paid
+        a_principal_short_fall = self.class_a_principal_short_fall
+        a_ending_balance = self.class_a_ending_principal_balance
+        a_principal_raf = self.class_a_principal_remaining_available_funds
+        b_principal_due = self.class_b_principal_due
+        b_principal_paid = self.class_b_principal_paid
+        b_principal_short_fall = self.class_b_principal_short_fall
+        b_ending_balance = self.class_b_ending_principal_balance
+        b_principal_raf = self.class_b_principal_remaining_available_funds
+        ra_beg_balance = self.ra_beg_balance
+        ra_end_balance = self.ra_end_balance
+        ra_account_draw = self.ra_account_draw
+        ra_contribution = self.ra_reserve_contribution_amount
+        ra_target = self.ra_target_reseserve_amount
+        ra_collection = self.ra_collection_account_balance_after_class_b_principal
+
+        self.reset()
+        if not self.start:
+            self.initialize_ending_principal_balance()
+        if self.backend == "numba":
+            self._run_kernel()
+            return
+
+        maturity = self.pool_info.maturity
+        input_end = self._input_end()
+        self.payoff_period = np.full(len(input_end), maturity)
+        alive = np.ones(len(input_end), dtype=bool)
+        next_check = input_end.min()
+        # active scenario rows, a slice until the first one is retired
+        r = slice(None)
+        for t in range(self.start + 1, maturity + 1):
+            # servicing Fee calculations
+            sf_amount_due[r, t] = (
+                sf_rate[r] * pool_balance[r, t - 1]
+                + sf_short_fall[r, t - 1] * sf_short_fall_growth[r]
+            )
+            sf_amount_paid[r, t] = np.minimum(
+                asset_available_funds[r, t], sf_amount_due[r, t]
+            )
+            sf_short_fall[r, t] = sf_amount_due[r, t] - sf_amount_paid[r, t]
+            b_interest_short_fall[r, t - 1] = (
+                b_interest_due[r, t - 1] - b_interest_paid[r, t - 1]
+            )
+            b_interest_due[r, t] = (
+                rb_rate[r] * b_ending_balance[r, t - 1]
+                + b_interest_short_fall[r, t - 1] * rb_growth[r]
+            )
+            b_interest_raf[r, t - 1] = (
+                a_interest_raf[r, t - 1] - b_interest_paid[r, t - 1]
+            )
+            b_interest_paid[r, t] = np.minimum(
+                a_interest_raf[r, t], b_interest_due[r, t]
+            )
+            # class a principal account calc
+            a_principal_paid[r, t] = np.minimum(
+                b_interest_raf[r, t], a_principal_due[r, t]
+            )
+            a_principal_raf[r, t - 1] = (
+                b_interest_raf[r, t - 1] - a_principal_paid[r, t - 1]
+            )
+            a_principal_due[r, t] = np.minimum(
+                a_ending_balance[r, t - 1],
+                a_principal_short_fall[r, t - 1] + total_principal_due[r, t],
+            )
+            a_ending_balance[r, t] = a_ending_balance[r, t - 1] - a_principal_paid[r, t]
+            a_principal_paid[r, t] = np.minimum(
+                b_interest_raf[r, t], a_principal_due[r, t]
+            )
+
+            # class b principal account calc
+            b_principal_raf[r, t - 1] = (
+                a_principal_raf[r, t - 1] - b_principal_paid[r, t - 1]
+            )
+            b_ending_balance[r, t] = b_ending_balance[r, t - 1] - b_principal_paid[r, t]
+            b_principal_due[r, t] = np.minimum(
+                b_ending_balance[r, t - 1],
+                np.maximum(
+                    0,
+                    cumulative_principal_due[r, t]
+                    - np.maximum(
+                        class_a_beginning_balance[r], cumulative_principal_due[r, t - 1]
+                    ),
+                )
+                + b_principal_short_fall[r, t - 1],
+            )
+            b_principal_paid[r, t] = np.minimum(
+                a_principal_raf[r, t], b_principal_due[r, t]
+            )
+            # reserve accounts
+            ra_account_draw[r, t - 1] = np.maximum(
+                0, ra_beg_balance[r, t - 1] - b_principal_raf[r, t - 1]
+            )
+            ra_contribution[r, t - 1] = np.minimum(
+                ra_collection[r, t - 1],
+                ra_target[r, t - 1]
+                - ra_beg_balance[r, t - 1]
+                + ra_account_draw[r, t - 1],
+            )
+            ra_end_balance[r, t - 1] = (
+                ra_beg_balance[r, t - 1]
+                - ra_account_draw[r, t - 1]
+                + ra_contribution[r, t - 1]
+            )
+            ra_beg_balance[r, t] = ra_end_balance[r, t - 1] * re_growth[r]
+            # servicng fee
+            sf_available_funds[r, t] = (
+                asset_available_funds[r, t]
+                - sf_amount_paid[r, t]
+                + ra_beg_balance[r, t]
+            )
+            if t >= next_check and t < maturity and t % PAYOFF_INTERVAL == 0:
+                # drop the scenarios retired at t from the active rows
+                rows = np.flatnonzero(alive)
+                retired = self._retired(rows[input_end[rows] <= t], t)
+                if len(retired):
+                    alive[retired] = False
+                    self.payoff_period[retired] = t
+                    if not alive.any():
+                        break
+                    r = _active_rows(alive)
+                    next_check = input_end[r][alive[r]].min()
+
+        self.finish = True
+
+    def _retired(self, rows: np.ndarray, t: int) -> np.ndarray:
+        """the rows whose carried rows are all within payoff_tolerance of zero at t"""
+        carried = self.buffer[CARRIED_ROWS[:, None], rows, t]
+        return rows[(np.abs(carried) <= self.payoff_tolerance).all(axis=0)]
+
+    def _frame(self, rows: np.ndarray, columns) -> pd.DataFrame:
+        """Long format DataFrame view of rows of the state buffer indexed by (scenario, t)"""
+        import pandas as pd
+
+        n, periods = self.asset_cf.shape
+        index = pd.MultiIndex.from_product(
+            [range(n), range(periods)], names=["scenario", "t"]
+        )
+        data = rows.reshape(len(rows), -1).T
+        return pd.DataFrame(data, index=index, columns=columns, copy=False)
+
+    def _opening_balance(self, balance: np.ndarray) -> np.ndarray:
+        column = np.full(self.asset_cf.shape, np.nan)
+        column[:, 0] = balance
+        return column.ravel()
+
+
+def _active_rows(alive: np.ndarray) -> slice | np.ndarray:
+    """rows of the alive scenarios, a slice spanning them or their indices"""
+    rows = np.flatnonzero(alive)
+    span = slice(int(rows[0]), int(rows[-1]) + 1)
+    if len(rows) < ACTIVE_FRACTION * (rows[-1] + 1 - rows[0]):
+        return rows
+    return span
 
 
 def main():
@@ -334,11 +766,12 @@ def main():
     lcf = LiabilitiesCashFlow(acf)
     lcf.build_waterfall_engine()
     lcf.build_waterfall_df()
-    acf.asset = acf.asset.round(3)
-    acf.asset.index.name = "t"
-    acf.asset.to_csv("asset.csv")
-    lcf.loan_info.to_csv("loan_info.csv")
-    lcf.waterfall.to_csv("pro-rata-liabilities.csv")
+    with stage("csv_export"):
+        acf.asset = acf.asset.round(3)
+        acf.asset.index.name = "t"
+        acf.asset.to_csv("asset.csv")
+        lcf.loan_info.round(3).to_csv("loan_info.csv")
+        lcf.waterfall.round(3).to_csv("pro-rata-liabilities.csv")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,548 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.instrumentation import instrumented
+from waterfall.liabilities.liabilities import (
+    NotFinishedException,
+    PAYOFF_INTERVAL,
+    _active_rows,
+)
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    # pandas is only imported once a DataFrame is asked for
+    import pandas as pd
+
+# step kinds -> opcode of the compiled program
+FEE, INTEREST, SEQUENTIAL, PRO_RATA, TURBO, RESERVE = range(6)
+OPCODES = {
+    "fee": FEE,
+    "interest": INTEREST,
+    "sequential": SEQUENTIAL,
+    "pro_rata": PRO_RATA,
+    "turbo": TURBO,
+    "reserve": RESERVE,
+}
+# trigger metrics, measured on the previous period
+CUMULATIVE_LOSS, OVERCOLLATERALIZATION, POOL_FACTOR = range(3)
+METRICS = {
+    "cumulative_loss": CUMULATIVE_LOSS,
+    "overcollateralization": OVERCOLLATERALIZATION,
+    "pool_factor": POOL_FACTOR,
+}
+
+# (group, DataFrame column name) -> row of the deal level state, deal rows
+DEAL_COLUMNS = {
+    ("Collections", "Available Funds"): "available_funds",
+    ("Servicing Fee", "Amount Due"): "fee_due",
+    ("Servicing Fee", "Amount Paid"): "fee_paid",
+    ("Servicing Fee", "ShortFall"): "fee_short_fall",
+    ("Principal", "Principal Distributable"): "principal_distributable",
+    ("Principal", "Principal ShortFall"): "principal_short_fall",
+    ("Reserve Account", "Ending Reserve Balance"): "reserve_balance",
+    ("Residual", "Released"): "residual",
+}
+# DataFrame column name -> row of the per tranche state
+TRANCHE_COLUMNS = {
+    "Interest Due": "interest_due",
+    "Interest Paid": "interest_paid",
+    "Interest ShortFall": "interest_short_fall",
+    "Principal Paid": "principal_paid",
+    "Ending Principal Balance": "ending_balance",
+}
+# deal and tranche rows the steps carry into the next period, a scenario whose
+# pool is paid off and whose carried rows are zero only produces zeros from then on
+CARRIED_DEAL_ROWS = np.array(
+    [
+        list(DEAL_COLUMNS.values()).index(name)
+        for name in ("fee_short_fall", "principal_short_fall", "reserve_balance")
+    ]
+)
+CARRIED_TRANCHE_ROWS = np.array(
+    [
+        list(TRANCHE_COLUMNS.values()).index(name)
+        for name in ("interest_short_fall", "ending_balance")
+    ]
+)
+
+
+@dataclass(frozen=True)
+class Tranche:
+    """A note of the capital structure
+
+    name: str
+        e.g. "Class A"
+    balance: float
+        principal balance at closing
+    coupon: float
+        annual interest rate, paid monthly on the previous ending balance
+    """
+
+    name: str
+    balance: float
+    coupon: float
+
+
+@dataclass(frozen=True)
+class Trigger:
+    """Performance test switching steps on or off per scenario
+
+    name: str
+        unique name the steps it conditions refer to
+    metric: str
+        "cumulative_loss" (cumulative defaults over the initial pool balance),
+        "overcollateralization" (pool balance over the notes outstanding) or
+        "pool_factor" (pool balance over the initial pool balance)
+    threshold: float
+        level the metric of the previous period is compared with
+    above: bool
+        True if the trigger is breached when the metric exceeds threshold,
+        False if it is breached when the metric falls below threshold
+    sticky: bool
+        a breached trigger stays breached for the rest of the deal
+    """
+
+    name: str
+    metric: str
+    threshold: float
+    above: bool = True
+    sticky: bool = True
+
+
+@dataclass(frozen=True)
+class Step:
+    """One line of the priority of payments
+
+    kind: str
+        "fee" pays the servicing fee, "interest" the interest owed to the
+        tranches pro rata to what they are owed, "sequential" and "pro_rata"
+        distribute the principal due in the period, "turbo" pays every remaining
+        dollar as principal in sequence and "reserve" tops up the reserve account
+    tranches: tuple[str, ...]
+        tranches paid by the step, in order of seniority
+    trigger: str | None
+        name of the Trigger the step is conditioned on, None if the step
+        always runs
+    breached: bool
+        True if the step only runs while the trigger is breached, False if
+        it only runs while the trigger is not breached, ignored without a
+        trigger
+    """
+
+    kind: str
+    tranches: tuple[str, ...] = ()
+    trigger: str | None = None
+    breached: bool = True
+
+
+@dataclass
+class WaterfallSpec:
+    """Declarative priority of payments of an N tranche deal
+
+    Funds left after the last step are released to the residual holder.
+    The reserve account earns reserve_rate and is available to every step
+    of the next period.
+    """
+
+    tranches: tuple[Tranche, ...]
+    steps: tuple[Step, ...]
+    triggers: tuple[Trigger, ...] = ()
+    servicing_fee: float = 0.01
+    servicing_fee_short_fall_rate: float = 0.001
+    # target of the reserve account as a fraction of the initial pool balance
+    reserve_target: float = 0.0
+    reserve_rate: float = 0.0
+
+    @classmethod
+    def from_pool_info(cls, pool_info: PoolInfo) -> WaterfallSpec:
+        """The two tranche prospectus of LiabilitiesCashFlow as a spec"""
+        tranches = (
+            Tranche(
+                "Class A",
+                pool_info.class_a_principal_balance,
+                pool_info.class_a_interest,
+            ),
+            Tranche(
+                "Class B",
+                pool_info.class_b_principal_balance,
+                pool_info.class_b_interest,
+            ),
+        )
+        steps = (
+            Step("fee"),
+            Step("interest", ("Class A",)),
+            Step("interest", ("Class B",)),
+            Step("sequential", ("Class A", "Class B")),
+            Step("reserve"),
+        )
+        return cls(
+            tranches,
+            steps,
+            servicing_fee=pool_info.servicing_fee,
+            servicing_fee_short_fall_rate=pool_info.servicing_fee_short_fall_rate,
+            reserve_target=pool_info.target_reserve_percentage,
+            reserve_rate=pool_info.eligible_investment_rate,
+        )
+
+    def compile(self) -> WaterfallProgram:
+        """Validates the spec and lowers it to a flat WaterfallProgram"""
+        names = [tranche.name for tranche in self.tranches]
+        if len(set(names)) != len(names):
+            raise ValueError("tranche names must be unique")
+        triggers = [trigger.name for trigger in self.triggers]
+        if len(set(triggers)) != len(triggers):
+            raise ValueError("trigger names must be unique")
+        ops, members = [], []
+        for step in self.steps:
+            if step.kind not in OPCODES:
+                raise ValueError(
+                    f"step kind must be one of {sorted(OPCODES)}, got {step.kind!r}"
+                )
+            unknown = set(step.tranches) - set(names)
+            if unknown:
+                raise ValueError(f"unknown tranches {sorted(unknown)}")
+            needs_tranches = OPCODES[step.kind] not in (FEE, RESERVE)
+            if needs_tranches != bool(step.tranches):
+                raise ValueError(f"{step.kind} step with tranches {step.tranches}")
+            if len(set(step.tranches)) != len(step.tranches):
+                raise ValueError(f"{step.kind} step pays a tranche twice")
+            if step.trigger is not None and step.trigger not in triggers:
+                raise ValueError(f"unknown trigger {step.trigger!r}")
+            start = len(members)
+            members += [names.index(name) for name in step.tranches]
+            ops.append(
+                (
+                    OPCODES[step.kind],
+                    start,
+                    len(members),
+                    -1 if step.trigger is None else triggers.index(step.trigger),
+                    int(step.breached),
+                )
+            )
+        for trigger in self.triggers:
+            if trigger.metric not in METRICS:
+                raise ValueError(
+                    f"trigger metric must be one of {sorted(METRICS)}, "
+                    f"got {trigger.metric!r}"
+                )
+        return WaterfallProgram(
+            tranche_names=tuple(names),
+            trigger_names=tuple(triggers),
+            ops=np.array(ops, dtype=np.int64).reshape(-1, 5),
+            members=np.array(members, dtype=np.int64),
+            balances=np.array([tranche.balance for tranche in self.tranches], float),
+            coupons=np.array([tranche.coupon for tranche in self.tranches], float),
+            trigger_ops=np.array(
+                [
+                    (METRICS[t.metric], int(t.above), int(t.sticky))
+                    for t in self.triggers
+                ],
+                dtype=np.int64,
+            ).reshape(-1, 3),
+            thresholds=np.array([t.threshold for t in self.triggers], float),
+            servicing_fee=self.servicing_fee,
+            servicing_fee_short_fall_rate=self.servicing_fee_short_fall_rate,
+            reserve_target=self.reserve_target,
+            reserve_rate=self.reserve_rate,
+        )
+
+
+@dataclass(frozen=True)
+class WaterfallProgram:
+    """A compiled WaterfallSpec
+
+    ops: np.ndarray
+        one (opcode, first member, end of members, trigger, breached) row per
+        step, trigger is -1 for unconditional steps
+    members: np.ndarray
+        tranche indices paid by the steps, step i pays members[first:end]
+    trigger_ops: np.ndarray
+        one (metric, above, sticky) row per trigger
+    """
+
+    tranche_names: tuple[str, ...]
+    trigger_names: tuple[str, ...]
+    ops: np.ndarray
+    members: np.ndarray
+    balances: np.ndarray
+    coupons: np.ndarray
+    trigger_ops: np.ndarray
+    thresholds: np.ndarray
+    servicing_fee: float
+    servicing_fee_short_fall_rate: float
+    reserve_target: float
+    reserve_rate: float
+
+
+@dataclass
+class SpecCashFlow:
+    """Runs a WaterfallProgram over the collections of an asset build
+
+    Works for an AssetCashFlow or an AssetCashFlowBatch. Every state array has
+    a scenario axis, of length 1 for a single deal: deal rows are
+    (n_scenarios, T+1), tranche rows (n_tranches, n_scenarios, T+1) and the
+    trigger states (n_triggers, n_scenarios, T+1). Each period runs the steps
+    in order, each step is a handful of array operations over all scenarios
+    and all of its tranches, so the cost per period grows with the number of
+    steps rather than with the number of tranches. Scenarios whose pool is
+    paid off and whose notes are retired are dropped from the rows evaluated
+    in the later periods, only their triggers keep being measured.
+    """
+
+    asset_cf: AssetCashFlow
+    program: WaterfallProgram
+    deal: np.ndarray = field(init=False, repr=False)
+    tranches: np.ndarray = field(init=False, repr=False)
+    triggers: np.ndarray = field(init=False, repr=False)
+    finish: bool = field(default=False, init=False)
+    # the steps of a scenario stop once its pool is paid off and its notes,
+    # shortfalls and reserve are within payoff_tolerance of zero, the periods
+    # after keep the zeros they start from. The default of 0 only stops when
+    # the rest would be exactly zero, None runs every period
+    payoff_tolerance: float | None = 0.0
+    # last period whose steps ran, per scenario, up to PAYOFF_INTERVAL - 1
+    # periods past the payoff
+    payoff_period: np.ndarray = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        shape = np.atleast_2d(self.asset_cf.pool_balance).shape
+        n_tranches = len(self.program.tranche_names)
+        self.deal = np.zeros((len(DEAL_COLUMNS), *shape))
+        self.tranches = np.zeros((len(TRANCHE_COLUMNS), n_tranches, *shape))
+        self.triggers = np.zeros((len(self.program.trigger_names), *shape), bool)
+
+    def deal_array(self, name: str) -> np.ndarray:
+        """(n_scenarios, T+1) deal row, e.g. reserve_balance"""
+        return self.deal[list(DEAL_COLUMNS.values()).index(name)]
+
+    def tranche_array(self, tranche: str, name: str) -> np.ndarray:
+        """(n_scenarios, T+1) row of one tranche, e.g. ("Class C", "principal_paid")"""
+        row = list(TRANCHE_COLUMNS.values()).index(name)
+        return self.tranches[row, self.program.tranche_names.index(tranche)]
+
+    @instrumented
+    def build_waterfall_engine(self):
+        """Runs every period of the priority of payments"""
+        # waterfall copies the state, it is rebuilt on its next access
+        self.__dict__.pop("waterfall", None)
+        program = self.program
+        pool_balance = np.atleast_2d(self.asset_cf.pool_balance)
+        collections = np.atleast_2d(self.asset_cf.available_funds)
+        principal_due = np.atleast_2d(self.asset_cf.principal_due)
+        defaults = np.atleast_2d(self.asset_cf.defaulted_balances)
+        (
+            available_funds,
+            fee_due,
+            fee_paid,
+            fee_short_fall,
+            principal_distributable,
+            principal_short_fall,
+            reserve_balance,
+            residual,
+        ) = self.deal
+        (
+            interest_due,
+            interest_paid,
+            interest_short_fall,
+            principal_paid,
+            ending_balance,
+        ) = self.tranches
+        self.deal[...] = 0
+        self.tranches[...] = 0
+        self.triggers[...] = False
+
+        ops = program.ops.tolist()
+        groups = [_group(program.members[start:stop]) for _, start, stop, _, _ in ops]
+        coupon_rate = (program.coupons / 12)[:, None]
+        coupon_growth = 1 + coupon_rate
+        fee_rate = program.servicing_fee / 12
+        fee_growth = 1 + program.servicing_fee_short_fall_rate / 12
+        reserve_growth = 1 + program.reserve_rate / 12
+        initial_pool = pool_balance[:, 0]
+        reserve_target = program.reserve_target * initial_pool
+        trigger_ops = program.trigger_ops.tolist()
+        thresholds = program.thresholds.tolist()
+        ending_balance[:, :, 0] = program.balances[:, None]
+        balance = ending_balance[:, :, 0].copy()
+        n_tranches, n = balance.shape
+        maturity = pool_balance.shape[-1] - 1
+        input_end = self._input_end(n)
+        self.payoff_period = np.full(n, maturity)
+        alive = np.ones(n, dtype=bool)
+        next_check = input_end.min()
+        # active scenario rows, a slice until the first one is retired
+        r = slice(None)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # trigger metrics that only depend on the asset side, by period
+            asset_metrics = {
+                CUMULATIVE_LOSS: np.cumsum(defaults, axis=-1) / initial_pool[:, None],
+                POOL_FACTOR: pool_balance / initial_pool[:, None],
+            }
+            for t in range(1, maturity + 1):
+                # the triggers of retired scenarios keep following the pool
+                state = self.triggers[:, :, t]
+                for i, (metric, above, sticky) in enumerate(trigger_ops):
+                    if metric == OVERCOLLATERALIZATION:
+                        value = pool_balance[:, t - 1] / balance.sum(axis=0)
+                    else:
+                        value = asset_metrics[metric][:, t - 1]
+                    if above:
+                        np.greater(value, thresholds[i], out=state[i])
+                    else:
+                        np.less(value, thresholds[i], out=state[i])
+                    if sticky:
+                        state[i] |= self.triggers[i, :, t - 1]
+                if not alive.any():
+                    continue
+                # 1.0 where a step conditioned on (trigger, breached) runs
+                runs = (state[:, r].astype(float), (~state[:, r]).astype(float))
+
+                # the reserve is drawn in full and topped up again by a reserve step
+                funds = collections[r, t] + reserve_balance[r, t - 1] * reserve_growth
+                available_funds[r, t] = funds
+                reserve = 0.0
+                outstanding_balance = balance[:, r]
+                owed = coupon_rate * outstanding_balance + (
+                    interest_short_fall[:, r, t - 1] * coupon_growth
+                )
+                interest_due[:, r, t] = owed
+                interest = np.zeros(owed.shape)
+                principal = np.zeros(owed.shape)
+                principal_left = principal_due[r, t] + principal_short_fall[r, t - 1]
+                principal_distributable[r, t] = principal_left
+                fee_owed = fee_rate * pool_balance[r, t - 1] + (
+                    fee_short_fall[r, t - 1] * fee_growth
+                )
+                fee_due[r, t] = fee_owed
+
+                for (op, _, _, trigger, when), group in zip(ops, groups):
+                    cap = funds if trigger < 0 else funds * runs[1 - when][trigger]
+                    if op == FEE:
+                        paid = np.minimum(cap, fee_owed)
+                        fee_owed = fee_owed - paid
+                    elif op == INTEREST:
+                        due = owed[group]
+                        pay = due * np.fmin(1.0, cap / due.sum(axis=0))
+                        owed[group] = due - pay
+                        interest[group] += pay
+                        paid = pay.sum(axis=0)
+                    elif op == RESERVE:
+                        paid = np.minimum(
+                            cap, np.maximum(reserve_target[r] - reserve, 0.0)
+                        )
+                        reserve = reserve + paid
+                    else:
+                        outstanding = outstanding_balance[group]
+                        amount = cap if op == TURBO else np.minimum(cap, principal_left)
+                        if op == PRO_RATA:
+                            total = outstanding.sum(axis=0)
+                            share = np.minimum(amount, total) / total
+                            pay = outstanding * np.where(total > 0, share, 0.0)
+                        else:
+                            ahead = np.cumsum(outstanding, axis=0) - outstanding
+                            pay = np.minimum(
+                                np.maximum(amount - ahead, 0.0), outstanding
+                            )
+                        outstanding_balance[group] = outstanding - pay
+                        principal[group] += pay
+                        paid = pay.sum(axis=0)
+                        principal_left = np.maximum(principal_left - paid, 0.0)
+                    funds = funds - paid
+
+                balance[:, r] = outstanding_balance
+                interest_paid[:, r, t] = interest
+                interest_short_fall[:, r, t] = owed
+                principal_paid[:, r, t] = principal
+                ending_balance[:, r, t] = outstanding_balance
+                fee_paid[r, t] = fee_due[r, t] - fee_owed
+                fee_short_fall[r, t] = fee_owed
+                principal_short_fall[r, t] = np.minimum(
+                    principal_left, outstanding_balance.sum(axis=0)
+                )
+                reserve_balance[r, t] = reserve
+                residual[r, t] = funds
+                if t >= next_check and t < maturity and t % PAYOFF_INTERVAL == 0:
+                    # drop the scenarios retired at t from the active rows
+                    rows = np.flatnonzero(alive)
+                    retired = self._retired(rows[input_end[rows] <= t], t)
+                    if len(retired):
+                        alive[retired] = False
+                        self.payoff_period[retired] = t
+                        if not alive.any():
+                            if not trigger_ops:
+                                break
+                            continue
+                        r = _active_rows(alive)
+                        next_check = input_end[r][alive[r]].min()
+
+        self.finish = True
+
+    def _input_end(self, n: int) -> np.ndarray:
+        """(n,) payoff periods of the pool, see AssetCashFlow.payoff_period
+
+        maturity + 1 when payoff_tolerance is None so every period runs.
+        """
+        periods = self.deal.shape[-1]
+        if self.payoff_tolerance is None:
+            return np.full(n, periods)
+        return np.reshape(self.asset_cf.payoff_period(self.payoff_tolerance), n)
+
+    def _retired(self, rows: np.ndarray, t: int) -> np.ndarray:
+        """the rows whose carried rows are all within payoff_tolerance of zero at t"""
+        carried = np.concatenate(
+            [
+                self.tranches[:, :, rows, t][CARRIED_TRANCHE_ROWS].reshape(
+                    -1, len(rows)
+                ),
+                self.deal[:, rows, t][CARRIED_DEAL_ROWS],
+            ]
+        )
+        return rows[(np.abs(carried) <= self.payoff_tolerance).all(axis=0)]
+
+    @instrumented
+    def build_waterfall_df(self):
+        """Builds waterfall now rather than on its first access"""
+        self.__dict__.pop("waterfall", None)
+        self.waterfall
+
+    @cached_property
+    def waterfall(self) -> pd.DataFrame:
+        """DataFrame of the deal and tranche rows, columns are (group, name)
+
+        Indexed by t for a single deal and by (scenario, t) for a batch.
+        """
+        import pandas as pd
+
+        if not self.finish:
+            raise NotFinishedException(
+                "The WaterFall building process has not been completed"
+            )
+        n, periods = self.deal.shape[1:]
+        columns = list(DEAL_COLUMNS)
+        data = [row.ravel() for row in self.deal]
+        for k, tranche in enumerate(self.program.tranche_names):
+            columns += [(tranche, name) for name in TRANCHE_COLUMNS]
+            data += [row[k].ravel() for row in self.tranches]
+        for i, trigger in enumerate(self.program.trigger_names):
+            columns.append(("Trigger", trigger))
+            data.append(self.triggers[i].ravel())
+        if np.ndim(self.asset_cf.pool_balance) == 1:
+            index = pd.RangeIndex(periods, name="t")
+        else:
+            index = pd.MultiIndex.from_product(
+                [range(n), range(periods)], names=["scenario", "t"]
+            )
+        frame = pd.DataFrame(dict(zip(columns, data)), index=index)
+        frame.columns = pd.MultiIndex.from_tuples(columns)
+        return frame
+
+
+def _group(members: np.ndarray) -> slice | np.ndarray:
+    """a slice when the tranches of a step are adjacent, which indexes as a view"""
+    if len(members) and (np.diff(members) == 1).all():
+        return slice(int(members[0]), int(members[-1]) + 1)
+    return members
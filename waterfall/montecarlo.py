@@ -0,0 +1,353 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.liabilities import LiabilitiesCashFlowBatch
+from waterfall.liabilities.spec import SpecCashFlow, WaterfallSpec
+from waterfall.analytics import TRANCHES, tranche_loss, weighted_average_life
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterator, Sequence
+import warnings
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class Distribution:
+    """Sampling distribution for one PoolInfo field
+
+    name: str
+        any numpy.random.Generator method, e.g. uniform, normal, lognormal, beta
+    params: dict
+        keyword arguments of that method, size is supplied by the simulator
+    low: float
+        draws are clipped below at low
+    high: float
+        draws are clipped above at high
+    """
+
+    name: str
+    params: dict[str, float] = field(default_factory=dict)
+    low: float = -np.inf
+    high: float = np.inf
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        draws = getattr(rng, self.name)(size=size, **self.params)
+        return np.clip(draws, self.low, self.high)
+
+
+def default_distributions() -> dict[str, Distribution]:
+    """Credit, loss timing and prepayment speed distributions around PoolInfo()"""
+    return {
+        "cumulative_default_rate": Distribution(
+            "lognormal", {"mean": np.log(0.01), "sigma": 0.5}, low=0.0, high=1.0
+        ),
+        "loss_curve_timing": Distribution("normal", {"loc": 55, "scale": 5}, low=1.0),
+        "loss_curve_steepness": Distribution("uniform", {"low": 0.05, "high": 0.2}),
+        # share of loans that prepay over the life of the pool
+        "initial_recovery": Distribution("beta", {"a": 4, "b": 16}, low=0.0, high=1.0),
+    }
+
+
+@dataclass
+class RunningStats:
+    """Streaming count, mean, variance, min and max that merge across chunks
+
+    NaN observations are counted in missing and otherwise ignored.
+    """
+
+    count: int = 0
+    missing: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = np.inf
+    max: float = -np.inf
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        observed = values[~np.isnan(values)]
+        self.missing += values.size - observed.size
+        if observed.size:
+            self.merge(
+                RunningStats(
+                    count=observed.size,
+                    mean=observed.mean(),
+                    m2=((observed - observed.mean()) ** 2).sum(),
+                    min=observed.min(),
+                    max=observed.max(),
+                )
+            )
+
+    def merge(self, other: RunningStats):
+        """Chan et al. pairwise update of the mean and sum of squared deviations"""
+        self.missing += other.missing
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.variance)
+
+
+@dataclass
+class Histogram:
+    """Fixed bin histogram, values outside the edges land in the end bins"""
+
+    edges: np.ndarray
+    counts: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        bins = np.clip(
+            np.searchsorted(self.edges, values, side="right") - 1,
+            0,
+            len(self.counts) - 1,
+        )
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+
+    def merge(self, other: Histogram):
+        self.counts += other.counts
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile, interpolated linearly inside the bin"""
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, q * total))
+        i = min(i, len(self.counts) - 1)
+        before = cumulative[i] - self.counts[i]
+        within = (q * total - before) / self.counts[i] if self.counts[i] else 0.0
+        return self.edges[i] + within * (self.edges[i + 1] - self.edges[i])
+
+
+@dataclass
+class TrancheAggregator:
+    """Running loss and weighted average life statistics of one tranche
+
+    impairment_tolerance: float
+        a path impairs the tranche when its loss exceeds this fraction of par
+    """
+
+    wal_edges: np.ndarray
+    impairment_tolerance: float = 1e-6
+    loss: RunningStats = field(default_factory=RunningStats)
+    wal: RunningStats = field(default_factory=RunningStats)
+    wal_histogram: Histogram = field(init=False)
+    impaired: int = 0
+
+    def __post_init__(self):
+        self.wal_histogram = Histogram(self.wal_edges)
+
+    def update(self, losses: np.ndarray, wals: np.ndarray):
+        self.loss.update(losses)
+        self.impaired += int((losses > self.impairment_tolerance).sum())
+        self.wal.update(wals)
+        self.wal_histogram.update(wals)
+
+    def merge(self, other: TrancheAggregator):
+        self.loss.merge(other.loss)
+        self.impaired += other.impaired
+        self.wal.merge(other.wal)
+        self.wal_histogram.merge(other.wal_histogram)
+
+    @property
+    def probability_of_impairment(self) -> float:
+        paths = self.loss.count + self.loss.missing
+        return self.impaired / paths if paths else np.nan
+
+    @property
+    def degenerate(self) -> bool:
+        """True when a tranche with par received no principal on any path"""
+        return self.wal.count == 0 and self.loss.count > 0 and self.loss.min > 0
+
+
+@dataclass
+class MonteCarloSimulator:
+    """Monte Carlo credit and prepayment simulator of tranche losses
+
+    Each chunk of paths draws its PoolInfo fields from the distributions with
+    its own generator spawned from seed, so results do not depend on the number
+    of workers. Chunks run the batched asset engine and the SpecCashFlow engine
+    of spec in a process pool and only their running aggregators travel back
+    to the parent. The statistics are those of the spec waterfall, the legacy
+    LiabilitiesCashFlow never pays class A any principal and would report a
+    loss of 1 on every path.
+
+    distributions: dict
+        PoolInfo field -> Distribution, fields not listed keep the base value
+    base: PoolInfo
+        the deal the draws are applied to
+    n_paths: int
+        total number of simulated paths
+    chunk_size: int
+        number of paths evaluated together in one batched build
+    seed: int | None
+        root seed of the generator streams
+    max_workers: int | None
+        size of the process pool, 1 runs every chunk in this process
+    impairment_tolerance: float
+        a path impairs a tranche when its loss exceeds this fraction of par
+    spec: WaterfallSpec | None
+        priority of payments, WaterfallSpec.from_pool_info(base) if None
+    """
+
+    distributions: dict[str, Distribution] = field(
+        default_factory=default_distributions
+    )
+    base: PoolInfo = field(default_factory=PoolInfo)
+    n_paths: int = 100_000
+    chunk_size: int = 5_000
+    seed: int | None = 0
+    max_workers: int | None = None
+    impairment_tolerance: float = 1e-6
+    spec: WaterfallSpec | None = None
+    wal_edges: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.wal_edges = np.linspace(0, self.base.maturity / 12, 121)
+        if self.spec is None:
+            self.spec = WaterfallSpec.from_pool_info(self.base)
+
+    def tasks(self) -> Iterator[tuple]:
+        n_chunks = -(-self.n_paths // self.chunk_size)
+        streams = np.random.SeedSequence(self.seed).spawn(n_chunks)
+        program = self.spec.compile()
+        for i, stream in enumerate(streams):
+            size = min(self.chunk_size, self.n_paths - i * self.chunk_size)
+            yield (
+                self.distributions,
+                self.base,
+                size,
+                stream,
+                self.wal_edges,
+                self.impairment_tolerance,
+                program,
+            )
+
+    def run(self) -> MonteCarloResult:
+        result = MonteCarloResult.empty(
+            [tranche.name for tranche in self.spec.tranches],
+            self.wal_edges,
+            self.impairment_tolerance,
+        )
+        if self.max_workers == 1:
+            for chunk in map(_simulate_chunk, self.tasks()):
+                result.merge(chunk)
+            return result
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            # map yields in submission order so merging stays reproducible
+            for chunk in executor.map(_simulate_chunk, self.tasks()):
+                result.merge(chunk)
+        return result
+
+
+@dataclass
+class MonteCarloResult:
+    """Tranche aggregators of the paths run so far
+
+    tranches: dict[str, TrancheAggregator]
+        tranche name -> its running statistics
+    n_paths: int
+        number of paths added
+    """
+
+    tranches: dict[str, TrancheAggregator]
+    n_paths: int = 0
+
+    @classmethod
+    def empty(
+        cls,
+        names: Sequence[str],
+        wal_edges: np.ndarray,
+        impairment_tolerance: float = 1e-6,
+    ) -> MonteCarloResult:
+        return cls(
+            {name: TrancheAggregator(wal_edges, impairment_tolerance) for name in names}
+        )
+
+    def update(self, cf: SpecCashFlow | LiabilitiesCashFlowBatch):
+        """Adds the paths of a built spec or legacy waterfall batch"""
+        if isinstance(cf, SpecCashFlow):
+            tranches = [
+                (name, cf.tranche_array(name, "principal_paid"), par)
+                for name, par in zip(cf.program.tranche_names, cf.program.balances)
+            ]
+        else:
+            tranches = [
+                (name, getattr(cf, principal_paid), getattr(cf, par))
+                for name, (_, principal_paid, par) in TRANCHES.items()
+            ]
+        self.n_paths += len(tranches[0][1])
+        for name, paid, par in tranches:
+            losses = tranche_loss(paid, par)
+            self.tranches[name].update(losses, weighted_average_life(paid))
+
+    def merge(self, other: MonteCarloResult):
+        self.n_paths += other.n_paths
+        for name, aggregator in other.tranches.items():
+            self.tranches[name].merge(aggregator)
+
+    def summary(self) -> pd.DataFrame:
+        """Loss and WAL statistics per tranche
+
+        Warns when a tranche received no principal on any path, its losses
+        then reflect a waterfall that never amortizes it rather than credit.
+        """
+        import pandas as pd
+
+        degenerate = [name for name, agg in self.tranches.items() if agg.degenerate]
+        if degenerate:
+            warnings.warn(
+                f"{', '.join(degenerate)} received no principal on any of the "
+                f"{self.n_paths} paths, run the paths on the spec waterfall",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        rows = {}
+        for name, agg in self.tranches.items():
+            rows[name] = {
+                "Expected Loss": agg.loss.mean,
+                "Loss Std": agg.loss.std,
+                "Max Loss": agg.loss.max,
+                "Probability of Impairment": agg.probability_of_impairment,
+                "WAL Mean": agg.wal.mean if agg.wal.count else np.nan,
+                "WAL Std": agg.wal.std,
+                "WAL 5%": agg.wal_histogram.quantile(0.05),
+                "WAL 50%": agg.wal_histogram.quantile(0.5),
+                "WAL 95%": agg.wal_histogram.quantile(0.95),
+                "WAL Undefined Paths": agg.wal.missing,
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def _simulate_chunk(task: tuple) -> MonteCarloResult:
+    distributions, base, size, stream, wal_edges, impairment_tolerance, program = task
+    rng = np.random.default_rng(stream)
+    table = {name: dist.sample(rng, size) for name, dist in distributions.items()}
+    acf = AssetCashFlowBatch(PoolInfoBatch.from_table(table, base))
+    acf.build_asset_arrays()
+    cf = SpecCashFlow(acf, program)
+    cf.build_waterfall_engine()
+    result = MonteCarloResult.empty(
+        program.tranche_names, wal_edges, impairment_tolerance
+    )
+    result.update(cf)
+    return result
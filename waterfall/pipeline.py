@@ -0,0 +1,235 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, LIABILITY_FIELDS
+from waterfall.asset.asset import AssetCashFlow
+from waterfall.liabilities.liabilities import LiabilitiesCashFlow, WATERFALL_COLUMNS
+from dataclasses import dataclass, field, fields, replace
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One step of the cash flow pipeline
+
+    name: str
+        identifier of the stage
+    method: str
+        "asset.<method>" or "liabilities.<method>" run by the stage
+    fields: frozenset[str]
+        PoolInfo init fields the stage reads, derived fields are traced back
+        to the fields they are computed from
+    reads: tuple[str, ...]
+        arrays read by the stage, qualified as asset.<name> or liabilities.<name>
+    writes: tuple[str, ...]
+        arrays written by the stage, qualified the same way
+    """
+
+    name: str
+    method: str
+    fields: frozenset[str] = frozenset()
+    reads: tuple[str, ...] = ()
+    writes: tuple[str, ...] = ()
+
+
+# in execution order, every stage only reads what earlier stages write
+STAGES = (
+    Stage(
+        "fully_prepaying",
+        "asset.build_fully_prepaying",
+        frozenset({"maturity", "inflection_point", "initial_recovery", "num_loans"}),
+        writes=("asset.fully_prepaying",),
+    ),
+    Stage(
+        "normalized_loss_curves",
+        "asset.build_normalized_loss_curves",
+        frozenset(
+            {
+                "maturity",
+                "num_loans",
+                "cumulative_default_rate",
+                "loss_curve_timing",
+                "loss_curve_steepness",
+            }
+        ),
+        writes=("asset.L", "asset.l", "asset.nD"),
+    ),
+    Stage(
+        "balance_and_recoveries",
+        "asset.build_balance_and_recoveries",
+        frozenset({"wac", "init_balance_per_loan", "maturity", "wam", "lgd"}),
+        reads=("asset.nD",),
+        writes=(
+            "asset.principal_loan_balance",
+            "asset.defaulted_balances",
+            "asset.recoveries",
+        ),
+    ),
+    Stage(
+        "current_loans_remaining",
+        "asset.build_current_loans_remaining",
+        frozenset({"num_loans"}),
+        reads=("asset.nD", "asset.fully_prepaying"),
+        writes=("asset.current_loans_remaining",),
+    ),
+    Stage(
+        "scheduled_interest_and_principal",
+        "asset.build_scheduled_interest_and_principal",
+        frozenset({"wac", "init_balance_per_loan", "maturity", "wam"}),
+        reads=(
+            "asset.current_loans_remaining",
+            "asset.nD",
+            "asset.principal_loan_balance",
+            "asset.fully_prepaying",
+        ),
+        writes=(
+            "asset.scheduled_interest",
+            "asset.scheduled_principal",
+            "asset.prepaid_principal",
+            "asset.total_principal",
+        ),
+    ),
+    Stage(
+        "pool_balance",
+        "asset.build_pool_balance",
+        frozenset({"num_loans", "init_balance_per_loan"}),
+        reads=(
+            "asset.defaulted_balances",
+            "asset.prepaid_principal",
+            "asset.scheduled_principal",
+        ),
+        writes=("asset.pool_balance",),
+    ),
+    Stage(
+        "current_collections",
+        "asset.build_current_collections",
+        reads=(
+            "asset.scheduled_interest",
+            "asset.total_principal",
+            "asset.recoveries",
+            "asset.scheduled_principal",
+            "asset.prepaid_principal",
+            "asset.defaulted_balances",
+        ),
+        writes=("asset.available_funds", "asset.principal_due"),
+    ),
+    Stage(
+        "loan_info",
+        "liabilities.load_asset_cashflow",
+        reads=("asset.available_funds", "asset.principal_due"),
+        writes=(
+            "liabilities.available_funds",
+            "liabilities.total_principal_due",
+            "liabilities.cumulative_principal_due",
+        ),
+    ),
+    Stage(
+        "waterfall_engine",
+        "liabilities.build_waterfall_engine",
+        frozenset({"maturity", *LIABILITY_FIELDS}),
+        reads=(
+            "asset.pool_balance",
+            "asset.available_funds",
+            "liabilities.total_principal_due",
+            "liabilities.cumulative_principal_due",
+        ),
+        writes=tuple(f"liabilities.{name}" for name in WATERFALL_COLUMNS.values()),
+    ),
+    Stage(
+        "waterfall_df",
+        "liabilities.build_waterfall_df",
+        reads=tuple(f"liabilities.{name}" for name in WATERFALL_COLUMNS.values()),
+        writes=("liabilities.waterfall", "liabilities.loan_info"),
+    ),
+)
+
+
+def downstream(changed: set[str], dirty: set[str] | None = None) -> set[str]:
+    """Names of the stages that must rerun after the PoolInfo fields in changed
+
+    Parameters
+    ----------
+    changed : set[str]
+        PoolInfo fields that were edited
+    dirty : set[str] | None, optional
+        stages already known to be stale, their outputs are stale too
+
+    Returns
+    -------
+    set[str]
+        every stage reading a changed field or an array written by a stale stage
+    """
+    dirty = set() if dirty is None else set(dirty)
+    stale_arrays = set()
+    for stage in STAGES:
+        if (
+            stage.name in dirty
+            or stage.fields & changed
+            or stale_arrays.intersection(stage.reads)
+        ):
+            dirty.add(stage.name)
+            stale_arrays.update(stage.writes)
+    return dirty
+
+
+@dataclass
+class Pipeline:
+    """Incremental asset and liabilities build driven by the STAGES graph
+
+    update edits PoolInfo fields and marks only the stages downstream of them as
+    dirty, run recomputes the dirty stages in place and marks them clean.
+    A maturity edit changes the period axis and rebuilds everything.
+    e.g. after pipeline.update(class_b_interest=0.07), pipeline.run() only
+    reruns the waterfall_engine and waterfall_df stages.
+    """
+
+    pool_info: PoolInfo
+    asset_cf: AssetCashFlow = field(init=False)
+    liabilities_cf: LiabilitiesCashFlow = field(init=False)
+    dirty: set[str] = field(init=False)
+
+    def __post_init__(self):
+        self._allocate()
+
+    def _allocate(self):
+        self.asset_cf = AssetCashFlow(self.pool_info)
+        self.liabilities_cf = LiabilitiesCashFlow(self.asset_cf)
+        self.dirty = {stage.name for stage in STAGES}
+
+    def update(self, **changes) -> set[str]:
+        """Edits PoolInfo fields and returns the stages that became dirty"""
+        names = {f.name for f in fields(PoolInfo) if f.init}
+        unknown = set(changes) - names
+        if unknown:
+            raise ValueError(f"unknown PoolInfo fields {sorted(unknown)}")
+        changed = {
+            name
+            for name, value in changes.items()
+            if getattr(self.pool_info, name) != value
+        }
+        self.pool_info = replace(self.pool_info, **changes)
+        if "maturity" in changed:
+            self._allocate()
+            return set(self.dirty)
+        self.asset_cf.pool_info = self.pool_info
+        self.liabilities_cf.pool_info = self.pool_info
+        # the engine starts from the opening balances copied at construction
+        self.liabilities_cf.class_a_beginning_principal_balance = (
+            self.pool_info.class_a_principal_balance
+        )
+        self.liabilities_cf.class_b_beginning_principal_balance = (
+            self.pool_info.class_b_principal_balance
+        )
+        stale = downstream(changed) - self.dirty
+        self.dirty |= stale
+        return stale
+
+    def run(self) -> list[str]:
+        """Recomputes the dirty stages in order and returns their names"""
+        owners = {"asset": self.asset_cf, "liabilities": self.liabilities_cf}
+        recomputed = []
+        for stage in STAGES:
+            if stage.name not in self.dirty:
+                continue
+            owner, method = stage.method.split(".")
+            getattr(owners[owner], method)()
+            self.dirty.discard(stage.name)
+            recomputed.append(stage.name)
+        return recomputed
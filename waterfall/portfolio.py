@@ -0,0 +1,213 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch, ASSET_ARRAYS
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlowBatch,
+    LAGGED_ROWS,
+    LIABILITY_ARRAYS,
+)
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Mapping, Sequence
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# column name -> asset or waterfall attribute reported by calendar month
+PORTFOLIO_COLUMNS = {
+    "Pool Balance": "pool_balance",
+    "Available Funds": "available_funds",
+    "Defaulted Balances": "defaulted_balances",
+    "Recoveries": "recoveries",
+    "Servicing Fee Paid": "sf_amount_paid",
+    "Class A Interest Paid": "class_a_interest_paid",
+    "Class A Principal Paid": "class_a_principal_paid",
+    "Class A Ending Principal Balance": "class_a_ending_principal_balance",
+    "Class B Interest Paid": "class_b_interest_paid",
+    "Class B Principal Paid": "class_b_principal_paid",
+    "Class B Ending Principal Balance": "class_b_ending_principal_balance",
+    "Ending Reserve Balance": "ra_end_balance",
+}
+
+
+@dataclass
+class Deal:
+    """One deal of a portfolio
+
+    name: str
+        unique name of the deal
+    pool_info: PoolInfo
+        the deal, with its own maturity
+    first_month: np.datetime64 | str
+        calendar month of period 0, e.g. "2024-03", period t falls t months later
+    """
+
+    name: str
+    pool_info: PoolInfo
+    first_month: np.datetime64 | str
+
+    def __post_init__(self):
+        self.first_month = np.datetime64(self.first_month).astype("datetime64[M]")
+
+    @property
+    def last_month(self) -> np.datetime64:
+        return self.first_month + self.pool_info.maturity
+
+
+@dataclass
+class PortfolioResult:
+    """Cash flows of every deal and of the whole portfolio by calendar month
+
+    names: list[str]
+        the deals in the order given
+    months: np.ndarray
+        (n_months,) datetime64[M] months from the first period 0 to the last
+        maturity of the portfolio
+    columns: dict[str, str]
+        column name -> attribute, see PORTFOLIO_COLUMNS
+    values: np.ndarray
+        (n_deals, len(columns), n_months), zero outside the life of a deal
+    """
+
+    names: list[str]
+    months: np.ndarray
+    columns: dict[str, str]
+    values: np.ndarray = field(repr=False)
+
+    def deal(self, name: str) -> np.ndarray:
+        """(len(columns), n_months) cash flows of one deal"""
+        return self.values[self.names.index(name)]
+
+    def portfolio(self) -> np.ndarray:
+        """(len(columns), n_months) sum of every deal"""
+        return self.values.sum(axis=0)
+
+    def frame(self, name: str | None = None) -> pd.DataFrame:
+        """One deal, or the portfolio if name is None, indexed by calendar month"""
+        import pandas as pd
+
+        values = self.portfolio() if name is None else self.deal(name)
+        return pd.DataFrame(
+            values.T,
+            index=pd.PeriodIndex(self.months.astype(str), freq="M", name="month"),
+            columns=list(self.columns),
+        )
+
+
+@dataclass
+class PortfolioRunner:
+    """Runs portfolios of deals with ragged maturities in a few batched passes
+
+    Deals are sorted by maturity and grouped in buckets whose maturities lie
+    within bucket_width months of the shortest one. The asset side of every
+    maturity of a bucket is built as one batch straight into the zero padded
+    state buffer of the bucket, and the waterfall of the whole bucket runs as
+    one LiabilitiesCashFlowBatch over its longest maturity. A deal only sees
+    zero collections after its maturity, those periods are masked out along
+    with the LAGGED_ARRAYS rows the longer recursion settles at its maturity,
+    so every deal keeps the rows of building it alone as a one scenario
+    batch. A wider bucket runs
+    fewer recursions over more padded periods, 0 only batches equal
+    maturities.
+    e.g.
+    result = PortfolioRunner().run(deals)
+    result.frame()
+
+    bucket_width: int
+        largest spread of maturities, in months, batched together
+    columns: Mapping[str, str]
+        column name -> asset or waterfall attribute reported by calendar month
+    backend: str | None
+        waterfall backend, kernel.default_backend() if None
+    """
+
+    bucket_width: int = 12
+    columns: Mapping[str, str] = field(default_factory=lambda: dict(PORTFOLIO_COLUMNS))
+    backend: str | None = None
+
+    def __post_init__(self):
+        if self.bucket_width < 0:
+            raise ValueError("bucket_width must be positive")
+        unknown = set(self.columns.values()) - {*ASSET_ARRAYS, *LIABILITY_ARRAYS}
+        if unknown:
+            raise ValueError(f"unknown portfolio columns {sorted(unknown)}")
+
+    def buckets(self, deals: Sequence[Deal]) -> list[np.ndarray]:
+        """Positions of the deals of every bucket, sorted by maturity"""
+        maturities = np.array([deal.pool_info.maturity for deal in deals])
+        order = np.argsort(maturities, kind="stable")
+        buckets, first = [], 0
+        while first < len(order):
+            shortest = maturities[order[first]]
+            stop = np.searchsorted(
+                maturities[order], shortest + self.bucket_width, side="right"
+            )
+            buckets.append(order[first:stop])
+            first = stop
+        return buckets
+
+    def run(self, deals: Sequence[Deal]) -> PortfolioResult:
+        """Cash flows of every deal placed on the calendar months of the portfolio"""
+        if not deals:
+            raise ValueError("a portfolio needs at least one deal")
+        names = [deal.name for deal in deals]
+        if len(set(names)) != len(names):
+            raise ValueError("deal names must be unique")
+        start = min(deal.first_month for deal in deals)
+        stop = max(deal.last_month for deal in deals)
+        months = np.arange(start, stop + 1)
+        values = np.zeros((len(deals), len(self.columns), len(months)))
+        for bucket in self.buckets(deals):
+            lcf = self.run_bucket([deals[i] for i in bucket])
+            data = np.stack(
+                [
+                    (
+                        lcf.asset_cf.buffer[ASSET_ARRAYS.index(attribute)]
+                        if attribute in ASSET_ARRAYS
+                        else lcf.buffer[LIABILITY_ARRAYS.index(attribute)]
+                    )
+                    for attribute in self.columns.values()
+                ],
+                axis=1,
+            )
+            for k, i in enumerate(bucket):
+                offset = int((deals[i].first_month - start).astype(int))
+                periods = deals[i].pool_info.maturity + 1
+                values[i, :, offset : offset + periods] = data[k, :, :periods]
+        return PortfolioResult(names, months, dict(self.columns), values)
+
+    def run_bucket(self, deals: Sequence[Deal]) -> LiabilitiesCashFlowBatch:
+        """Builds deals sorted by maturity as one batch padded to the longest
+
+        The periods of every deal after its maturity are zero. The asset_cf of
+        the batch carries the padded maturity, its rows were built with the
+        maturity of each deal.
+        """
+        pool_infos = [deal.pool_info for deal in deals]
+        maturities = np.array([pool_info.maturity for pool_info in pool_infos])
+        if np.any(np.diff(maturities) < 0):
+            raise ValueError("the deals of a bucket must be sorted by maturity")
+        longest = int(maturities[-1])
+        buffer = np.zeros((len(ASSET_ARRAYS), len(deals), longest + 1))
+        # deals of one maturity are adjacent rows, so each batch writes a view
+        unique, firsts = np.unique(maturities, return_index=True)
+        ends = np.append(firsts[1:], len(deals))
+        groups = list(zip(unique.tolist(), firsts.tolist(), ends.tolist()))
+        for maturity, first, end in groups:
+            AssetCashFlowBatch(
+                PoolInfoBatch.from_pool_infos(pool_infos[first:end]),
+                buffer=buffer[:, first:end, : maturity + 1],
+            ).build_asset_arrays()
+        acf = AssetCashFlowBatch(
+            PoolInfoBatch.from_pool_infos(
+                [replace(pool_info, maturity=longest) for pool_info in pool_infos]
+            ),
+            buffer=buffer,
+        )
+        lcf = LiabilitiesCashFlowBatch(acf, backend=self.backend)
+        lcf.build_waterfall_engine()
+        for maturity, first, end in groups:
+            if maturity < longest:
+                lcf.buffer[:, first:end, maturity + 1 :] = 0
+                lcf.buffer[LAGGED_ROWS, first:end, maturity] = 0
+        return lcf
@@ -0,0 +1,211 @@
+"""Rolling reforecast of a seasoned deal from servicer remittance reports
+
+A Checkpoint holds the asset and waterfall state buffers of one deal through
+a period. Projecting it seeds both engines with that state, so only the
+periods after it are computed. Rolling it forward with the next remittance
+writes the reported actuals over the projection of that period, and the
+result is the checkpoint of the next month. Saving it between months makes
+each update incremental rather than a replay of the whole history.
+e.g.
+checkpoint = Checkpoint.from_run(closing_lcf, 0)
+for remittance in remittances:
+    lcf = checkpoint.project()
+    checkpoint = checkpoint.roll(remittance, lcf)
+checkpoint.save("deal.npz")
+"""
+
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch, ASSET_ARRAYS
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlow,
+    LiabilitiesCashFlowBatch,
+    NotFinishedException,
+    LIABILITY_ARRAYS,
+    WATERFALL_COLUMNS,
+)
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Mapping
+import json
+import numpy as np
+
+
+@dataclass
+class Remittance:
+    """Actuals of one period from a servicer report
+
+    period: int
+        period the report covers
+    asset: Mapping[str, float]
+        ASSET_ARRAYS attribute -> actual value, e.g. pool_balance,
+        current_loans_remaining, defaulted_balances or recoveries
+    waterfall: Mapping[str, float]
+        WATERFALL_COLUMNS attribute -> paid value, e.g. class_a_principal_paid,
+        class_a_ending_principal_balance, ra_end_balance or sf_short_fall
+    """
+
+    period: int
+    asset: Mapping[str, float] = field(default_factory=dict)
+    waterfall: Mapping[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        for names, given in (
+            (ASSET_ARRAYS, self.asset),
+            (tuple(WATERFALL_COLUMNS.values()), self.waterfall),
+        ):
+            unknown = set(given) - set(names)
+            if unknown:
+                raise ValueError(f"unknown remittance rows {sorted(unknown)}")
+
+
+@dataclass
+class Checkpoint:
+    """State of one deal through period, enough to project the periods after it
+
+    pool_info: PoolInfo
+        the deal
+    period: int
+        last period held, 0 <= period < maturity
+    asset: np.ndarray
+        (len(ASSET_ARRAYS), period + 1) rows of the asset state buffer
+    liabilities: np.ndarray
+        (len(LIABILITY_ARRAYS), period + 1) rows of the waterfall state buffer
+    """
+
+    pool_info: PoolInfo
+    period: int
+    asset: np.ndarray = field(repr=False)
+    liabilities: np.ndarray = field(repr=False)
+
+    def __post_init__(self):
+        if not 0 <= self.period < self.pool_info.maturity:
+            raise ValueError(
+                f"period must be within [0, {self.pool_info.maturity}), "
+                f"got {self.period}"
+            )
+        self.asset = np.asarray(self.asset, dtype=float)
+        self.liabilities = np.asarray(self.liabilities, dtype=float)
+        for name, rows, values in (
+            ("asset", ASSET_ARRAYS, self.asset),
+            ("liabilities", LIABILITY_ARRAYS, self.liabilities),
+        ):
+            shape = (len(rows), self.period + 1)
+            if values.shape != shape:
+                raise ValueError(f"{name} must have shape {shape}, got {values.shape}")
+
+    @classmethod
+    def from_run(cls, lcf: LiabilitiesCashFlow, period: int) -> Checkpoint:
+        """State of a built single deal waterfall through period"""
+        if not lcf.finish:
+            raise NotFinishedException(
+                "The WaterFall building process has not been completed"
+            )
+        if isinstance(lcf, LiabilitiesCashFlowBatch):
+            raise ValueError("a checkpoint holds a single deal, not a batch")
+        return cls(
+            lcf.pool_info,
+            period,
+            lcf.asset_cf.buffer[:, : period + 1].copy(),
+            lcf.buffer[:, : period + 1].copy(),
+        )
+
+    def project(
+        self,
+        pool_info: PoolInfo | PoolInfoBatch | None = None,
+        backend: str | None = None,
+        payoff_tolerance: float | None = 0.0,
+    ) -> LiabilitiesCashFlow:
+        """Projects the periods after the checkpoint
+
+        Parameters
+        ----------
+        pool_info : PoolInfo | PoolInfoBatch | None, optional
+            assumptions of the projection with the maturity of the deal, e.g.
+            a PoolInfoBatch of stressed scenarios that all start from the
+            checkpoint, by default the deal itself
+        backend : str | None, optional
+            waterfall backend, kernel.default_backend() if None
+        payoff_tolerance : float | None, optional
+            see LiabilitiesCashFlow.payoff_tolerance
+
+        Returns
+        -------
+        LiabilitiesCashFlow
+            the built waterfall, a LiabilitiesCashFlowBatch for a PoolInfoBatch
+        """
+        pool_info = self.pool_info if pool_info is None else pool_info
+        if pool_info.maturity != self.pool_info.maturity:
+            raise ValueError(
+                f"the projection needs the maturity {self.pool_info.maturity} "
+                f"of the deal, got {pool_info.maturity}"
+            )
+        batch = isinstance(pool_info, PoolInfoBatch)
+        acf = (AssetCashFlowBatch if batch else AssetCashFlow)(pool_info)
+        if self.period:
+            acf.seed(self.period, self.asset)
+        acf.build_asset_arrays()
+        lcf = (LiabilitiesCashFlowBatch if batch else LiabilitiesCashFlow)(
+            acf, backend=backend, payoff_tolerance=payoff_tolerance
+        )
+        if self.period:
+            lcf.seed(self.period, self.liabilities)
+            # the loan info rows follow the seeded asset rows
+            lcf.load_asset_cashflow()
+        lcf.build_waterfall_engine()
+        return lcf
+
+    def roll(
+        self, remittance: Remittance, lcf: LiabilitiesCashFlow | None = None
+    ) -> Checkpoint:
+        """Checkpoint of the next period holding the actuals of remittance
+
+        Rows the remittance does not report keep the projection. The lagged
+        rows the recursion settles one period late, such as the reserve
+        ending balance, are settled again from the seeded rows when the new
+        checkpoint is projected.
+
+        Parameters
+        ----------
+        remittance : Remittance
+            actuals of period + 1
+        lcf : LiabilitiesCashFlow | None, optional
+            the single deal projection of this checkpoint, project() if None
+        """
+        if remittance.period != self.period + 1:
+            raise ValueError(
+                f"the remittance of period {self.period + 1} is next, "
+                f"got {remittance.period}"
+            )
+        lcf = self.project() if lcf is None else lcf
+        checkpoint = Checkpoint.from_run(lcf, remittance.period)
+        for rows, values, given in (
+            (ASSET_ARRAYS, checkpoint.asset, remittance.asset),
+            (LIABILITY_ARRAYS, checkpoint.liabilities, remittance.waterfall),
+        ):
+            for name, value in given.items():
+                values[rows.index(name), -1] = value
+        return checkpoint
+
+    def save(self, path: str | Path):
+        """Writes the checkpoint to one .npz file"""
+        pool_info = {
+            f.name: getattr(self.pool_info, f.name) for f in fields(PoolInfo) if f.init
+        }
+        np.savez(
+            path,
+            period=self.period,
+            asset=self.asset,
+            liabilities=self.liabilities,
+            pool_info=json.dumps(pool_info),
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> Checkpoint:
+        with np.load(path) as data:
+            return cls(
+                PoolInfo(**json.loads(str(data["pool_info"]))),
+                int(data["period"]),
+                data["asset"],
+                data["liabilities"],
+            )
@@ -0,0 +1,271 @@
+from __future__ import annotations
+from waterfall.asset.asset import ASSET_COLUMNS
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlow,
+    NotFinishedException,
+    WATERFALL_COLUMNS,
+    LOAN_INFO_COLUMNS,
+)
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Hashable
+from numpy.lib.format import open_memmap
+import json
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# result table -> (DataFrame column -> attribute), the asset table is read from
+# asset_cf and the others from the liabilities cash flow
+RESULT_TABLES = {
+    "asset": ASSET_COLUMNS,
+    "waterfall": WATERFALL_COLUMNS,
+    "loan_info": LOAN_INFO_COLUMNS,
+}
+METADATA = "metadata.json"
+# balances and running totals, kept in float64 when the rest is stored as float32
+FULL_PRECISION = (
+    "pool_balance",
+    "current_loans_remaining",
+    "cumulative_principal_due",
+    "class_a_ending_principal_balance",
+    "class_b_ending_principal_balance",
+    "ra_end_balance",
+)
+
+
+@dataclass
+class ResultWriter:
+    """Columnar, full precision writer of waterfall results
+
+    Every result column is one (n_scenarios, maturity + 1) .npy file under
+    <directory>/<table>/<attribute>.npy, created at full size up front and
+    filled chunk by chunk through a memory map, so batches of any size can
+    be written without holding them in memory. metadata.json keeps the
+    (group, name) labels of the waterfall columns and the [start, stop) row
+    intervals written so far, the results are complete once they cover every
+    scenario.
+
+    directory: Path
+        where the result files are written
+    n_scenarios: int
+        total number of scenarios that will be written
+    maturity: int
+        shared maturity of the scenarios
+    dtype: str
+        storage type of the columns, "float32" halves the size of the results
+    full_precision: tuple[str, ...]
+        attributes stored as float64 whatever dtype is, e.g. FULL_PRECISION
+    """
+
+    directory: Path
+    n_scenarios: int
+    maturity: int
+    dtype: str = "float64"
+    full_precision: tuple[str, ...] = ()
+    arrays: dict[tuple[str, str], np.memmap] = field(init=False, repr=False)
+    # sorted, disjoint [start, stop) row intervals written so far
+    written: list[tuple[int, int]] = field(default_factory=list, init=False)
+    # the row after the last write, where the next write starts by default
+    next_row: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        self.directory = Path(self.directory)
+        shape = (self.n_scenarios, self.maturity + 1)
+        self.arrays = {}
+        for table, columns in RESULT_TABLES.items():
+            (self.directory / table).mkdir(parents=True, exist_ok=True)
+            for attribute in columns.values():
+                self.arrays[table, attribute] = open_memmap(
+                    self.directory / table / f"{attribute}.npy",
+                    mode="w+",
+                    dtype=(
+                        "float64" if attribute in self.full_precision else self.dtype
+                    ),
+                    shape=shape,
+                )
+        self._write_metadata(complete=False)
+
+    def write(self, lcf: LiabilitiesCashFlow, start: int | None = None) -> int:
+        """Writes the scenarios of a built waterfall, single or batch
+
+        Parameters
+        ----------
+        lcf : LiabilitiesCashFlow
+            a LiabilitiesCashFlow or LiabilitiesCashFlowBatch whose engine ran
+        start : int | None, optional
+            first scenario row written, right after the last write by default
+
+        Returns
+        -------
+        int
+            the row after the last one written
+        """
+        if not lcf.finish:
+            raise NotFinishedException(
+                "The WaterFall building process has not been completed"
+            )
+        start = self.next_row if start is None else start
+        owners = {"asset": lcf.asset_cf, "waterfall": lcf, "loan_info": lcf}
+        stop = start
+        for (table, attribute), array in self.arrays.items():
+            values = np.atleast_2d(getattr(owners[table], attribute))
+            stop = start + len(values)
+            if stop > self.n_scenarios or values.shape[-1] != array.shape[-1]:
+                raise ValueError(
+                    f"cannot write {values.shape} rows at {start} into {array.shape}"
+                )
+            array[start:stop] = values
+        self.written = _merge(self.written, (start, stop))
+        self.next_row = stop
+        return stop
+
+    @property
+    def complete(self) -> bool:
+        """every scenario row has been written"""
+        return self.written == [(0, self.n_scenarios)] or not self.n_scenarios
+
+    def close(self):
+        """Flushes every column and marks the results complete"""
+        for array in self.arrays.values():
+            array.flush()
+        self._write_metadata(complete=self.complete)
+
+    def __enter__(self) -> ResultWriter:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_metadata(self, complete: bool):
+        columns = [
+            {
+                "table": table,
+                "group": name[0] if isinstance(name, tuple) else None,
+                "name": name[1] if isinstance(name, tuple) else name,
+                "attribute": attribute,
+                "dtype": str(self.arrays[table, attribute].dtype),
+            }
+            for table, table_columns in RESULT_TABLES.items()
+            for name, attribute in table_columns.items()
+        ]
+        metadata = {
+            "n_scenarios": self.n_scenarios,
+            "maturity": self.maturity,
+            "dtype": self.dtype,
+            "written": [list(interval) for interval in self.written],
+            "complete": complete,
+            "columns": columns,
+        }
+        (self.directory / METADATA).write_text(json.dumps(metadata, indent=2))
+
+
+class ResultStore:
+    """Lazy reader of a ResultWriter directory
+
+    Columns are memory mapped on first access and never loaded as a whole, so
+    one tranche column can be pulled across a million scenarios while the
+    rest of the results stay on disk.
+    e.g.
+    store = ResultStore("results")
+    paid = store.column(("Class A Principal", "Principal Paid"))
+    paid[:, -12:].sum(axis=-1)
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        metadata = json.loads((self.directory / METADATA).read_text())
+        self.n_scenarios = metadata["n_scenarios"]
+        self.maturity = metadata["maturity"]
+        self.complete = metadata["complete"]
+        # [start, stop) row intervals holding results, the rest are zeros
+        self.written = [tuple(interval) for interval in metadata["written"]]
+        self.columns = metadata["columns"]
+        self._arrays = {}
+
+    def __len__(self) -> int:
+        return self.n_scenarios
+
+    def column(self, key: Hashable, table: str | None = None) -> np.ndarray:
+        """(n_scenarios, maturity + 1) read only memory map of one column
+
+        Parameters
+        ----------
+        key : Hashable
+            attribute name, DataFrame column name or (group, name) of a
+            waterfall column
+        table : str | None, optional
+            "asset", "waterfall" or "loan_info", needed when the key is in
+            more than one table such as available_funds
+        """
+        matches = [
+            column
+            for column in self.columns
+            if (table is None or column["table"] == table)
+            and key
+            in (column["attribute"], column["name"], (column["group"], column["name"]))
+        ]
+        if len(matches) != 1:
+            problem = "unknown" if not matches else "ambiguous, pass table for"
+            raise ValueError(f"{problem} result column {key!r}")
+        return self._array(matches[0]["table"], matches[0]["attribute"])
+
+    def frame(
+        self, table: str, scenarios: int | slice | np.ndarray = slice(None)
+    ) -> pd.DataFrame:
+        """Reads the scenarios of one table into a DataFrame
+
+        Returns
+        -------
+        pd.DataFrame
+            indexed by (scenario, t), waterfall columns keep their (group, name)
+        """
+        import pandas as pd
+
+        if table not in RESULT_TABLES:
+            raise ValueError(f"table must be one of {sorted(RESULT_TABLES)}")
+        rows = np.arange(self.n_scenarios)[scenarios]
+        rows = np.atleast_1d(rows)
+        names = list(RESULT_TABLES[table])
+        data = {
+            name: self._array(table, attribute)[rows].ravel()
+            for name, attribute in RESULT_TABLES[table].items()
+        }
+        index = pd.MultiIndex.from_product(
+            [rows, np.arange(self.maturity + 1)], names=["scenario", "t"]
+        )
+        frame = pd.DataFrame(data, index=index, columns=names)
+        if table == "waterfall":
+            frame.columns = pd.MultiIndex.from_tuples(names)
+        return frame
+
+    def _array(self, table: str, attribute: str) -> np.ndarray:
+        if (table, attribute) not in self._arrays:
+            self._arrays[table, attribute] = np.load(
+                self.directory / table / f"{attribute}.npy", mmap_mode="r"
+            )
+        return self._arrays[table, attribute]
+
+
+def _merge(
+    intervals: list[tuple[int, int]], interval: tuple[int, int]
+) -> list[tuple[int, int]]:
+    """sorted disjoint intervals covering intervals and interval"""
+    merged = []
+    for start, stop in sorted([*intervals, interval]):
+        if start == stop:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def write_results(directory: str | Path, lcf: LiabilitiesCashFlow) -> ResultStore:
+    """Writes one built waterfall, single or batch, and opens it for reading"""
+    n_scenarios = len(np.atleast_2d(lcf.class_a_principal_paid))
+    with ResultWriter(directory, n_scenarios, lcf.pool_info.maturity) as writer:
+        writer.write(lcf)
+    return ResultStore(directory)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch, ASSET_FIELDS, LIABILITY_FIELDS
+from waterfall.asset.asset import AssetCashFlow, AssetCashFlowBatch
+from waterfall.liabilities.spec import SpecCashFlow, WaterfallSpec
+from waterfall.analytics import METRICS, TRANCHES, spec_analytics
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Iterator, Mapping
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# absolute bump size of every numeric PoolInfo field in the default risk report,
+# all of ASSET_FIELDS and LIABILITY_FIELDS the spec waterfall depends on
+DEFAULT_BUMPS = {
+    "num_loans": 100,
+    "wac": 0.0025,
+    "wam": 1,
+    "cumulative_default_rate": 0.01,
+    "lgd": 0.05,
+    "init_balance_per_loan": 50,
+    "initial_recovery": 0.05,
+    "inflection_point": 1,
+    "loss_curve_timing": 1,
+    "loss_curve_steepness": 0.01,
+    "servicing_fee": 0.001,
+    "servicing_fee_short_fall_rate": 0.0025,
+    "class_a_interest": 0.0025,
+    "class_b_interest": 0.0025,
+    "class_a_principal_balance": 1_000_000,
+    "class_b_principal_balance": 1_000_000,
+    "eligible_investment_rate": 0.0025,
+    "target_reserve_percentage": 0.005,
+}
+
+
+@dataclass
+class SensitivityRunner:
+    """Bump and reprice runner of first and second order tranche sensitivities
+
+    Every field is bumped up and down by its bump size and the tranches are
+    repriced on the SpecCashFlow engine of WaterfallSpec.from_pool_info, which
+    amortizes the notes, the legacy LiabilitiesCashFlow never pays class A any
+    principal so none of its metrics move. Asset side bumps run through the
+    batched asset engine under the spec of the base deal, liability side bumps
+    compile the spec of each bumped deal and only rerun the waterfall on top
+    of one base asset build. Scenarios are evaluated in chunks of chunk_size
+    in a process pool.
+
+    base: PoolInfo
+        the deal being risked
+    bumps: Mapping[str, float]
+        PoolInfo field -> absolute bump size
+    chunk_size: int
+        number of bumped scenarios evaluated together in one batched build
+    max_workers: int | None
+        size of the process pool, 1 runs every chunk in this process
+    """
+
+    base: PoolInfo = field(default_factory=PoolInfo)
+    bumps: Mapping[str, float] = field(default_factory=lambda: dict(DEFAULT_BUMPS))
+    chunk_size: int = 64
+    max_workers: int | None = None
+    asset_bumps: list[str] = field(init=False)
+    liability_bumps: list[str] = field(init=False)
+
+    def __post_init__(self):
+        unknown = set(self.bumps) - set(ASSET_FIELDS) - set(LIABILITY_FIELDS)
+        if unknown or "maturity" in self.bumps:
+            raise ValueError(f"cannot bump PoolInfo fields {sorted(unknown)}")
+        if any(size <= 0 for size in self.bumps.values()):
+            raise ValueError("bump sizes must be positive")
+        self.asset_bumps = [name for name in self.bumps if name in ASSET_FIELDS]
+        self.liability_bumps = [name for name in self.bumps if name in LIABILITY_FIELDS]
+
+    def scenario_table(self, names: list[str]) -> dict[str, np.ndarray]:
+        """PoolInfo columns of the up and down bumps of names, in that order
+
+        Scenario 2 * i bumps names[i] up and scenario 2 * i + 1 bumps it down.
+        """
+        table = {
+            name: np.full(2 * len(names), float(getattr(self.base, name)))
+            for name in names
+        }
+        for i, name in enumerate(names):
+            table[name][2 * i] += self.bumps[name]
+            table[name][2 * i + 1] -= self.bumps[name]
+        return table
+
+    def tasks(self) -> Iterator[tuple]:
+        """(PoolInfoBatch, asset buffer, programs) chunks
+
+        Asset bump chunks have no buffer and the program of the base deal,
+        liability bump chunks the base asset buffer and one program per
+        scenario.
+        """
+        base_asset = AssetCashFlow(self.base)
+        base_asset.build_asset_arrays()
+        base_program = WaterfallSpec.from_pool_info(self.base).compile()
+        groups = (
+            (self.scenario_table(self.asset_bumps), None),
+            (self.scenario_table(self.liability_bumps), base_asset.buffer),
+        )
+        for table, buffer in groups:
+            n = len(next(iter(table.values()), ()))
+            for start in range(0, n, self.chunk_size):
+                chunk = {
+                    name: values[start : start + self.chunk_size]
+                    for name, values in table.items()
+                }
+                batch = PoolInfoBatch.from_table(chunk, self.base)
+                if buffer is None:
+                    yield batch, None, [base_program]
+                    continue
+                programs = [
+                    WaterfallSpec.from_pool_info(
+                        replace(self.base, **{k: v[i] for k, v in chunk.items()})
+                    ).compile()
+                    for i in range(batch.n_scenarios)
+                ]
+                yield batch, buffer, programs
+
+    def run(self) -> pd.DataFrame:
+        """Tidy sensitivity table
+
+        Returns
+        -------
+        pd.DataFrame
+            indexed by (field, tranche, metric) with the bump size, the base, up
+            and down values, the central difference delta and the gamma
+        """
+        import pandas as pd
+
+        base = _reprice_chunk(
+            (
+                PoolInfoBatch.from_pool_infos([self.base]),
+                None,
+                [WaterfallSpec.from_pool_info(self.base).compile()],
+            )
+        )[0]
+        if self.max_workers == 1:
+            chunks = list(map(_reprice_chunk, self.tasks()))
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                chunks = list(executor.map(_reprice_chunk, self.tasks()))
+        bumped = np.concatenate(chunks) if chunks else np.empty((0, len(base)))
+        names = self.asset_bumps + self.liability_bumps
+        up, down = bumped[0::2], bumped[1::2]
+        h = np.array([float(self.bumps[name]) for name in names])[:, None]
+        base = np.broadcast_to(base, up.shape)
+        index = pd.MultiIndex.from_product(
+            [names, list(TRANCHES), list(METRICS)], names=["field", "tranche", "metric"]
+        )
+        return pd.DataFrame(
+            {
+                "Bump": np.broadcast_to(h, up.shape).ravel(),
+                "Base": base.ravel(),
+                "Up": up.ravel(),
+                "Down": down.ravel(),
+                "Delta": ((up - down) / (2 * h)).ravel(),
+                "Gamma": ((up - 2 * base + down) / (h * h)).ravel(),
+            },
+            index=index,
+        )
+
+
+def sensitivity_report(
+    base: PoolInfo | None = None,
+    bumps: Mapping[str, float] | None = None,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """SensitivityRunner(base, bumps).run() with the default bumps when not given"""
+    runner = SensitivityRunner(
+        PoolInfo() if base is None else base,
+        dict(DEFAULT_BUMPS) if bumps is None else bumps,
+        max_workers=max_workers,
+    )
+    return runner.run()
+
+
+def _reprice_chunk(task: tuple) -> np.ndarray:
+    """Tranche metrics of every scenario, one row per scenario
+
+    With no asset buffer the batch is built and priced under its one program.
+    A given asset buffer is shared by every scenario instead of rebuilding the
+    asset side, which only liability side bumps may do, and each scenario runs
+    its own program over it.
+    """
+    batch, buffer, programs = task
+    if buffer is None:
+        acf = AssetCashFlowBatch(batch)
+        acf.build_asset_arrays()
+        engines = [SpecCashFlow(acf, programs[0])]
+    else:
+        # a read only one scenario view of the base build
+        first = PoolInfoBatch.from_pool_infos([batch.scenario(0)])
+        acf = AssetCashFlowBatch(first, buffer=buffer[:, None, :])
+        engines = [SpecCashFlow(acf, program) for program in programs]
+    rows = []
+    for cf in engines:
+        cf.build_waterfall_engine()
+        metrics = spec_analytics(cf)
+        rows.append(
+            np.column_stack(
+                [
+                    getattr(metrics[name], attribute)
+                    for name in TRANCHES
+                    for attribute in METRICS.values()
+                ]
+            )
+        )
+    return np.concatenate(rows)
@@ -0,0 +1,352 @@
+"""Local pricing service of single deals
+
+    python -m waterfall.service --port 8765
+
+Every request prices one PoolInfo. Requests arriving within window seconds of
+the first waiting one are coalesced into one batched asset and spec waterfall
+build per maturity and note terms, and every quote is kept in a least recently
+used cache keyed by the PoolInfo fields, so repeats are answered without a
+build. The process stays up with NumPy, pandas and the engines warm, clients
+only pay for a socket round trip. Undefined metrics are sent as null.
+
+The server speaks JSON lines over TCP, see waterfall.client.Client
+    {"id": 1, "pool_info": {"wac": 0.1}}
+    -> {"id": 1, "quote": {"metrics": {...}, "cached": false, "batch_size": 12}}
+    {"id": 2, "stats": true}
+    -> {"id": 2, "stats": {"queue_depth": 0, "latency_p50": 0.004, ...}}
+LocalClient answers the same calls in process, without the socket.
+"""
+
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch, LIABILITY_FIELDS
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.liabilities.spec import SpecCashFlow, WaterfallSpec
+from waterfall.analytics import METRICS, spec_analytics
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Sequence
+import argparse
+import asyncio
+import json
+import sys
+import time
+import numpy as np
+
+# latency percentiles reported by PricingService.stats
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class Quote:
+    """Tranche metrics of one deal
+
+    metrics: dict
+        tranche -> metric name of analytics.METRICS -> value, None where the
+        metric is undefined, e.g. the yield of a tranche that is never paid
+    cached: bool
+        answered from the result cache
+    batch_size: int
+        number of deals priced in the build that produced the quote, 0 when
+        it came from the cache
+    """
+
+    metrics: dict[str, dict[str, float | None]]
+    cached: bool = False
+    batch_size: int = 0
+
+
+def price_batch(pool_infos: Sequence[PoolInfo], backend: str | None = None) -> list:
+    """Tranche metrics of every deal on the WaterfallSpec.from_pool_info engine
+
+    Deals sharing a maturity and the liability fields of PoolInfo share one
+    spec and are built together.
+
+    Parameters
+    ----------
+    pool_infos : Sequence[PoolInfo]
+        deals to price
+    backend : str | None, optional
+        kept for the PricingService signature, the spec engine is NumPy only
+
+    Returns
+    -------
+    list
+        the metrics of every deal in the order given, see Quote.metrics
+    """
+    groups = {}
+    for i, pool_info in enumerate(pool_infos):
+        key = (pool_info.maturity, *(getattr(pool_info, f) for f in LIABILITY_FIELDS))
+        groups.setdefault(key, []).append(i)
+    metrics = [None] * len(pool_infos)
+    for rows in groups.values():
+        deals = [pool_infos[i] for i in rows]
+        acf = AssetCashFlowBatch(PoolInfoBatch.from_pool_infos(deals))
+        acf.build_asset_arrays()
+        cf = SpecCashFlow(acf, WaterfallSpec.from_pool_info(deals[0]).compile())
+        cf.build_waterfall_engine()
+        tranches = spec_analytics(cf, periods_per_year=12)
+        for k, i in enumerate(rows):
+            metrics[i] = {
+                tranche: {
+                    name: _finite(getattr(values, attribute)[k])
+                    for name, attribute in METRICS.items()
+                }
+                for tranche, values in tranches.items()
+            }
+    return metrics
+
+
+@dataclass
+class PricingService:
+    """Micro-batching asyncio pricer of single deals with a warm result cache
+
+    Use it as an async context manager, or call start and stop.
+    e.g.
+    async with PricingService() as service:
+        quote = await service.price(PoolInfo(wac=0.1))
+
+    window: float
+        seconds a batch keeps collecting requests after its first one
+    max_batch: int
+        most deals priced in one build
+    cache_size: int
+        quotes kept in the result cache, 0 disables it
+    latency_window: int
+        number of most recent request latencies the percentiles are taken over
+    backend: str | None
+        waterfall backend, kernel.default_backend() if None
+    """
+
+    window: float = 0.005
+    max_batch: int = 512
+    cache_size: int = 10_000
+    latency_window: int = 10_000
+    backend: str | None = None
+    requests: int = field(default=0, init=False)
+    cache_hits: int = field(default=0, init=False)
+    batches: int = field(default=0, init=False)
+    priced: int = field(default=0, init=False)
+    _cache: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _latencies: deque = field(init=False, repr=False)
+    # key -> futures of the requests waiting for that deal
+    _pending: dict = field(default_factory=dict, init=False, repr=False)
+    _queue: asyncio.Queue | None = field(default=None, init=False, repr=False)
+    _worker: asyncio.Task | None = field(default=None, init=False, repr=False)
+    _in_flight: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.window < 0 or self.max_batch < 1 or self.cache_size < 0:
+            raise ValueError("window, max_batch and cache_size must be positive")
+        self._latencies = deque(maxlen=self.latency_window)
+
+    async def start(self):
+        """Warms the engines with the default deal and starts batching"""
+        if self._worker is not None:
+            return
+        await asyncio.to_thread(price_batch, [PoolInfo()], self.backend)
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Prices what is already queued, then stops batching"""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def __aenter__(self) -> PricingService:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def price(self, pool_info: PoolInfo) -> Quote:
+        """Quote of one deal, from the cache or the next batch"""
+        if self._worker is None:
+            raise RuntimeError("the pricing service is not running, call start()")
+        start = time.perf_counter()
+        self.requests += 1
+        key = _key(pool_info)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            quote = Quote(self._cache[key], cached=True, batch_size=0)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if key in self._pending:
+                # the same deal is already waiting, share its build
+                self._pending[key].append(future)
+            else:
+                self._pending[key] = [future]
+                self._queue.put_nowait((key, pool_info))
+            quote = await future
+        self._latencies.append(time.perf_counter() - start)
+        return quote
+
+    def stats(self) -> dict[str, float | None]:
+        """Request counts, queue depth and latency percentiles in seconds
+
+        The percentiles are None before the first request.
+        """
+        latencies = np.array(self._latencies)
+        stats = {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "cache_size": len(self._cache),
+            "batches": self.batches,
+            "mean_batch_size": self.priced / self.batches if self.batches else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+        }
+        for q in PERCENTILES:
+            stats[f"latency_p{q}"] = (
+                float(np.percentile(latencies, q)) if len(latencies) else None
+            )
+        return stats
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._in_flight = len(batch)
+            try:
+                # the build runs in a thread so requests keep queueing meanwhile
+                metrics = await asyncio.to_thread(
+                    price_batch, [pool_info for _, pool_info in batch], self.backend
+                )
+            except Exception as error:
+                for key, _ in batch:
+                    for future in self._pending.pop(key):
+                        if not future.done():
+                            future.set_exception(error)
+            else:
+                self.batches += 1
+                self.priced += len(batch)
+                for (key, _), values in zip(batch, metrics):
+                    self._remember(key, values)
+                    for future in self._pending.pop(key):
+                        # a request cancelled while waiting has a done future
+                        if not future.done():
+                            future.set_result(Quote(values, batch_size=len(batch)))
+            finally:
+                self._in_flight = 0
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _remember(self, key: tuple, metrics: dict):
+        if not self.cache_size:
+            return
+        self._cache[key] = metrics
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+class LocalClient:
+    """In process stand-in of waterfall.client.Client
+
+    Takes and returns the same JSON ready dicts as the socket client, so code
+    written against one runs against the other.
+    """
+
+    def __init__(self, service: PricingService):
+        self.service = service
+
+    async def price(self, **overrides) -> dict[str, Any]:
+        return asdict(await self.service.price(PoolInfo(**overrides)))
+
+    async def price_many(self, deals: Sequence[dict]) -> list[dict[str, Any]]:
+        return list(await asyncio.gather(*(self.price(**deal) for deal in deals)))
+
+    async def stats(self) -> dict[str, float | None]:
+        return self.service.stats()
+
+
+async def serve(
+    service: PricingService, host: str = "127.0.0.1", port: int = 8765
+) -> asyncio.Server:
+    """Starts the service and a JSON lines server in front of it"""
+    await service.start()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(_answer(service, line, writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def _answer(service: PricingService, line: bytes, writer: asyncio.StreamWriter):
+    request = {}
+    try:
+        request = json.loads(line)
+        if request.get("stats"):
+            response = {"stats": service.stats()}
+        else:
+            pool_info = PoolInfo(**request.get("pool_info", {}))
+            response = {"quote": asdict(await service.price(pool_info))}
+    except Exception as error:
+        response = {"error": f"{type(error).__name__}: {error}"}
+    response["id"] = request.get("id") if isinstance(request, dict) else None
+    # NaN is not JSON, metrics and stats report undefined values as None
+    writer.write(json.dumps(response, allow_nan=False).encode() + b"\n")
+    await writer.drain()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m waterfall.service", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--window", type=float, default=0.005, help="seconds")
+    parser.add_argument("--max-batch", type=int, default=512)
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    async def run():
+        service = PricingService(args.window, args.max_batch, args.cache_size)
+        server = await serve(service, args.host, args.port)
+        print(f"pricing on {args.host}:{args.port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _finite(value: float) -> float | None:
+    """value as a float, None when it is NaN or infinite"""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _key(pool_info: PoolInfo) -> tuple:
+    """the PoolInfo init fields, which determine the quote"""
+    return tuple(getattr(pool_info, f.name) for f in fields(PoolInfo) if f.init)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
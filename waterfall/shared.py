@@ -0,0 +1,318 @@
+"""Shared memory results of multi-process scenario runs
+
+The parent process allocates one (n_scenarios, maturity + 1, n_columns) block
+per table in shared memory, workers attach to it by name and copy every
+finished chunk into its rows in place, so only the row range of a chunk
+crosses the process boundary instead of pickled DataFrames.
+e.g.
+with run_shared(table, max_workers=8) as store:
+    paid = store.column(("Class A Principal", "Principal Paid"))
+"""
+
+from __future__ import annotations
+from waterfall.input import PoolInfo
+from waterfall.asset.asset import ASSET_COLUMNS
+from waterfall.liabilities.liabilities import (
+    LiabilitiesCashFlow,
+    NotFinishedException,
+    LIABILITY_ARRAYS,
+)
+from waterfall.chunked import ChunkedRunner, _columns
+from waterfall.results import RESULT_TABLES, ResultStore
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields
+from multiprocessing.shared_memory import SharedMemory
+from typing import Mapping
+from numpy.typing import ArrayLike
+import weakref
+import numpy as np
+
+# shared block -> state buffer rows stored as its columns, the waterfall block
+# holds the loan info rows after the waterfall ones
+BLOCKS = {
+    "asset": tuple(ASSET_COLUMNS.values()),
+    "waterfall": LIABILITY_ARRAYS,
+}
+# result table of RESULT_TABLES -> shared block holding it
+TABLE_BLOCKS = {"asset": "asset", "waterfall": "waterfall", "loan_info": "waterfall"}
+
+
+class SharedResultStore(ResultStore):
+    """Results of a single maturity run in shared memory blocks
+
+    Reads like a ResultStore, column and frame work the same, but the
+    columns live in one (n_scenarios, maturity + 1, n_columns) block per
+    table of BLOCKS, so every scenario is one contiguous slab. The process
+    that creates the store owns the blocks and unlinks them on close, at
+    exit, or through the multiprocessing resource tracker if it dies without
+    either. Worker processes attach with SharedResultStore.attach(store.spec)
+    and only ever close.
+    e.g.
+    with SharedResultStore(n_scenarios, 360) as store:
+        ...
+
+    n_scenarios: int
+        number of scenarios the blocks hold
+    maturity: int
+        shared maturity of the scenarios
+    """
+
+    def __init__(self, n_scenarios: int, maturity: int):
+        if n_scenarios < 1:
+            raise ValueError("a shared store needs at least one scenario")
+        segments = {
+            block: SharedMemory(
+                create=True,
+                size=n_scenarios
+                * (maturity + 1)
+                * len(rows)
+                * np.dtype(float).itemsize,
+            )
+            for block, rows in BLOCKS.items()
+        }
+        self._open(n_scenarios, maturity, segments, owner=True)
+
+    @classmethod
+    def attach(cls, spec: dict) -> SharedResultStore:
+        """Opens the blocks of a store created by another process"""
+        store = cls.__new__(cls)
+        segments = {block: _attach(name) for block, name in spec["blocks"].items()}
+        store._open(spec["n_scenarios"], spec["maturity"], segments, owner=False)
+        return store
+
+    def _open(
+        self,
+        n_scenarios: int,
+        maturity: int,
+        segments: dict[str, SharedMemory],
+        owner: bool,
+    ):
+        self.n_scenarios = n_scenarios
+        self.maturity = maturity
+        self.complete = False
+        self.owner = owner
+        self.columns = [
+            {
+                "table": table,
+                "group": name[0] if isinstance(name, tuple) else None,
+                "name": name[1] if isinstance(name, tuple) else name,
+                "attribute": attribute,
+            }
+            for table, table_columns in RESULT_TABLES.items()
+            for name, attribute in table_columns.items()
+        ]
+        self._segments = segments
+        self.blocks = {
+            block: np.ndarray(
+                (n_scenarios, maturity + 1, len(BLOCKS[block])),
+                dtype=float,
+                buffer=segment.buf,
+            )
+            for block, segment in segments.items()
+        }
+        # the owner unlinks the blocks even if close is never called
+        self._finalizer = weakref.finalize(
+            self, _release, list(segments.values()), owner
+        )
+
+    @property
+    def spec(self) -> dict:
+        """Small picklable description workers attach with"""
+        return {
+            "n_scenarios": self.n_scenarios,
+            "maturity": self.maturity,
+            "blocks": {
+                block: segment.name for block, segment in self._segments.items()
+            },
+        }
+
+    def write(self, lcf: LiabilitiesCashFlow, rows: int | np.ndarray):
+        """Copies the scenarios of a built waterfall, single or batch, into rows
+
+        Parameters
+        ----------
+        lcf : LiabilitiesCashFlow
+            a LiabilitiesCashFlow or LiabilitiesCashFlowBatch whose engine ran
+        rows : int | np.ndarray
+            first row written, or the row of every scenario of lcf
+        """
+        if not lcf.finish:
+            raise NotFinishedException(
+                "The WaterFall building process has not been completed"
+            )
+        for block, buffer in (
+            ("asset", lcf.asset_cf.buffer),
+            ("waterfall", lcf.buffer),
+        ):
+            # (n_columns, n, maturity + 1) rows of the state buffer, single
+            # deals have no scenario axis
+            values = buffer[: len(BLOCKS[block])]
+            values = values.reshape(len(values), -1, values.shape[-1])
+            if np.ndim(rows) == 0:
+                rows = slice(rows, rows + values.shape[1])
+            target = self.blocks[block][rows]
+            if target.shape[:2] != values.shape[1:]:
+                raise ValueError(
+                    f"cannot write {values.shape[1:]} scenarios into "
+                    f"{target.shape[:2]} rows of the shared store"
+                )
+            self.blocks[block][rows] = np.moveaxis(values, 0, -1)
+
+    def close(self):
+        """Releases the blocks, and unlinks them in the process that owns them
+
+        Arrays taken from the store must not be used afterwards.
+        """
+        self.blocks = {}
+        self._finalizer()
+
+    def __enter__(self) -> SharedResultStore:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _array(self, table: str, attribute: str) -> np.ndarray:
+        block = TABLE_BLOCKS[table]
+        return self.blocks[block][..., BLOCKS[block].index(attribute)]
+
+
+@dataclass
+class SharedSink:
+    """ChunkedRunner sink copying every chunk into a SharedResultStore
+
+    store: SharedResultStore
+        the attached store
+    offset: int
+        store row of the first row of the table being run
+    """
+
+    store: SharedResultStore
+    offset: int = 0
+
+    def __call__(self, lcf, rows: np.ndarray):
+        self.store.write(lcf, rows + self.offset)
+
+
+def run_shared(
+    table: Mapping[str, ArrayLike],
+    base: PoolInfo | None = None,
+    chunk_size: int = 5_000,
+    max_workers: int | None = None,
+    memory_budget: int = 1 << 28,
+    backend: str | None = None,
+) -> SharedResultStore:
+    """Runs a single maturity scenario table across processes into shared memory
+
+    Every worker attaches to the store once, runs its chunks of the table
+    with a ChunkedRunner and copies them into their rows, and only returns
+    the row range it wrote. If a worker fails or dies the blocks are unlinked
+    before the error is raised.
+
+    Parameters
+    ----------
+    table : Mapping[str, ArrayLike]
+        PoolInfo field name -> one value per scenario, a DataFrame works too
+    base : PoolInfo | None, optional
+        supplies every field missing from the table, by default PoolInfo()
+    chunk_size : int, optional
+        scenarios per task sent to a worker
+    max_workers : int | None, optional
+        size of the process pool, 1 runs every chunk in this process
+    memory_budget : int, optional
+        bytes the engines of one worker may use, see ChunkedRunner
+    backend : str | None, optional
+        waterfall backend, kernel.default_backend() if None
+
+    Returns
+    -------
+    SharedResultStore
+        the results, owned by the caller who closes it
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    base = PoolInfo() if base is None else base
+    table = _columns(table)
+    unknown = set(table) - {f.name for f in fields(PoolInfo) if f.init}
+    if unknown:
+        raise ValueError(f"unknown PoolInfo fields {sorted(unknown)}")
+    n_scenarios = len(next(iter(table.values()))) if table else 1
+    maturities = np.unique(table.get("maturity", base.maturity))
+    if len(maturities) != 1:
+        raise ValueError(
+            f"a shared store needs exactly one maturity, got {maturities.tolist()}"
+        )
+    store = SharedResultStore(n_scenarios, int(maturities[0]))
+    tasks = [
+        (
+            {
+                name: column[start : start + chunk_size]
+                for name, column in table.items()
+            },
+            base,
+            start,
+            memory_budget,
+            backend,
+        )
+        for start in range(0, n_scenarios, chunk_size)
+    ]
+    done = 0
+    try:
+        if max_workers == 1:
+            runner = ChunkedRunner(base, memory_budget, backend)
+            done = runner.run(table, [SharedSink(store)])
+        else:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_attach_worker,
+                initargs=(store.spec,),
+            ) as executor:
+                futures = [executor.submit(_run_chunk, task) for task in tasks]
+                for future in as_completed(futures):
+                    done += future.result()
+    except BaseException:
+        store.close()
+        raise
+    store.complete = done == n_scenarios
+    return store
+
+
+# the store a worker process attached to, see run_shared
+_store: SharedResultStore | None = None
+
+
+def _attach_worker(spec: dict):
+    global _store
+    _store = SharedResultStore.attach(spec)
+
+
+def _run_chunk(task: tuple) -> int:
+    table, base, start, memory_budget, backend = task
+    runner = ChunkedRunner(base, memory_budget, backend)
+    return runner.run(table, [SharedSink(_store, start)])
+
+
+def _attach(name: str) -> SharedMemory:
+    try:
+        # python >= 3.13, the owner alone tracks the block
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # earlier versions register it again with the resource tracker the
+        # workers share with their parent, which is harmless, unregistering it
+        # here would drop the parent's registration too
+        return SharedMemory(name=name)
+
+
+def _release(segments: list[SharedMemory], owner: bool):
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # arrays still viewing the block keep the mapping alive until
+            # they are collected, the block can still be unlinked
+            pass
+        if owner:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
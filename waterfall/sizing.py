@@ -0,0 +1,200 @@
+from __future__ import annotations
+from waterfall.input import PoolInfo, PoolInfoBatch
+from waterfall.asset.asset import AssetCashFlowBatch
+from waterfall.asset.cache import AssetCache
+from waterfall.liabilities.spec import SpecCashFlow, WaterfallSpec
+from dataclasses import dataclass, field, replace
+from typing import Callable, Sequence
+import numpy as np
+
+# a constraint maps a built spec waterfall batch to a pass / fail flag per scenario
+Constraint = Callable[[SpecCashFlow], np.ndarray]
+
+# short names of the tranches of WaterfallSpec.from_pool_info
+TRANCHE_NAMES = {"class_a": "Class A", "class_b": "Class B"}
+
+
+def max_tranche_loss(tranche: str, limit: float = 0.0) -> Constraint:
+    """Principal loss of tranche, as a fraction of par, at most limit"""
+    name = TRANCHE_NAMES.get(tranche, tranche)
+
+    def constraint(cf: SpecCashFlow) -> np.ndarray:
+        ending = cf.tranche_array(name, "ending_balance")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            loss = np.where(ending[:, 0] > 0, ending[:, -1] / ending[:, 0], 0.0)
+        return loss <= limit
+
+    return constraint
+
+
+def min_overcollateralization(ratio: float, tranche: str = "class_a") -> Constraint:
+    """Pool balance at least ratio times the tranche balance while it is outstanding"""
+    name = TRANCHE_NAMES.get(tranche, tranche)
+
+    def constraint(cf: SpecCashFlow) -> np.ndarray:
+        notes = cf.tranche_array(name, "ending_balance")
+        covered = np.atleast_2d(cf.asset_cf.pool_balance) >= ratio * notes
+        return (covered | (notes <= 0)).all(axis=-1)
+
+    return constraint
+
+
+@dataclass
+class SizingResult:
+    """Largest tranche balance that meets the constraint in every scenario
+
+    balance: float
+        the tranche balance found, within the solver tolerance
+    advance_rate: float
+        balance as a fraction of the initial pool balance of the first scenario
+    feasible: bool
+        False when even the lower bound breaks the constraint
+    evaluations: int
+        number of liabilities engine runs
+    """
+
+    balance: float
+    advance_rate: float
+    feasible: bool
+    evaluations: int
+
+
+@dataclass
+class TrancheSizer:
+    """Bisection solver for the largest tranche meeting a constraint under stress
+
+    The asset side of every stress scenario is built once through an AssetCache
+    and stacked into one AssetCashFlowBatch per maturity. Each iteration only
+    reruns the SpecCashFlow engine of the spec with the candidate balance. The
+    spec engine amortizes the notes, unlike LiabilitiesCashFlow whose class A
+    is never paid principal, so its losses depend on the balance sized.
+
+    Feasibility must shrink as the tranche grows, which holds for loss and
+    coverage constraints on a sequential structure.
+
+    scenarios: Sequence[PoolInfo]
+        stress scenarios of the asset side
+    constraint: Constraint
+        e.g. max_tranche_loss("class_a")
+    tranche: str
+        tranche of the spec sized, "class_a" and "class_b" name the tranches of
+        WaterfallSpec.from_pool_info
+    tolerance: float
+        width of the final bracket in currency units
+    max_iterations: int
+        most bisection steps
+    cache: AssetCache | None
+        shared asset cache, a private one if None
+    spec: WaterfallSpec | None
+        priority of payments, WaterfallSpec.from_pool_info of the first
+        scenario if None, the other tranches keep their balance
+    """
+
+    scenarios: Sequence[PoolInfo]
+    constraint: Constraint
+    tranche: str = "class_a"
+    tolerance: float = 1_000.0
+    max_iterations: int = 100
+    cache: AssetCache | None = None
+    spec: WaterfallSpec | None = None
+    evaluations: int = field(default=0, init=False)
+    _engines: list[SpecCashFlow] = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.spec is None:
+            self.spec = WaterfallSpec.from_pool_info(self.scenarios[0])
+        program = self.spec.compile()
+        name = TRANCHE_NAMES.get(self.tranche, self.tranche)
+        if name not in program.tranche_names:
+            raise ValueError(
+                f"tranche must be one of {sorted(TRANCHE_NAMES)} or "
+                f"{list(program.tranche_names)}, got {self.tranche!r}"
+            )
+        self._index = program.tranche_names.index(name)
+        if self.cache is None:
+            self.cache = AssetCache()
+        for maturity in sorted({scenario.maturity for scenario in self.scenarios}):
+            group = [s for s in self.scenarios if s.maturity == maturity]
+            buffers = [self.cache.get(scenario).buffer for scenario in group]
+            acf = AssetCashFlowBatch(
+                PoolInfoBatch.from_pool_infos(group), buffer=np.stack(buffers, axis=1)
+            )
+            self._engines.append(SpecCashFlow(acf, program))
+
+    def feasible(self, balance: float) -> bool:
+        """True when every scenario meets the constraint at this tranche balance"""
+        for cf in self._engines:
+            balances = cf.program.balances.copy()
+            balances[self._index] = balance
+            cf.program = replace(cf.program, balances=balances)
+            cf.build_waterfall_engine()
+            self.evaluations += 1
+            if not self.constraint(cf).all():
+                return False
+        return True
+
+    def solve(self, lower: float = 0.0, upper: float | None = None) -> SizingResult:
+        """Bisects [lower, upper] down to the solver tolerance
+
+        upper defaults to the initial pool balance of the first scenario.
+        """
+        pool_balance = self.scenarios[0].init_pool_balance
+        upper = pool_balance if upper is None else upper
+        if self.feasible(upper):
+            return SizingResult(upper, upper / pool_balance, True, self.evaluations)
+        if not self.feasible(lower):
+            return SizingResult(lower, lower / pool_balance, False, self.evaluations)
+        for _ in range(self.max_iterations):
+            if upper - lower <= self.tolerance:
+                break
+            middle = 0.5 * (lower + upper)
+            if self.feasible(middle):
+                lower = middle
+            else:
+                upper = middle
+        return SizingResult(lower, lower / pool_balance, True, self.evaluations)
+
+
+def size_tranche(
+    scenarios: PoolInfo | Sequence[PoolInfo],
+    constraint: Constraint,
+    tranche: str = "class_a",
+    lower: float = 0.0,
+    upper: float | None = None,
+    tolerance: float = 1_000.0,
+    cache: AssetCache | None = None,
+    spec: WaterfallSpec | None = None,
+) -> SizingResult:
+    """Largest tranche balance meeting constraint under every stress scenario
+
+    Parameters
+    ----------
+    scenarios : PoolInfo | Sequence[PoolInfo]
+        base deal or stress scenarios, the other tranches keep their balance
+    constraint : Constraint
+        e.g. max_tranche_loss("class_a") or min_overcollateralization(1.1)
+    tranche : str, optional
+        "class_a", "class_b" or the name of a tranche of spec
+    lower : float, optional
+        balance known or assumed to be feasible
+    upper : float | None, optional
+        balance known or assumed to be infeasible, the pool balance by default
+    tolerance : float, optional
+        width of the final bracket in currency units
+    cache : AssetCache | None, optional
+        shared asset cache, so repeated sizings of one deal skip the asset build
+    spec : WaterfallSpec | None, optional
+        priority of payments, WaterfallSpec.from_pool_info of the first
+        scenario by default
+
+    Returns
+    -------
+    SizingResult
+        the balance and advance rate found
+    """
+    if isinstance(scenarios, PoolInfo):
+        scenarios = [scenarios]
+    sizer = TrancheSizer(
+        scenarios, constraint, tranche, tolerance, cache=cache, spec=spec
+    )
+    return sizer.solve(lower, upper)